@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class DjgConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'djg'
+
+    def ready(self):
+        # Conversion backends are imported lazily; warm the ones for hot formats
+        from .backends import backends
+        backends.preload(settings.CONVERTER_PRELOAD_FORMATS)
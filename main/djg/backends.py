@@ -0,0 +1,90 @@
+"""
+Lazily imported conversion backends.
+
+The converter depends on several heavy libraries (pandas, reportlab,
+openpyxl, python-docx, PyPDF2, OpenCV) but a single request only ever needs
+one or two of them. Modules import them through this registry so they are
+loaded on first use instead of at worker boot, and the registry records how
+long each import took.
+"""
+import importlib
+import threading
+import time
+
+
+# Backends each file format needs, used to preload hot formats at startup
+FORMAT_BACKENDS = {
+    'pdf': ['PyPDF2', 'reportlab.platypus', 'reportlab.lib.styles'],
+    'csv': ['pandas'],
+    'excel': ['pandas', 'pandas.io.parsers', 'openpyxl'],
+    'word': ['docx'],
+    'txt': [],
+    'image': ['cv2', 'numpy'],
+}
+
+
+class BackendRegistry:
+    """Imports backend modules on demand and times each import"""
+
+    def __init__(self):
+        self._modules = {}
+        self.import_times = {}
+        self._lock = threading.Lock()
+
+    def load(self, name):
+        """Import and return a backend module, timing the first import"""
+        module = self._modules.get(name)
+        if module is not None:
+            return module
+        with self._lock:
+            if name not in self._modules:
+                start = time.perf_counter()
+                self._modules[name] = importlib.import_module(name)
+                self.import_times[name] = time.perf_counter() - start
+            return self._modules[name]
+
+    def lazy(self, name):
+        """Return a stand-in for a module that imports it on first attribute access"""
+        return LazyModule(self, name)
+
+    def lazy_attr(self, name, attr):
+        """Return a stand-in for a callable that imports its module on first call"""
+        return LazyCallable(self, name, attr)
+
+    def preload(self, formats):
+        """Import the backends needed by the given formats right away"""
+        for format_name in formats:
+            for name in FORMAT_BACKENDS.get(format_name, []):
+                self.load(name)
+
+    def loaded(self):
+        return sorted(self._modules)
+
+
+class LazyModule:
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._registry.load(self._name), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
+class LazyCallable:
+    def __init__(self, registry, name, attr):
+        self._registry = registry
+        self._name = name
+        self._attr = attr
+
+    def __call__(self, *args, **kwargs):
+        return getattr(self._registry.load(self._name), self._attr)(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<lazy {self._name}.{self._attr}>"
+
+
+# Shared registry for the whole process
+backends = BackendRegistry()
@@ -0,0 +1,169 @@
+"""
+Batch passport sheets.
+
+Every uploaded photo is decoded, cropped and resized on a worker pool, the
+photos are laid out on sheets (one sheet per photo, or filled one after
+another onto shared sheets), each sheet is composed and JPEG encoded on the
+pool as well, and the sheets are streamed back as a zip while later ones
+are still rendering.
+
+PASSPORT_BATCH_EXECUTOR chooses a process pool or a thread pool. OpenCV
+releases the GIL while it decodes, resizes and encodes, so threads avoid
+pickling images between processes at the cost of the Python parts of the
+work running one thread at a time.
+"""
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+
+from django.conf import settings
+
+from . import passport
+from .backends import backends
+
+
+cv2 = backends.lazy('cv2')
+
+
+EXECUTORS = ('process', 'thread')
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+
+
+class BatchError(Exception):
+    """A batch upload that can't be processed"""
+
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    # One OpenCV thread per worker process, the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+
+def get_executor(kind=None):
+    """The shared worker pool of the given kind (default PASSPORT_BATCH_EXECUTOR)"""
+    kind = kind or settings.PASSPORT_BATCH_EXECUTOR
+    if kind not in EXECUTORS:
+        raise ValueError(f"Unknown PASSPORT_BATCH_EXECUTOR {kind!r}, expected one of {EXECUTORS}")
+    with _executor_lock:
+        if kind not in _executors:
+            workers = settings.PASSPORT_BATCH_WORKERS
+            if kind == 'process':
+                # Started from the forkserver: forking a threaded web worker can
+                # leave the child waiting on a lock another thread held
+                _executors[kind] = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=_init_worker,
+                )
+            else:
+                _executors[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='passport-batch')
+        return _executors[kind]
+
+
+def _is_image_name(name):
+    return os.path.splitext(name.lower())[1] in IMAGE_EXTENSIONS
+
+
+def read_uploads(files):
+    """
+    Return (name, bytes) for every photo in the uploaded files, expanding
+    zip archives into the images they contain.
+
+    Raises BatchError for a damaged zip, an oversized zip member, more
+    than PASSPORT_BATCH_MAX_PHOTOS photos or more than
+    PASSPORT_BATCH_MAX_BYTES of photos in total once unzipped.
+    """
+    max_photos = settings.PASSPORT_BATCH_MAX_PHOTOS
+    max_bytes = settings.PASSPORT_BATCH_MAX_BYTES
+    uploads = []
+    total_bytes = 0
+    for file in files:
+        if zipfile.is_zipfile(file):
+            file.seek(0)
+            try:
+                with zipfile.ZipFile(file) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir() or not _is_image_name(info.filename):
+                            continue
+                        if info.file_size > settings.MAX_UPLOAD_SIZE:
+                            raise BatchError(f"{info.filename} is too large.")
+                        if len(uploads) >= max_photos:
+                            raise BatchError(f"At most {max_photos} photos per batch.")
+                        # Checked before inflating; zipfile won't read a
+                        # member past its declared size
+                        total_bytes += info.file_size
+                        if total_bytes > max_bytes:
+                            raise BatchError(f"At most {max_bytes // (1024 * 1024)}MB of photos per batch.")
+                        uploads.append((os.path.basename(info.filename), archive.read(info)))
+            except zipfile.BadZipFile:
+                raise BatchError(f"{file.name} is not a valid zip file.")
+        else:
+            file.seek(0)
+            if len(uploads) >= max_photos:
+                raise BatchError(f"At most {max_photos} photos per batch.")
+            total_bytes += file.size
+            if total_bytes > max_bytes:
+                raise BatchError(f"At most {max_bytes // (1024 * 1024)}MB of photos per batch.")
+            uploads.append((file.name, file.read()))
+    return uploads
+
+
+def plan_sheets(photo_count, copies, slots, mixed=False):
+    """
+    Assign photos to sheets. Returns a list of sheets, each a list of
+    (photo index, copies) filled into consecutive slots.
+
+    Without mixed every photo gets its own sheet; with mixed the copies of
+    each photo follow the previous photo's and spill onto a new sheet when
+    one is full.
+    """
+    if not mixed:
+        return [[(index, min(copies, slots))] for index in range(photo_count)]
+    sheets = [[]]
+    free = slots
+    for index in range(photo_count):
+        remaining = copies
+        while remaining:
+            if not free:
+                sheets.append([])
+                free = slots
+            count = min(remaining, free)
+            sheets[-1].append((index, count))
+            remaining -= count
+            free -= count
+    return sheets if sheets[0] else []
+
+
+def _sheet_name(index, names, placements, mixed):
+    if mixed:
+        return f"sheet_{index + 1:03d}.jpg"
+    stem = os.path.splitext(os.path.basename(names[placements[0][0]]))[0]
+    return f"{index + 1:03d}_{stem}.jpg"
+
+
+def render_batch(uploads, layout, copies, mixed=False, executor=None):
+    """
+    Render the uploads onto sheets.
+
+    Returns (sheets, skipped): sheets is an iterator of (file name, JPEG
+    bytes) that yields each sheet as soon as it and the ones before it are
+    done; skipped lists the names of uploads that aren't images.
+    """
+    executor = executor or get_executor()
+    names = [name for name, _ in uploads]
+    prepared = list(executor.map(passport.prepare_photo, (data for _, data in uploads), repeat(layout.photo_size)))
+
+    skipped = [name for name, photo in zip(names, prepared) if photo is None]
+    valid = [index for index, photo in enumerate(prepared) if photo is not None]
+    plan = plan_sheets(len(valid), copies, len(layout.slots), mixed)
+    placements = [[(prepared[valid[index]], count) for index, count in sheet] for sheet in plan]
+    valid_names = [names[index] for index in valid]
+    file_names = [_sheet_name(i, valid_names, sheet, mixed) for i, sheet in enumerate(plan)]
+
+    rendered = executor.map(passport.render_sheet, placements, repeat(layout))
+    return zip(file_names, rendered), skipped
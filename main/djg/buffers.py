@@ -0,0 +1,58 @@
+"""
+Conversion sources and targets that are either paths or buffers.
+
+Small uploads are converted entirely in memory (see
+CONVERTER_IN_MEMORY_MAX_BYTES): the converters then read from and write to
+binary file-like objects such as BytesIO instead of paths. pandas, openpyxl,
+python-docx and reportlab accept either; these helpers cover the places
+that open files themselves.
+"""
+import io
+import os
+from contextlib import contextmanager
+
+
+class SourceBuffer(io.BytesIO):
+    """A small upload's bytes together with their content hash, for caches keyed on it"""
+
+    def __init__(self, data, content_hash=None):
+        super().__init__(data)
+        self.content_hash = content_hash
+
+
+class SourcePath(str):
+    """A spooled upload's path together with its content hash, so it isn't hashed again"""
+
+    def __new__(cls, path, content_hash=None):
+        source = super().__new__(cls, path)
+        source.content_hash = content_hash
+        return source
+
+
+def is_path(target):
+    return isinstance(target, (str, os.PathLike))
+
+
+def rewind(source):
+    """Seek a buffer back to its start so it can be read again; paths pass through"""
+    if not is_path(source) and hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+@contextmanager
+def open_text(target, mode='r', newline=None):
+    """open(target, mode, encoding='utf-8') for a path or a binary buffer"""
+    if is_path(target):
+        with open(target, mode, encoding='utf-8', newline=newline) as f:
+            yield f
+        return
+    if 'r' in mode:
+        rewind(target)
+    wrapper = io.TextIOWrapper(target, encoding='utf-8', newline=newline)
+    try:
+        yield wrapper
+    finally:
+        wrapper.flush()
+        # Leave the buffer open for whoever reads the result
+        wrapper.detach()
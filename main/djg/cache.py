@@ -0,0 +1,177 @@
+"""
+Content-addressed cache of conversion results.
+
+Entries are files under CONVERTER_CACHE_DIR named after the upload's
+SHA-256 digest, the source/target format pair and any reader options. An
+entry's mtime is bumped on every hit, and the least recently used entries
+are evicted once the directory grows past CONVERTER_CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+from django.conf import settings
+
+
+def new_hasher():
+    """Return the hash object used for cache keys"""
+    return hashlib.sha256()
+
+
+class ConversionCache:
+    """Disk-backed LRU cache of converted files"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def root(self):
+        return settings.CONVERTER_CACHE_DIR
+
+    @property
+    def max_bytes(self):
+        return settings.CONVERTER_CACHE_MAX_BYTES
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(content_hash, source_format, target_format, options=None):
+        key = f"{content_hash}-{source_format}-{target_format}"
+        if options:
+            # Reader options, such as the Excel sheet, change the output
+            hasher = new_hasher()
+            hasher.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+            key += f"-{hasher.hexdigest()[:16]}"
+        return key
+
+    def _entry_path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """Return the cached file path for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._entry_path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def open(self, key):
+        """
+        Open the cached file for key for binary reading, or return None on a
+        miss. The open file stays readable if the entry is evicted meanwhile,
+        unlike a path from get(), so prefer it when the entry is read later on.
+        """
+        if not self.enabled:
+            return None
+        try:
+            file = open(self._entry_path(key), 'rb')
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(file.fileno())
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return file
+
+    def put(self, key, file_path):
+        """Store a copy of file_path under key and return the cached path"""
+        if not self.enabled:
+            return None
+        os.makedirs(self.root, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        link_or_copy(file_path, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def put_bytes(self, key, data):
+        """Store data under key and return the cached path"""
+        if not self.enabled:
+            return None
+        os.makedirs(self.root, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits its budget"""
+        entries = []
+        total = 0
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        entries = 0
+        size = 0
+        if os.path.isdir(self.root):
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if not entry.name.endswith('.tmp'):
+                        entries += 1
+                        size += entry.stat().st_size
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+        }
+
+
+def link_or_copy(source, destination):
+    """Hard-link source to destination, copying when linking is not possible"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+# Shared per-process cache; counters are per process
+conversion_cache = ConversionCache()
@@ -0,0 +1,248 @@
+"""
+Streamed downloads of converted files.
+
+Files are sent in blocks straight from disk instead of being read into
+memory, single byte ranges are answered with 206 Partial Content, and
+temporary files are removed when the response is closed, after the last
+byte has been sent. With CONVERTER_DOWNLOAD_MODE set to 'x-accel-redirect'
+or 'x-sendfile', files that outlive the request are handed to the fronting
+proxy to send instead. Several outputs are sent as a zip written on the
+fly, see serve_zip.
+"""
+import os
+import re
+import time
+import zipfile
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+
+DOWNLOAD_MODES = ('stream', 'x-accel-redirect', 'x-sendfile')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class _FileRange:
+    """Read-only view of `length` bytes of a file, starting at `start`"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class ConvertedFileResponse(FileResponse):
+    """FileResponse that removes `cleanup` paths once it has been sent"""
+
+    block_size = 64 * 1024
+
+    def __init__(self, *args, cleanup=(), **kwargs):
+        self.cleanup = list(cleanup)
+        super().__init__(*args, **kwargs)
+
+    def close(self):
+        # Close the file before removing it, for platforms that can't
+        # delete open files
+        if getattr(self, 'file_to_stream', None) is not None:
+            self.file_to_stream.close()
+        _remove_files(self.cleanup)
+        super().close()
+
+
+class _ZipStream:
+    """Write-only file object that hands back what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries, compression=zipfile.ZIP_STORED, block_size=ConvertedFileResponse.block_size):
+    """
+    Yield a zip archive of (name, content) entries chunk by chunk. content
+    is bytes, or a path or open binary file (closed once copied) to copy in
+    block_size pieces so that it is never held in memory whole.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression) as archive:
+        for name, content in entries:
+            if isinstance(content, bytes):
+                archive.writestr(name, content)
+                yield stream.drain()
+                continue
+            source = content if hasattr(content, 'read') else open(content, 'rb')
+            with source:
+                stat = os.fstat(source.fileno())
+                info = zipfile.ZipInfo(name, time.localtime(stat.st_mtime)[:6])
+                info.external_attr = (stat.st_mode & 0xFFFF) << 16
+                info.file_size = stat.st_size
+                info.compress_type = compression
+                with archive.open(info, 'w') as target:
+                    for block in iter(lambda: source.read(block_size), b''):
+                        target.write(block)
+                        yield stream.drain()
+        yield stream.drain()
+    yield stream.drain()
+
+
+class ConvertedZipResponse(StreamingHttpResponse):
+    """Streamed zip download that removes `cleanup` paths once it has been sent"""
+
+    def __init__(self, *args, cleanup=(), **kwargs):
+        self.cleanup = list(cleanup)
+        super().__init__(*args, **kwargs)
+
+    def close(self):
+        _remove_files(self.cleanup)
+        super().close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single "bytes=" range, inclusive, clamped to size.
+
+    Returns None when the header should be ignored (missing, malformed or
+    several ranges) and raises ValueError when the range is unsatisfiable.
+    """
+    match = RANGE_RE.match(header or '')
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last `last` bytes
+        length = int(last)
+        if not length or not size:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _proxy_response(mode, path, content_type, filename):
+    """Let the fronting proxy send path; None if it can't reach the file"""
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-sendfile':
+        response['X-Sendfile'] = os.path.abspath(path)
+    else:
+        private_root = os.path.join(os.path.abspath(settings.CONVERTER_PRIVATE_ROOT), '')
+        path = os.path.abspath(path)
+        if not path.startswith(private_root):
+            return None
+        relative = path[len(private_root):].replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.CONVERTER_ACCEL_REDIRECT_PREFIX + relative
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def serve_bytes(data, content_type, filename):
+    """Download response for a small file held in memory"""
+    response = HttpResponse(data, content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def serve_zip(entries, filename, compression=zipfile.ZIP_STORED, cleanup=()):
+    """
+    Download response streaming a zip of (name, bytes or path) entries,
+    removing the cleanup paths once it has been sent.
+    """
+    response = ConvertedZipResponse(
+        stream_zip(entries, compression), cleanup=cleanup, content_type='application/zip'
+    )
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def serve_file(request, path, content_type, filename, cleanup=(), file=None):
+    """
+    Download response for the file at path, or for `file` when it is
+    already open (e.g. a cache entry that may be evicted after opening).
+
+    cleanup lists temporary files (path among them, possibly) to delete
+    once the response has been sent. A path that is itself temporary is
+    always streamed by Django, since the proxy would read it after it's
+    gone; otherwise the proxy may send it and cleanup happens right away.
+    """
+    mode = settings.CONVERTER_DOWNLOAD_MODE
+    if mode not in DOWNLOAD_MODES:
+        raise ValueError(f"Unknown CONVERTER_DOWNLOAD_MODE {mode!r}, expected one of {DOWNLOAD_MODES}")
+    if mode != 'stream' and path not in cleanup:
+        response = _proxy_response(mode, path, content_type, filename)
+        if response is not None:
+            if file is not None:
+                file.close()
+            _remove_files(cleanup)
+            return response
+
+    if file is None:
+        file = open(path, 'rb')
+    stat = os.fstat(file.fileno())
+    size = stat.st_size
+    last_modified = http_date(stat.st_mtime)
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    # A stale If-Range (the file changed since the client's first part)
+    # means the whole file is sent again
+    if request.method == 'GET' and (if_range is None or parse_http_date_safe(if_range) == int(stat.st_mtime)):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            file.close()
+            _remove_files(cleanup)
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = ConvertedFileResponse(
+            file, cleanup=cleanup, content_type=content_type, as_attachment=True, filename=filename
+        )
+    else:
+        start, end = byte_range
+        response = ConvertedFileResponse(
+            _FileRange(file, start, end - start + 1), cleanup=cleanup, status=206,
+            content_type=content_type, as_attachment=True, filename=filename,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = last_modified
+    return response
@@ -0,0 +1,269 @@
+"""
+Streaming Excel reading.
+
+pd.read_excel materialises every row of a sheet as a list of openpyxl cells
+before it builds the DataFrame, so a large workbook costs seconds and
+hundreds of MB. Here rows are read as plain values (openpyxl read-only with
+values_only, or python-calamine when it is installed) and turned into
+DataFrames CONVERTER_CSV_CHUNK_ROWS rows at a time, with the same parser
+and cell conversions pd.read_excel uses, so a sheet that fits in one batch
+comes out exactly as before.
+
+CONVERTER_EXCEL_ENGINE picks the engine: 'auto' (calamine if installed,
+else openpyxl), 'calamine', 'openpyxl', or 'pandas' for the old
+whole-sheet pd.read_excel. Legacy .xls workbooks, which openpyxl can't
+open, go through pd.read_excel unless calamine is used.
+"""
+import datetime
+import importlib.util
+from functools import lru_cache
+from itertools import chain, islice
+
+from django.conf import settings
+
+from .backends import backends
+from .buffers import is_path, rewind
+from .uploads import OLE2_MAGIC
+
+
+openpyxl = backends.lazy('openpyxl')
+pd = backends.lazy('pandas')
+TextParser = backends.lazy_attr('pandas.io.parsers', 'TextParser')
+CalamineWorkbook = backends.lazy_attr('python_calamine', 'CalamineWorkbook')
+
+
+ENGINES = ('auto', 'calamine', 'openpyxl', 'pandas')
+
+# Values openpyxl returns for error cells, read as missing like pd.read_excel does
+ERROR_VALUES = frozenset(('#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'))
+
+
+class SheetError(ValueError):
+    """The requested sheet isn't in the workbook"""
+
+
+@lru_cache(maxsize=None)
+def calamine_available():
+    return importlib.util.find_spec('python_calamine') is not None
+
+
+def _is_xls(source):
+    if is_path(source):
+        with open(source, 'rb') as f:
+            head = f.read(len(OLE2_MAGIC[0]))
+    else:
+        head = rewind(source).read(len(OLE2_MAGIC[0]))
+        rewind(source)
+    return head.startswith(OLE2_MAGIC)
+
+
+def get_engine(source):
+    """The engine that reads source, from CONVERTER_EXCEL_ENGINE"""
+    engine = settings.CONVERTER_EXCEL_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown CONVERTER_EXCEL_ENGINE {engine!r}, expected one of {ENGINES}")
+    if engine == 'auto':
+        engine = 'calamine' if calamine_available() else 'openpyxl'
+    if engine == 'openpyxl' and _is_xls(source):
+        engine = 'pandas'
+    return engine
+
+
+def _open_calamine(source):
+    return CalamineWorkbook.from_object(source if is_path(source) else rewind(source))
+
+
+def _open_openpyxl(source):
+    return openpyxl.load_workbook(rewind(source), read_only=True, data_only=True, keep_links=False)
+
+
+def sheet_names(source):
+    """Names of the sheets in the workbook, in order"""
+    engine = get_engine(source)
+    if engine == 'calamine':
+        return list(_open_calamine(source).sheet_names)
+    if engine == 'pandas':
+        with pd.ExcelFile(rewind(source)) as workbook:
+            return list(workbook.sheet_names)
+    workbook = _open_openpyxl(source)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def resolve_sheet(source, sheet=None):
+    """
+    Name of the sheet to read: the first one when sheet is None, else the
+    sheet called `sheet`, else the sheet at that 0-based position.
+    """
+    names = sheet_names(source)
+    if not names:
+        raise SheetError("Workbook has no sheets")
+    if sheet is None:
+        return names[0]
+    if sheet in names:
+        return sheet
+    if str(sheet).isdigit() and int(sheet) < len(names):
+        return names[int(sheet)]
+    raise SheetError(f"Sheet {sheet!r} not found, the workbook has: {', '.join(names)}")
+
+
+def _openpyxl_cell(value):
+    # pd.read_excel's conversions: blanks are '', errors are missing and
+    # whole floats become ints
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str) and value in ERROR_VALUES:
+        return float('nan')
+    return value
+
+
+def _calamine_cell(value):
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return pd.Timestamp(value)
+    if isinstance(value, datetime.timedelta):
+        return pd.Timedelta(value)
+    return value
+
+
+def _open_openpyxl_sheet(workbook, sheet):
+    worksheet = workbook[sheet]
+    # Read-only sheets trust the dimension the writer recorded to bound
+    # their rows, and it may be wrong
+    worksheet.reset_dimensions()
+    return worksheet
+
+
+def _openpyxl_rows(source, sheet):
+    """(None, rows) of a sheet read with openpyxl, whose width isn't known up front"""
+    workbook = _open_openpyxl(source)
+    try:
+        worksheet = _open_openpyxl_sheet(workbook, sheet)
+    except BaseException:
+        workbook.close()
+        raise
+
+    def rows():
+        try:
+            for row in worksheet.iter_rows(values_only=True):
+                yield [_openpyxl_cell(value) for value in row]
+        finally:
+            workbook.close()
+    return None, rows()
+
+
+def _openpyxl_width(source, sheet):
+    """
+    Width of the widest row of a sheet, trailing blank cells aside: one
+    pass over the raw values with openpyxl, without converting any cell
+    """
+    workbook = _open_openpyxl(source)
+    try:
+        width = 0
+        for row in _open_openpyxl_sheet(workbook, sheet).iter_rows(values_only=True):
+            for end in range(len(row), width, -1):
+                if row[end - 1] is not None and row[end - 1] != '':
+                    width = end
+                    break
+        return width
+    finally:
+        workbook.close()
+
+
+def _calamine_rows(source, sheet):
+    """(width of the sheet's used range, rows) of a sheet read with calamine"""
+    worksheet = _open_calamine(source).get_sheet_by_name(sheet)
+    return worksheet.width, ([_calamine_cell(value) for value in row] for row in worksheet.iter_rows())
+
+
+def _trim_rows(rows):
+    blank_rows = 0
+    for row in rows:
+        while row and row[-1] == '':
+            row.pop()
+        if not row:
+            blank_rows += 1
+            continue
+        for _ in range(blank_rows):
+            yield []
+        blank_rows = 0
+        yield row
+
+
+def _sheet_rows(source, sheet):
+    """(the sheet's width as its engine reports it or None, iter_rows(source, sheet))"""
+    read = _calamine_rows if get_engine(source) == 'calamine' else _openpyxl_rows
+    width, rows = read(source, sheet)
+    return width, _trim_rows(rows)
+
+
+def iter_rows(source, sheet):
+    """
+    Yield the rows of a sheet as lists of cell values, trailing blank cells
+    and trailing blank rows removed (blank rows in between are kept).
+    """
+    return _sheet_rows(source, sheet)[1]
+
+
+def _parse(header, rows):
+    """DataFrame of rows under header, parsed the way pd.read_excel parses a sheet"""
+    width = len(header)
+    data = [header] + [row + [''] * (width - len(row)) for row in rows]
+    return TextParser(data, header=0, skip_blank_lines=False).read()
+
+
+def iter_excel_chunks(source, sheet, chunk_rows=None):
+    """
+    Yield a sheet as DataFrames of at most chunk_rows (default
+    CONVERTER_CSV_CHUNK_ROWS) rows, with the first row as the header.
+
+    Every row is padded to the widest row, like pd.read_excel does. The
+    columns are fixed once the first batch is parsed, so for a sheet longer
+    than one batch the widest row of the whole sheet is found first: calamine
+    reports it, with openpyxl it takes a pass over the raw values.
+    """
+    chunk_rows = chunk_rows or settings.CONVERTER_CSV_CHUNK_ROWS
+    if get_engine(source) == 'pandas':
+        df = pd.read_excel(rewind(source), sheet_name=sheet)
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        return
+
+    reported_width, rows = _sheet_rows(source, sheet)
+    header = next(rows, None)
+    if header is None:
+        yield pd.DataFrame()
+        return
+    batch = list(islice(rows, chunk_rows + 1))
+    width = max([len(header)] + [len(row) for row in batch])
+    if len(batch) > chunk_rows:
+        # More batches follow; a sheet that fits in one comes out exactly
+        # as pd.read_excel reads it
+        if reported_width is None:
+            reported_width = _openpyxl_width(source, sheet)
+        width = max(width, reported_width)
+        rows = chain(batch[chunk_rows:], rows)
+        batch = batch[:chunk_rows]
+    header = header + [''] * (width - len(header))
+
+    yield _parse(header, batch)
+    for batch in iter(lambda: list(islice(rows, chunk_rows)), []):
+        yield _parse(header, batch)
+
+
+def load_small_excel(source, sheet):
+    """Return the whole sheet as a DataFrame if it fits in one chunk, else None"""
+    chunk_rows = settings.CONVERTER_CSV_CHUNK_ROWS
+    chunks = iter_excel_chunks(source, sheet, chunk_rows + 1)
+    try:
+        df = next(chunks)
+    finally:
+        chunks.close()
+    if len(df) > chunk_rows:
+        return None
+    return df
@@ -0,0 +1,274 @@
+"""
+Reader/writer registry for the converter.
+
+A reader parses a source document into one of two intermediate forms:
+
+* TableContent: a titled table, available as DataFrame chunks (or as one
+  DataFrame when it is small enough)
+* TextContent: a titled plain text with its paragraphs
+
+A writer renders one of these forms into an output document. Sources and
+outputs are paths or binary buffers (see buffers.py). A document is parsed
+once however many formats it is written to, and a new format needs one
+reader and a writer per intermediate form rather than a method per pair of
+formats.
+"""
+import csv
+from itertools import chain
+
+from . import excel
+from .backends import backends
+from .buffers import open_text
+from .pdf_text import extract_pages
+from .tables import (
+    FlowableStream, add_word_table, iter_csv_chunks, load_small_csv,
+    pdf_table_flowables, write_excel_stream, write_text_stream,
+)
+
+
+pd = backends.lazy('pandas')
+pagesizes = backends.lazy('reportlab.lib.pagesizes')
+SimpleDocTemplate = backends.lazy_attr('reportlab.platypus', 'SimpleDocTemplate')
+Paragraph = backends.lazy_attr('reportlab.platypus', 'Paragraph')
+getSampleStyleSheet = backends.lazy_attr('reportlab.lib.styles', 'getSampleStyleSheet')
+
+# Padding SimpleDocTemplate puts inside its page frame
+PDF_FRAME_PADDING = 6
+Document = backends.lazy_attr('docx', 'Document')
+
+
+# Format name -> file extensions, the first being the one written
+EXTENSIONS = {
+    'pdf': ['.pdf'],
+    'csv': ['.csv'],
+    'excel': ['.xlsx', '.xls'],
+    'word': ['.docx', '.doc'],
+    'txt': ['.txt'],
+}
+
+
+class TableContent:
+    """
+    A table read from a document.
+
+    chunks() returns a fresh iterator of DataFrame chunks on every call, and
+    frame() the whole table as one DataFrame, or None when it is too large
+    to load at once (see CONVERTER_CSV_CHUNK_ROWS). frame() is parsed once
+    and reused by every writer.
+    """
+
+    kind = 'table'
+
+    def __init__(self, title, chunks, frame):
+        self.title = title
+        self._chunks = chunks
+        self._frame = frame
+        self._loaded = False
+
+    def chunks(self):
+        return self._chunks()
+
+    def frame(self):
+        if not self._loaded:
+            self._frame = self._frame()
+            self._loaded = True
+        return self._frame
+
+
+class TextContent:
+    """
+    Plain text read from a document.
+
+    text is the whole text as written to .txt; paragraphs are the blocks
+    rendered as paragraphs in PDF and Word output. lines() are the non-blank
+    lines, stripped, as written one per row to CSV and Excel.
+    """
+
+    kind = 'text'
+
+    def __init__(self, title, text, paragraphs):
+        self.title = title
+        self.text = text
+        self.paragraphs = paragraphs
+
+    def lines(self):
+        return [line.strip() for line in self.text.split('\n') if line.strip()]
+
+
+READERS = {}
+WRITERS = {}
+
+
+def reader(format_name):
+    """Register a reader: reader(source, **options) -> TableContent or TextContent"""
+    def register(function):
+        READERS[format_name] = function
+        return function
+    return register
+
+
+def writer(format_name, kind):
+    """Register a writer of content of `kind` ('table' or 'text'): writer(content, output)"""
+    def register(function):
+        WRITERS[format_name, kind] = function
+        return function
+    return register
+
+
+def read(source, format_name, **options):
+    if format_name not in READERS:
+        raise NotImplementedError(f"Reading {format_name} is not implemented")
+    return READERS[format_name](source, **options)
+
+
+def write(content, output, format_name):
+    if (format_name, content.kind) not in WRITERS:
+        raise NotImplementedError(f"Writing {content.kind} content as {format_name} is not implemented")
+    WRITERS[format_name, content.kind](content, output)
+
+
+# Readers
+
+@reader('pdf')
+def read_pdf(source):
+    try:
+        pages = extract_pages(source)
+    except Exception as e:
+        raise Exception(f"Error extracting PDF text: {str(e)}")
+    text = ''.join(f"{page}\n" for page in pages)
+    return TextContent('Converted from PDF', text, [text])
+
+
+@reader('csv')
+def read_csv(source):
+    return TableContent('CSV Data', lambda: iter_csv_chunks(source), lambda: load_small_csv(source))
+
+
+@reader('excel')
+def read_excel(source, sheet=None):
+    """Stream one sheet (the first by default) in row batches, see excel.py"""
+    name = excel.resolve_sheet(source, sheet)
+    title = 'Excel Data' if sheet is None else f'Excel Data: {name}'
+    return TableContent(
+        title, lambda: excel.iter_excel_chunks(source, name), lambda: excel.load_small_excel(source, name)
+    )
+
+
+@reader('word')
+def read_word(source):
+    paragraphs = [paragraph.text for paragraph in Document(source).paragraphs]
+    return TextContent('Converted from Word Document', ''.join(f"{text}\n" for text in paragraphs), paragraphs)
+
+
+@reader('txt')
+def read_txt(source):
+    with open_text(source) as f:
+        text = f.read()
+    return TextContent('Text Document', text, [text])
+
+
+# Table writers
+
+@writer('pdf', 'table')
+def write_table_pdf(content, output):
+    """Render the chunks as a titled PDF table, one page-sized block at a time"""
+    doc = SimpleDocTemplate(output, pagesize=pagesizes.A4)
+    styles = getSampleStyleSheet()
+
+    # The page frame's padding and the title come off the table's space
+    title = Paragraph(content.title, styles['Title'])
+    frame_height = doc.height - 2 * PDF_FRAME_PADDING
+    first_height = frame_height - title.wrap(doc.width, frame_height)[1] - title.getSpaceAfter()
+    elements = FlowableStream(chain(
+        [title],
+        pdf_table_flowables(content.chunks, doc.width, frame_height, first_height),
+    ))
+    doc.build(elements)
+
+
+@writer('csv', 'table')
+def write_table_csv(content, output):
+    df = content.frame()
+    if df is not None:
+        df.to_csv(output, index=False)
+        return
+    # Large table: append row batches, header from the first one
+    with open_text(output, 'w', newline='') as f:
+        for i, chunk in enumerate(content.chunks()):
+            chunk.to_csv(f, index=False, header=i == 0)
+
+
+@writer('excel', 'table')
+def write_table_excel(content, output):
+    df = content.frame()
+    if df is not None:
+        df.to_excel(output, index=False)
+    else:
+        # Large table: stream row batches into a write-only workbook
+        write_excel_stream(content.chunks(), output)
+
+
+@writer('word', 'table')
+def write_table_word(content, output):
+    doc = Document()
+    doc.add_heading(content.title, 0)
+    add_word_table(doc, content.chunks())
+    doc.save(output)
+
+
+@writer('txt', 'table')
+def write_table_txt(content, output):
+    df = content.frame()
+    if df is None:
+        # Large table: stream row batches straight to the text output
+        write_text_stream(content.chunks, output)
+        return
+    with open_text(output, 'w') as f:
+        f.write(df.to_string(index=False))
+
+
+# Text writers
+
+@writer('pdf', 'text')
+def write_text_pdf(content, output):
+    doc = SimpleDocTemplate(output, pagesize=pagesizes.A4)
+    styles = getSampleStyleSheet()
+    elements = [Paragraph(content.title, styles['Title'])]
+
+    # Blank lines separate paragraphs, single newlines are just spaces
+    for paragraph in content.paragraphs:
+        for block in paragraph.split('\n\n'):
+            if block.strip():
+                elements.append(Paragraph(block.replace('\n', ' '), styles['Normal']))
+
+    doc.build(elements)
+
+
+@writer('csv', 'text')
+def write_text_csv(content, output):
+    with open_text(output, 'w', newline='') as f:
+        rows = csv.writer(f)
+        rows.writerow(['Content'])
+        for line in content.lines():
+            rows.writerow([line])
+
+
+@writer('excel', 'text')
+def write_text_excel(content, output):
+    df = pd.DataFrame({'Content': content.lines()})
+    df.to_excel(output, index=False)
+
+
+@writer('word', 'text')
+def write_text_word(content, output):
+    doc = Document()
+    doc.add_heading(content.title, 0)
+    for paragraph in content.paragraphs:
+        doc.add_paragraph(paragraph)
+    doc.save(output)
+
+
+@writer('txt', 'text')
+def write_text_txt(content, output):
+    with open_text(output, 'w') as f:
+        f.write(content.text)
@@ -0,0 +1,303 @@
+"""
+Background conversion jobs for ConverterView.
+
+Each job lives in its own directory under CONVERTER_JOB_DIR holding the
+uploaded source, the converted result and a job.json status file, so any
+worker process can answer status and result requests for any job.
+"""
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from . import pdf_text
+from .cache import conversion_cache
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# Directory under the store root with an empty marker file per pending or
+# running job, dated by the job's created_at, so the queue is counted
+# without reading every job.json
+ACTIVE_DIR = '.active'
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue already holds the maximum number of jobs"""
+
+
+class JobTimeoutError(Exception):
+    """Raised inside a worker when a job exceeds its time limit"""
+
+
+class JobStore:
+    """Filesystem-backed store of conversion jobs"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def job_dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def _status_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), 'job.json')
+
+    def _active_path(self, job_id):
+        return os.path.join(self.root, ACTIVE_DIR, job_id)
+
+    def create(self, source_format, target_format, filename):
+        """Create a pending job and its working directory"""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        job = {
+            'job_id': job_id,
+            'status': PENDING,
+            'source_format': source_format,
+            'target_format': target_format,
+            'filename': filename,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result_path': None,
+            'error': None,
+        }
+        self._write(job)
+        os.makedirs(os.path.join(self.root, ACTIVE_DIR), exist_ok=True)
+        self._mark_active(job)
+        return job
+
+    def get(self, job_id):
+        """Return the job dict, or None for unknown or malformed ids"""
+        if not JOB_ID_RE.match(job_id or ''):
+            return None
+        try:
+            with open(self._status_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def update(self, job_id, **fields):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        self._write(job)
+        if job['status'] in (PENDING, RUNNING):
+            if 'created_at' in fields:
+                self._mark_active(job)
+        else:
+            self._unmark_active(job_id)
+        return job
+
+    def delete(self, job_id):
+        self._unmark_active(job_id)
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def jobs(self):
+        """Every job in the store"""
+        if not os.path.isdir(self.root):
+            return
+        for job_id in os.listdir(self.root):
+            job = self.get(job_id)
+            if job is not None:
+                yield job
+
+    def is_abandoned(self, job, now=None):
+        """
+        Whether an unfinished job can no longer be running: with one worker
+        a full queue drains within CONVERTER_JOB_MAX_QUEUED timeouts, so a
+        job older than that was lost with the process that queued it.
+        """
+        if job['status'] not in (PENDING, RUNNING):
+            return False
+        max_life = settings.CONVERTER_JOB_MAX_QUEUED * settings.CONVERTER_JOB_TIMEOUT
+        return job['created_at'] < (now or time.time()) - max_life
+
+    def active_count(self):
+        """Jobs queued or running in any worker process, abandoned ones aside"""
+        max_life = settings.CONVERTER_JOB_MAX_QUEUED * settings.CONVERTER_JOB_TIMEOUT
+        cutoff = time.time() - max_life
+        try:
+            entries = os.scandir(os.path.join(self.root, ACTIVE_DIR))
+        except FileNotFoundError:
+            return 0
+        count = 0
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime >= cutoff:
+                        count += 1
+                except FileNotFoundError:
+                    # Finished while we were counting
+                    pass
+        return count
+
+    def purge_expired(self, max_age):
+        """
+        Remove jobs finished more than max_age seconds ago. Unfinished jobs
+        are kept while a worker may still be using their directory.
+        """
+        now = time.time()
+        cutoff = now - max_age
+        for job in list(self.jobs()):
+            if job['finished_at'] is not None:
+                expired = job['finished_at'] < cutoff
+            else:
+                expired = self.is_abandoned(job, now) and job['created_at'] < cutoff
+            if expired:
+                self.delete(job['job_id'])
+
+    def _mark_active(self, job):
+        path = self._active_path(job['job_id'])
+        with open(path, 'a'):
+            pass
+        os.utime(path, (job['created_at'], job['created_at']))
+
+    def _unmark_active(self, job_id):
+        try:
+            os.remove(self._active_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _write(self, job):
+        # Write to a sibling file and rename so readers never see partial JSON
+        path = self._status_path(job['job_id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+
+def _converter_settings():
+    """The CONVERTER_* settings of this process, handed to job workers"""
+    return {name: getattr(settings, name) for name in dir(settings) if name.startswith('CONVERTER_')}
+
+
+def _init_worker(converter_settings=None):
+    """
+    Configure Django in the worker, which starts from the forkserver rather
+    than as a copy of the web process, with that process's converter
+    settings. PDF extraction stays in the worker: a page pool started from
+    a pool worker can deadlock as its processes exit, and jobs already run
+    in parallel.
+    """
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    for name, value in (converter_settings or {}).items():
+        setattr(settings, name, value)
+    pdf_text.extract_in_process()
+
+
+def _alarm_handler(signum, frame):
+    raise JobTimeoutError('Conversion timed out')
+
+
+def _run_job(store_root, job_id, source_path, source_format, target_format, timeout, options=None):
+    """Worker entry point: convert one file and return the result path"""
+    from .views import ConverterView
+
+    store = JobStore(store_root)
+    store.update(job_id, status=RUNNING, started_at=time.time())
+
+    use_alarm = timeout and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _alarm_handler)
+        signal.alarm(int(timeout))
+    try:
+        return ConverterView()._convert_file(source_path, source_format, target_format, options)
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+
+class ConversionJobQueue:
+    """Bounded process pool running conversion jobs from a JobStore"""
+
+    def __init__(self):
+        self._executor = None
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        return JobStore(settings.CONVERTER_JOB_DIR)
+
+    def _get_executor(self):
+        if self._executor is None:
+            # Not forked from the web worker, whose other threads (requests,
+            # torch) may hold locks a forked child would never see released
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.CONVERTER_JOB_WORKERS,
+                mp_context=multiprocessing.get_context('forkserver'),
+                initializer=_init_worker,
+                initargs=(_converter_settings(),),
+            )
+        return self._executor
+
+    def depth(self):
+        """Number of jobs queued or running in this process"""
+        with self._lock:
+            return len(self._inflight)
+
+    def submit(self, job_id, source_path, source_format, target_format, cache_key=None, options=None):
+        """
+        Queue a job already created in the store; raises QueueFullError when
+        the queue is at capacity.
+
+        Capacity counts pending and running jobs in the store, so it is shared
+        by every web process. The job itself is among them: two processes
+        racing for the last slot both see each other and both back off
+        rather than overshoot the limit.
+        """
+        with self._lock:
+            if self.store.active_count() > settings.CONVERTER_JOB_MAX_QUEUED:
+                raise QueueFullError('Too many conversion jobs queued, try again later')
+            args = (self.store.root, job_id, source_path, source_format,
+                    target_format, settings.CONVERTER_JOB_TIMEOUT, options)
+            try:
+                future = self._get_executor().submit(_run_job, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool
+                self._executor = None
+                future = self._get_executor().submit(_run_job, *args)
+            self._inflight.add(job_id)
+        future.add_done_callback(lambda f: self._finish(job_id, f, cache_key))
+
+    def _finish(self, job_id, future, cache_key=None):
+        with self._lock:
+            self._inflight.discard(job_id)
+        try:
+            result_path = future.result()
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None
+            self.store.update(job_id, status=FAILED, finished_at=time.time(),
+                              error='Conversion worker crashed')
+        except Exception as e:
+            self.store.update(job_id, status=FAILED, finished_at=time.time(),
+                              error=str(e))
+        else:
+            self.store.update(job_id, status=DONE, finished_at=time.time(),
+                              result_path=result_path)
+            if cache_key is not None:
+                conversion_cache.put(cache_key, result_path)
+
+
+# Shared per-process job queue
+job_queue = ConversionJobQueue()
@@ -0,0 +1,119 @@
+"""
+Sheet layouts for printed photos.
+
+A layout is the grid of photo slots for a paper size, a photo standard and
+the gap between photos. Layouts are computed once per combination and
+cached. Sheet buffers are recycled through a small pool and reset with an
+in-place fill, so a request doesn't allocate a fresh ~26 MB A4 array.
+"""
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+
+from .backends import backends
+
+
+np = backends.lazy('numpy')
+
+
+# (width, height) in pixels at 300 dpi
+PAPER_SIZES = {
+    'a4': (2480, 3508),
+    'letter': (2550, 3300),
+    '4x6': (1200, 1800),
+}
+
+# (width, height) in pixels at 300 dpi
+PHOTO_SIZES = {
+    'passport': (295, 413),  # approx. passport size
+    'us': (600, 600),  # 2x2 in
+    'eu': (413, 531),  # 35x45 mm
+}
+
+DEFAULT_PAPER = 'a4'
+DEFAULT_PHOTO = 'passport'
+GAP = 5  # gap between photos in pixels
+
+
+Layout = namedtuple('Layout', ['sheet_size', 'photo_size', 'gap', 'rows', 'cols', 'slots'])
+Layout.__doc__ = """
+Photo grid on a sheet. Sizes are (width, height); slots are the (x, y)
+top-left corners of every photo position, row by row from the top left.
+"""
+
+
+@lru_cache(maxsize=None)
+def get_layout(paper=DEFAULT_PAPER, photo=DEFAULT_PHOTO, gap=GAP):
+    """
+    Layout for a paper size and photo standard, by name.
+
+    Raises KeyError for an unknown paper or photo name.
+    """
+    sheet_w, sheet_h = sheet_size = PAPER_SIZES[paper]
+    photo_w, photo_h = photo_size = PHOTO_SIZES[photo]
+    # Every photo is followed by a gap, as on the original A4 sheet
+    cols = sheet_w // (photo_w + gap)
+    rows = sheet_h // (photo_h + gap)
+    slots = tuple(
+        (col * (photo_w + gap), row * (photo_h + gap))
+        for row in range(rows) for col in range(cols)
+    )
+    return Layout(sheet_size, photo_size, gap, rows, cols, slots)
+
+
+class SheetPool:
+    """
+    Reusable white sheet buffers, keyed by sheet size.
+
+    At most PASSPORT_SHEET_POOL_SIZE idle buffers are kept per size; a
+    buffer is handed out exclusively and reset to white before reuse.
+    """
+
+    def __init__(self):
+        self._free = {}
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+
+    @property
+    def max_idle(self):
+        return settings.PASSPORT_SHEET_POOL_SIZE
+
+    @contextmanager
+    def sheet(self, sheet_size):
+        """Yield a white (height, width, 3) uint8 sheet of sheet_size (width, height)"""
+        with self._lock:
+            free = self._free.get(sheet_size)
+            buffer = free.pop() if free else None
+            if buffer is None:
+                self.allocated += 1
+            else:
+                self.reused += 1
+        if buffer is None:
+            buffer = np.empty((sheet_size[1], sheet_size[0], 3), dtype=np.uint8)
+        buffer.fill(255)
+        try:
+            yield buffer
+        finally:
+            with self._lock:
+                free = self._free.setdefault(sheet_size, [])
+                if len(free) < self.max_idle:
+                    free.append(buffer)
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'allocated': self.allocated,
+                'reused': self.reused,
+                'idle': sum(len(free) for free in self._free.values()),
+            }
+
+
+sheet_pool = SheetPool()
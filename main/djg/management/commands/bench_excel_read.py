@@ -0,0 +1,81 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from djg import excel
+from djg.backends import backends
+from djg.jobs import _init_worker
+from djg.management.commands.bench_passport import _proc_status_kb, _reset_peak_rss
+
+
+def _write_workbook(path, rows, cols, rng):
+    """rows x cols cells, alternating integer, text and float columns, written like Excel does"""
+    pd.DataFrame({
+        f'col{i}': (
+            rng.integers(0, 10 ** 6, rows) if i % 3 == 0
+            else [f"item {n}" for n in rng.integers(0, 1000, rows)] if i % 3 == 1
+            else rng.random(rows).round(4)
+        )
+        for i in range(cols)
+    }).to_excel(path, index=False, sheet_name='Data')
+
+
+def _measure(path, engine, chunk_rows):
+    """
+    Rows, seconds and peak RSS growth (MB, None where unsupported) of reading
+    path with engine. Run in a fresh process so earlier runs' heap doesn't
+    hide this one's peak.
+    """
+    backends.preload(['excel'])
+    with override_settings(CONVERTER_EXCEL_ENGINE=engine, CONVERTER_CSV_CHUNK_ROWS=chunk_rows):
+        measure_rss = _reset_peak_rss()
+        start_rss = _proc_status_kb('VmRSS')
+        start = time.perf_counter()
+        sheet = excel.resolve_sheet(path)
+        rows = sum(len(chunk) for chunk in excel.iter_excel_chunks(path, sheet))
+        elapsed = time.perf_counter() - start
+    peak = (_proc_status_kb('VmHWM') - start_rss) / 1024 if measure_rss else None
+    return rows, elapsed, peak
+
+
+class Command(BaseCommand):
+    help = "Benchmark Excel reading, whole-sheet pd.read_excel versus streamed row batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cells', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--cols', type=int, default=10)
+        parser.add_argument('--chunk-rows', type=int, default=settings.CONVERTER_CSV_CHUNK_ROWS,
+                            help="Rows per streamed batch, which bounds the streaming engines' memory")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        engines = ['pandas', 'openpyxl'] + (['calamine'] if excel.calamine_available() else [])
+        if len(engines) == 2:
+            self.stdout.write("python-calamine is not installed, skipping the calamine engine")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for cells in options['cells']:
+                rows = cells // options['cols']
+                path = os.path.join(tmp, f'{cells}.xlsx')
+                _write_workbook(path, rows, options['cols'], rng)
+                line = f"{cells:>9,} cells ({os.path.getsize(path) / 1024 / 1024:>4.1f} MB)"
+
+                baseline = None
+                for engine in engines:
+                    with ProcessPoolExecutor(1, mp_context=get_context('spawn'), initializer=_init_worker) as pool:
+                        read, elapsed, peak = pool.submit(_measure, path, engine, options['chunk_rows']).result()
+                    if read != rows:
+                        self.stderr.write(f"{engine}: read {read} rows, expected {rows}")
+                    baseline = baseline or elapsed
+                    line += f"  {engine}: {elapsed:>6.2f}s {baseline / elapsed:>4.1f}x"
+                    if peak is not None:
+                        line += f" +{peak:>4.0f} MB"
+                self.stdout.write(line)
@@ -0,0 +1,147 @@
+import ctypes
+import ctypes.util
+import os
+import time
+import uuid
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from djg import passport
+from djg.layout import GAP, PHOTO_SIZES, PAPER_SIZES, get_layout, sheet_pool
+
+
+def _legacy_sheet(data, num_copies):
+    """The disk round-trip and per-slot loop used before djg.passport"""
+    temp_name = f"{uuid.uuid4().hex}.jpg"
+    temp_path = os.path.join(settings.MEDIA_ROOT, temp_name)
+    default_storage.save(temp_name, ContentFile(data))
+    img = cv2.imread(temp_path)
+
+    h, w = img.shape[:2]
+    size = min(h, w)
+    center_y, center_x = h // 2, w // 2
+    cropped = img[center_y - size // 2:center_y + size // 2, center_x - size // 2:center_x + size // 2]
+    passport_img = cv2.resize(cropped, PHOTO_SIZES['passport'])
+
+    sheet_w, sheet_h = PAPER_SIZES['a4']
+    photo_w, photo_h = PHOTO_SIZES['passport']
+    sheet = np.ones((sheet_h, sheet_w, 3), dtype=np.uint8) * 255
+    cols = sheet_w // (photo_w + GAP)
+    rows = sheet_h // (photo_h + GAP)
+    to_place = min(num_copies, cols * rows)
+    c = 0
+    for r in range(rows):
+        for col in range(cols):
+            if c >= to_place:
+                break
+            y = r * (photo_h + GAP)
+            x = col * (photo_w + GAP)
+            sheet[y:y + photo_h, x:x + photo_w] = passport_img
+            c += 1
+        if c >= to_place:
+            break
+
+    final_name = f"sheet_{uuid.uuid4().hex}.jpg"
+    cv2.imwrite(os.path.join(settings.MEDIA_ROOT, final_name), sheet, [int(cv2.IMWRITE_JPEG_QUALITY), 95])
+    default_storage.delete(temp_name)
+    return final_name
+
+
+def _fresh_sheet(data, num_copies, layout):
+    """In-memory and vectorised, but allocating a new sheet per request"""
+    img = passport.decode_image(data)
+    photo = passport.passport_photo(img, layout.photo_size)
+    sheet = np.full((layout.sheet_size[1], layout.sheet_size[0], 3), 255, dtype=np.uint8)
+    passport.tile_photos(sheet, photo, num_copies, layout)
+    return default_storage.save(f"sheet_{uuid.uuid4().hex}.jpg", ContentFile(passport.encode_jpeg(sheet)))
+
+
+def _pooled_sheet(data, num_copies, layout):
+    """What PassportSheetView does per request"""
+    img = passport.decode_image(data)
+    photo = passport.passport_photo(img, layout.photo_size)
+    with sheet_pool.sheet(layout.sheet_size) as sheet:
+        passport.tile_photos(sheet, photo, num_copies, layout)
+        encoded = passport.encode_jpeg(sheet)
+    return default_storage.save(f"sheet_{uuid.uuid4().hex}.jpg", ContentFile(encoded))
+
+
+def _proc_status_kb(field):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return None
+
+
+def _reset_peak_rss():
+    """
+    Hand freed heap back to the OS and reset VmHWM to the current RSS
+    (Linux only). Returns False where that isn't supported.
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library('c'))
+    if hasattr(libc, 'malloc_trim'):
+        libc.malloc_trim(0)
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    return _proc_status_kb('VmHWM') is not None
+
+
+class Command(BaseCommand):
+    help = "Benchmark passport sheet requests/second, disk round-trip and loop versus in-memory and vectorised"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, nargs='+', default=[1, 12, 30])
+        parser.add_argument('--paper', choices=sorted(PAPER_SIZES), default='a4')
+        parser.add_argument('--photo', choices=sorted(PHOTO_SIZES), default='passport')
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--width', type=int, default=1200)
+        parser.add_argument('--height', type=int, default=1600)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        photo = rng.integers(0, 256, (options['height'], options['width'], 3), dtype=np.uint8)
+        data = cv2.imencode('.jpg', photo)[1].tobytes()
+        n = options['requests']
+        layout = get_layout(options['paper'], options['photo'])
+        variants = {
+            'fresh': lambda data, copies: _fresh_sheet(data, copies, layout),
+            'pooled': lambda data, copies: _pooled_sheet(data, copies, layout),
+        }
+        # The pre-layout code only knew A4 passport sheets
+        if (options['paper'], options['photo']) == ('a4', 'passport'):
+            variants = {'legacy': _legacy_sheet, **variants}
+        self.stdout.write(f"{options['paper']} / {options['photo']}: {len(layout.slots)} slots")
+
+        measure_rss = _reset_peak_rss()
+
+        for copies in options['copies']:
+            outputs = []
+            for build in variants.values():
+                name = build(data, copies)
+                with default_storage.open(name) as output:
+                    outputs.append(cv2.imdecode(np.frombuffer(output.read(), np.uint8), cv2.IMREAD_COLOR))
+                default_storage.delete(name)
+            if any(not np.array_equal(outputs[0], output) for output in outputs[1:]):
+                self.stderr.write(f"{copies} copies: sheets differ")
+
+            line = f"{copies:>3} copies"
+            for label, build in variants.items():
+                if measure_rss:
+                    _reset_peak_rss()
+                    start_rss = _proc_status_kb('VmRSS')
+                start = time.perf_counter()
+                for _ in range(n):
+                    default_storage.delete(build(data, copies))
+                line += f"  {label}: {n / (time.perf_counter() - start):>5.1f} req/s"
+                if measure_rss:
+                    line += f" +{(_proc_status_kb('VmHWM') - start_rss) / 1024:.1f} MB peak RSS"
+            self.stdout.write(line)
@@ -0,0 +1,66 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from djg import batch
+from djg.downloads import stream_zip
+from djg.layout import PAPER_SIZES, PHOTO_SIZES, get_layout
+
+
+class _Inline:
+    """Executor stand-in that runs everything in the calling thread"""
+
+    map = staticmethod(map)
+
+    def shutdown(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark batch passport sheets: inline versus thread pool versus process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photos', type=int, default=24)
+        parser.add_argument('--copies', type=int, default=8)
+        parser.add_argument('--mixed', action='store_true')
+        parser.add_argument('--paper', choices=sorted(PAPER_SIZES), default='a4')
+        parser.add_argument('--photo', choices=sorted(PHOTO_SIZES), default='passport')
+        parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+        parser.add_argument('--width', type=int, default=1200)
+        parser.add_argument('--height', type=int, default=1600)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        uploads = []
+        for i in range(options['photos']):
+            photo = rng.integers(0, 256, (options['height'], options['width'], 3), dtype=np.uint8)
+            uploads.append((f"photo{i}.jpg", cv2.imencode('.jpg', photo)[1].tobytes()))
+        layout = get_layout(options['paper'], options['photo'])
+        self.stdout.write(f"{len(uploads)} photos x {options['copies']} copies, "
+                          f"{'mixed' if options['mixed'] else 'one sheet per photo'}, {os.cpu_count()} CPUs")
+
+        executors = [('inline', 1, _Inline)]
+        for workers in options['workers']:
+            executors.append(('thread', workers, lambda workers=workers: ThreadPoolExecutor(max_workers=workers)))
+            executors.append(('process', workers, lambda workers=workers: ProcessPoolExecutor(
+                max_workers=workers, initializer=batch._init_worker)))
+
+        baseline = None
+        for kind, workers, make_executor in executors:
+            executor = make_executor()
+            try:
+                # Start the workers before timing
+                list(executor.map(abs, range(workers)))
+                start = time.perf_counter()
+                sheets, _ = batch.render_batch(uploads, layout, options['copies'], options['mixed'], executor)
+                size = sum(len(chunk) for chunk in stream_zip(sheets))
+                elapsed = time.perf_counter() - start
+            finally:
+                executor.shutdown()
+            baseline = baseline or elapsed
+            self.stdout.write(f"{kind:>8} x{workers}: {len(uploads) / elapsed:>6.1f} photos/s  "
+                              f"{size / 1024 / 1024:>6.1f} MB zip  speedup: {baseline / elapsed:.2f}x")
@@ -0,0 +1,69 @@
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from djg.views import ConverterView
+
+
+class Command(BaseCommand):
+    help = "Benchmark small-document conversion latency, on disk versus in memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=300, help="Rows in the sample CSV (~10 KB at 300)")
+        parser.add_argument('--repeat', type=int, default=30)
+
+    def handle(self, *args, **options):
+        view = ConverterView()
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            'id': np.arange(options['rows']),
+            'name': [f"item {i}" for i in range(options['rows'])],
+            'price': rng.random(options['rows']).round(2),
+        })
+
+        # One sample document per source format, made with the converters themselves
+        samples = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'sample.csv')
+            df.to_csv(csv_path, index=False)
+            for source_format in ConverterView.SUPPORTED_FORMATS:
+                path = csv_path
+                if source_format != 'csv':
+                    path = view._convert_file(csv_path, 'csv', source_format)
+                with open(path, 'rb') as f:
+                    samples[source_format] = f.read()
+
+        factory = RequestFactory()
+        self.stdout.write(f"{'conversion':<16} {'bytes':>7} {'disk ms':>9} {'memory ms':>10} {'speedup':>8}")
+        for source_format, data in samples.items():
+            name = 'sample' + ConverterView.SUPPORTED_FORMATS[source_format][0]
+            for target_format in ConverterView.SUPPORTED_FORMATS:
+                if target_format == source_format:
+                    continue
+                timings = {}
+                for label, threshold in (('disk', 0), ('memory', 1024 * 1024)):
+                    with override_settings(CONVERTER_IN_MEMORY_MAX_BYTES=threshold, CONVERTER_CACHE_MAX_BYTES=0):
+                        samples_ms = []
+                        for _ in range(options['repeat']):
+                            request = factory.post('/converter/', {
+                                'file': SimpleUploadedFile(name, data), 'target_format': target_format,
+                            })
+                            start = time.perf_counter()
+                            response = ConverterView.as_view()(request)
+                            b''.join(response) if not response.streaming else b''.join(response.streaming_content)
+                            response.close()
+                            request.close()
+                            samples_ms.append(1000 * (time.perf_counter() - start))
+                            assert response.status_code == 200, response.content
+                        timings[label] = statistics.median(samples_ms)
+                self.stdout.write(
+                    f"{source_format + '->' + target_format:<16} {len(data):>7} {timings['disk']:>9.2f} "
+                    f"{timings['memory']:>10.2f} {timings['disk'] / timings['memory']:>7.2f}x"
+                )
@@ -0,0 +1,51 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from docx import Document
+
+from djg.tables import add_word_table, iter_frame_chunks
+
+
+def _legacy_word_table(doc, df):
+    """The per-cell python-docx loop used before add_word_table"""
+    table = doc.add_table(rows=1, cols=len(df.columns))
+    table.style = 'Table Grid'
+    for i, column in enumerate(df.columns):
+        table.cell(0, i).text = str(column)
+    for _, row in df.iterrows():
+        cells = table.add_row().cells
+        for i, value in enumerate(row):
+            cells[i].text = str(value)
+    return table
+
+
+class Command(BaseCommand):
+    help = "Benchmark CSV/Excel-to-Word table building, per-cell versus bulk XML"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 5000, 20000])
+        parser.add_argument('--cols', type=int, default=6)
+        parser.add_argument('--skip-legacy-above', type=int, default=20000,
+                            help="Skip the slow per-cell writer for larger row counts")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        for rows in options['rows']:
+            df = pd.DataFrame({
+                f'col{i}': rng.integers(0, 10 ** 6, rows) if i % 2 else rng.random(rows)
+                for i in range(options['cols'])
+            })
+
+            start = time.perf_counter()
+            add_word_table(Document(), iter_frame_chunks(df))
+            bulk = time.perf_counter() - start
+            line = f"{rows:>8} rows  bulk: {rows / bulk:>10,.0f} rows/s"
+
+            if rows <= options['skip_legacy_above']:
+                start = time.perf_counter()
+                _legacy_word_table(Document(), df)
+                legacy = time.perf_counter() - start
+                line += f"  per-cell: {rows / legacy:>8,.0f} rows/s  speedup: {legacy / bulk:.1f}x"
+            self.stdout.write(line)
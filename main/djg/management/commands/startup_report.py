@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from djg.backends import FORMAT_BACKENDS
+
+
+# Run in a fresh interpreter so nothing is already imported
+BOOT_SCRIPT = """
+import django
+django.setup()
+import {urlconf}
+"""
+
+BACKEND_SCRIPT = """
+import django
+django.setup()
+from djg.backends import backends
+backends.preload({formats!r})
+for name in backends.loaded():
+    print(name, backends.import_times[name])
+"""
+
+
+class Command(BaseCommand):
+    help = "Report import time of a cold worker boot and of each conversion backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15,
+                            help="Number of slowest top-level imports to list")
+        parser.add_argument('--urlconf', default=settings.ROOT_URLCONF,
+                            help="URLconf module a worker imports at boot")
+
+    def _run(self, script, *flags):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'main.settings'))
+        return subprocess.run(
+            [sys.executable, *flags, '-c', script],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+
+    def handle(self, *args, **options):
+        urlconf = options['urlconf']
+        result = self._run(BOOT_SCRIPT.format(urlconf=urlconf), '-X', 'importtime')
+        if result.returncode:
+            self.stderr.write(result.stderr[-2000:])
+            return
+
+        # Lines look like "import time:  self [us] | cumulative | imported package"
+        top_level = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if not name.startswith('  '):
+                top_level.append((int(cumulative), name.strip()))
+        total = sum(us for us, _ in top_level)
+
+        self.stdout.write(f"Cold boot of {urlconf}: {total / 1e6:.2f}s in imports")
+        for us, name in sorted(top_level, reverse=True)[:options['top']]:
+            self.stdout.write(f"  {us / 1e6:8.3f}s  {name}")
+
+        self.stdout.write("\nFirst-use cost per format (loaded lazily):")
+        for format_name in FORMAT_BACKENDS:
+            result = self._run(BACKEND_SCRIPT.format(formats=[format_name]))
+            for line in result.stdout.splitlines():
+                name, seconds = line.rsplit(' ', 1)
+                self.stdout.write(f"  {format_name:6} {name:24} {float(seconds):.3f}s")
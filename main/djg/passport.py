@@ -0,0 +1,98 @@
+"""
+Passport photo sheet rendering.
+
+The upload is decoded straight from its bytes, the copies are written into
+the sheet with one broadcast assignment per block of rows instead of a
+Python loop over slots, and the JPEG is encoded in memory, so a request
+touches the filesystem once, to store the finished sheet. Sheet geometry
+and buffers come from layout.py.
+"""
+from .backends import backends
+from .layout import PHOTO_SIZES, get_layout, sheet_pool
+
+
+cv2 = backends.lazy('cv2')
+np = backends.lazy('numpy')
+
+
+JPEG_QUALITY = 95
+
+
+def decode_image(data):
+    """Decode image bytes to a BGR array, or None if they aren't an image"""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if not buffer.size:
+        return None
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def passport_photo(img, photo_size=PHOTO_SIZES['passport']):
+    """Center crop to square and resize to the photo size"""
+    h, w = img.shape[:2]
+    size = min(h, w)
+    center_y, center_x = h // 2, w // 2
+    cropped = img[center_y - size // 2:center_y + size // 2, center_x - size // 2:center_x + size // 2]
+    return cv2.resize(cropped, photo_size)
+
+
+def tile_photos(sheet, photo, copies, layout=None, start=0):
+    """
+    Place up to `copies` photos on a white sheet, slot by slot from slot
+    `start` (row by row from the top left).
+
+    The part of the sheet covered by the layout's grid is viewed as
+    (rows, cell height, cols, cell width, channels), so every complete row
+    of photos is written by one broadcast assignment, and a partial first
+    or last row by one more each. Returns the number of photos placed.
+    """
+    layout = layout or get_layout()
+    photo_w, photo_h = layout.photo_size
+    cell_h, cell_w = photo_h + layout.gap, photo_w + layout.gap
+    rows, cols = layout.rows, layout.cols
+    end = min(start + copies, len(layout.slots))
+    if end <= start:
+        return 0
+
+    grid = sheet[:rows * cell_h, :cols * cell_w].reshape(rows, cell_h, cols, cell_w, sheet.shape[2])
+    row, col = divmod(start, cols)
+    slot = start
+    if col:
+        count = min(cols - col, end - slot)
+        grid[row, :photo_h, col:col + count, :photo_w] = photo[:, None]
+        slot += count
+        row += 1
+    full_rows, remainder = divmod(end - slot, cols)
+    if full_rows:
+        grid[row:row + full_rows, :photo_h, :, :photo_w] = photo[None, :, None]
+    if remainder:
+        grid[row + full_rows, :photo_h, :remainder, :photo_w] = photo[:, None]
+    return end - start
+
+
+def prepare_photo(data, photo_size=PHOTO_SIZES['passport']):
+    """Decode, crop and resize one upload; None if it isn't an image"""
+    img = decode_image(data)
+    if img is None:
+        return None
+    return passport_photo(img, photo_size)
+
+
+def render_sheet(placements, layout=None):
+    """
+    JPEG bytes of one sheet. placements is a sequence of (photo, copies)
+    filled into consecutive slots.
+    """
+    layout = layout or get_layout()
+    with sheet_pool.sheet(layout.sheet_size) as sheet:
+        slot = 0
+        for photo, copies in placements:
+            slot += tile_photos(sheet, photo, copies, layout, start=slot)
+        return encode_jpeg(sheet)
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY):
+    """Encode an image as JPEG bytes in memory"""
+    ok, encoded = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise ValueError('Could not encode image as JPEG')
+    return encoded.tobytes()
@@ -0,0 +1,130 @@
+"""
+Page-level PDF text extraction.
+
+Long documents are split into page ranges extracted on a process pool, and
+the per-page text is kept in the conversion cache under the document's
+content hash, so converting one PDF to several formats extracts it once.
+"""
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from django.conf import settings
+
+from .backends import backends
+from .buffers import is_path, rewind
+from .cache import conversion_cache, new_hasher
+
+
+PyPDF2 = backends.lazy('PyPDF2')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# Cleared in conversion job workers, which are pool workers themselves
+_parallel = True
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Started from the forkserver: forking a threaded web worker can
+            # leave the child waiting on a lock another thread held
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.CONVERTER_PDF_WORKERS, mp_context=multiprocessing.get_context('forkserver'),
+            )
+        return _executor
+
+
+def _reset_executor():
+    # A forked child (e.g. a gunicorn web worker) inherits the parent's
+    # pool object but none of its worker processes or management thread;
+    # using it would hang, so the child starts its own on first use
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+
+def extract_in_process():
+    """Extract pages in the calling process from now on, never on a pool"""
+    global _parallel
+    _parallel = False
+
+
+def _extract_range(pdf_path, start, stop):
+    """Extract the text of pages [start, stop) of a PDF"""
+    with open(pdf_path, 'rb') as file:
+        pages = PyPDF2.PdfReader(file).pages
+        return [pages[i].extract_text() for i in range(start, stop)]
+
+
+def _hash_file(path):
+    hasher = new_hasher()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _content_hash(source):
+    """
+    The hash of a source's bytes, as uploads compute it; sources from
+    uploads (SourceBuffer, SourcePath) already carry it
+    """
+    content_hash = getattr(source, 'content_hash', None)
+    if content_hash is not None:
+        return content_hash
+    if is_path(source):
+        return _hash_file(source)
+    hasher = new_hasher()
+    hasher.update(rewind(source).read())
+    return hasher.hexdigest()
+
+
+def _page_ranges(page_count, workers):
+    """Split page_count pages into at most `workers` contiguous ranges"""
+    size = -(-page_count // workers)
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def extract_pages(source):
+    """
+    Return the text of every page of a PDF as a list of strings.
+
+    source is a path, or a buffer holding a small PDF, which is extracted in
+    this process. Both are cached under the document's content hash.
+    """
+    cache_key = conversion_cache.make_key(_content_hash(source), 'pdf', 'pages')
+    cached = conversion_cache.open(cache_key)
+    if cached is not None:
+        with cached:
+            return json.load(cached)
+
+    if is_path(source):
+        pages = _extract_file_pages(source)
+    else:
+        pages = [page.extract_text() for page in PyPDF2.PdfReader(rewind(source)).pages]
+
+    conversion_cache.put_bytes(cache_key, json.dumps(pages).encode('utf-8'))
+    return pages
+
+
+def _extract_file_pages(pdf_path):
+    with open(pdf_path, 'rb') as file:
+        page_count = len(PyPDF2.PdfReader(file).pages)
+
+    workers = settings.CONVERTER_PDF_WORKERS
+    if not _parallel or workers <= 1 or page_count < settings.CONVERTER_PDF_PARALLEL_MIN_PAGES:
+        return _extract_range(pdf_path, 0, page_count)
+    starts, stops = zip(*_page_ranges(page_count, workers))
+    pages = []
+    for texts in _get_executor().map(_extract_range, repeat(pdf_path), starts, stops):
+        pages.extend(texts)
+    return pages
@@ -0,0 +1,326 @@
+"""
+Chunked helpers for tabular conversions.
+
+Small inputs are still handled as a single DataFrame so their output is
+unchanged; inputs longer than CONVERTER_CSV_CHUNK_ROWS are read and written
+in row batches so memory stays flat regardless of row count.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+
+from .backends import backends
+from .buffers import open_text, rewind
+
+
+openpyxl = backends.lazy('openpyxl')
+pd = backends.lazy('pandas')
+colors = backends.lazy('reportlab.lib.colors')
+stringWidth = backends.lazy_attr('reportlab.pdfbase.pdfmetrics', 'stringWidth')
+Table = backends.lazy_attr('reportlab.platypus', 'Table')
+TableStyle = backends.lazy_attr('reportlab.platypus', 'TableStyle')
+parse_xml = backends.lazy_attr('docx.oxml', 'parse_xml')
+nsdecls = backends.lazy_attr('docx.oxml.ns', 'nsdecls')
+
+
+@lru_cache(maxsize=None)
+def pdf_table_style():
+    """Style shared by every PDF table chunk, built only once"""
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+
+
+# Default Table cell padding (6pt left + 6pt right)
+PDF_CELL_PADDING = 12
+
+
+def load_small_csv(csv_path):
+    """Return the whole CSV as a DataFrame if it fits in one chunk, else None"""
+    chunk_rows = settings.CONVERTER_CSV_CHUNK_ROWS
+    df = pd.read_csv(rewind(csv_path), nrows=chunk_rows + 1)
+    if len(df) > chunk_rows:
+        return None
+    return df
+
+
+def iter_csv_chunks(csv_path):
+    """Yield the CSV as DataFrames of at most CONVERTER_CSV_CHUNK_ROWS rows"""
+    with pd.read_csv(rewind(csv_path), chunksize=settings.CONVERTER_CSV_CHUNK_ROWS) as reader:
+        yield from reader
+
+
+def iter_frame_chunks(df):
+    """Yield an in-memory DataFrame in CONVERTER_CSV_CHUNK_ROWS sized slices"""
+    chunk_rows = settings.CONVERTER_CSV_CHUNK_ROWS
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _witness_positions(column):
+    """
+    Positions of the values that decide how DataFrame.to_string lays out
+    column: a missing value, the widest value and, for floats, the extremes,
+    the smallest non-zero magnitude and the value needing the most decimals
+    (these set the width, the decimals shown and the switch to scientific
+    notation).
+    """
+    values = column.to_numpy()
+    missing = pd.isna(values)
+    positions = set()
+    if missing.any():
+        positions.add(int(missing.argmax()))
+    if column.dtype.kind != 'f':
+        positions.add(int(column.astype(str).str.len().fillna(0).to_numpy().argmax()))
+        return positions
+    present = (~missing).nonzero()[0]
+    if not len(present):
+        return positions
+    numbers = values[present]
+    magnitudes = abs(numbers)
+    positions.update((present[numbers.argmin()], present[numbers.argmax()]))
+    nonzero = magnitudes.nonzero()[0]
+    if len(nonzero):
+        positions.add(present[nonzero[magnitudes[nonzero].argmin()]])
+    precision = pd.get_option('display.precision')
+    decimals = [len(f"{number:.{precision}f}".rstrip('0').partition('.')[2]) for number in numbers]
+    positions.add(present[decimals.index(max(decimals))])
+    return {int(position) for position in positions}
+
+
+def write_excel_stream(chunks, excel_path, sheet_title='Sheet1'):
+    """Append DataFrame chunks to a write-only workbook, header taken from the first chunk"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_title)
+    header_written = False
+    for chunk in chunks:
+        if not header_written:
+            sheet.append([str(column) for column in chunk.columns])
+            header_written = True
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(excel_path)
+
+
+def write_text_stream(chunk_source, txt_path):
+    """
+    Write the table exactly as DataFrame.to_string(index=False) would.
+
+    chunk_source is called twice to get fresh chunk iterators. The first
+    pass keeps the few rows of each chunk that decide the layout (see
+    _witness_positions); the second has pandas format every chunk along
+    with those rows, so each chunk gets the whole table's column widths
+    and number formats.
+    """
+    witnesses = []
+    for chunk in chunk_source():
+        positions = set()
+        for i in range(len(chunk.columns) if len(chunk) else 0):
+            positions |= _witness_positions(chunk.iloc[:, i])
+        witnesses.append(chunk.iloc[sorted(positions)])
+
+    if not witnesses:
+        with open_text(txt_path, 'w'):
+            return
+
+    witness = pd.concat(witnesses)
+    with open_text(txt_path, 'w') as f:
+        if not len(witness):
+            # No rows: pandas' description of the empty table
+            f.write(witness.to_string(index=False))
+            return
+        f.write(witness.to_string(index=False).split('\n', 1)[0])
+        for chunk in chunk_source():
+            if not len(chunk):
+                continue
+            lines = pd.concat([witness, chunk]).to_string(index=False).split('\n')
+            f.write('\n')
+            f.write('\n'.join(lines[1 + len(witness):]))
+
+
+class FlowableStream(list):
+    """
+    List of flowables that is filled lazily from an iterator.
+
+    SimpleDocTemplate.build consumes its flowables from the front of a list,
+    so only a couple of table chunks need to exist at any time.
+    """
+
+    LOOKAHEAD = 2
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+
+    def _fill(self):
+        while self._source is not None and super().__len__() < self.LOOKAHEAD:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return super().__len__()
+
+    def __getitem__(self, index):
+        self._fill()
+        return super().__getitem__(index)
+
+
+# Longest values per column measured when sizing PDF columns
+PDF_WIDTH_SAMPLE = 32
+
+
+def _cell_series(column):
+    """A column's cells as the strings the PDF and Word tables show for them"""
+    return column.astype(object).map(str)
+
+
+def _pdf_column_widths(chunk_source, available_width):
+    """
+    Size columns to the header and the widest cells of the whole table,
+    shrunk to fit the page if needed.
+
+    Measuring every cell would cost as much as laying the table out, so
+    each column's PDF_WIDTH_SAMPLE longest values are measured instead.
+    """
+    header = None
+    longest = None
+    for chunk in chunk_source():
+        if header is None:
+            header = [str(column) for column in chunk.columns]
+            longest = [[] for _ in header]
+        for i in range(len(header)):
+            cells = _cell_series(chunk.iloc[:, i]).reset_index(drop=True)
+            candidates = cells[cells.str.len().nlargest(PDF_WIDTH_SAMPLE).index]
+            longest[i] = sorted(set(longest[i]) | set(candidates), key=len)[-PDF_WIDTH_SAMPLE:]
+    if header is None:
+        return None
+
+    widths = []
+    for column, values in zip(header, longest):
+        width = stringWidth(column, 'Helvetica-Bold', 14)
+        for value in values:
+            width = max(width, max(stringWidth(line, 'Helvetica', 10) for line in value.split('\n')))
+        widths.append(width + PDF_CELL_PADDING)
+    total = sum(widths)
+    if total > available_width:
+        widths = [width * available_width / total for width in widths]
+    return widths
+
+
+def _pdf_row_heights(header, col_widths):
+    """Header height, single-line row height and extra height per line, as laid out by Table"""
+    def height(rows):
+        return Table(rows, colWidths=col_widths, style=pdf_table_style()).wrap(0, 0)[1]
+    blank = [''] * len(header)
+    header_height = height([header])
+    row_height = height([header, blank]) - header_height
+    line_height = height([header, ['\n'] + blank[1:]]) - header_height - row_height
+    return header_height, row_height, line_height
+
+
+def pdf_table_flowables(chunk_source, available_width, available_height, first_height=None):
+    """
+    Yield the table as one Table per page.
+
+    chunk_source is called twice for fresh chunk iterators: once to size
+    the columns from the whole table, once for the rows. Rows are packed
+    into blocks that exactly fill a frame of available_height (the first
+    one first_height, below whatever precedes the table), each block with
+    the header row on top and all sharing the column widths and
+    pdf_table_style(), so the blocks read as one table with its header
+    repeated on every page while reportlab lays out only a page's worth at
+    a time.
+    """
+    col_widths = _pdf_column_widths(chunk_source, available_width)
+    if col_widths is None:
+        return
+    header = None
+    # Leave a little room for rounding in reportlab's frame arithmetic
+    space = (first_height or available_height) - 1
+    block = []
+    yielded = False
+    for chunk in chunk_source():
+        if header is None:
+            header = [str(column) for column in chunk.columns]
+            header_height, row_height, line_height = _pdf_row_heights(header, col_widths)
+            used = header_height
+        rows = chunk.values.tolist()
+        extra_lines = [0] * len(rows)
+        for i in range(len(header)):
+            counts = _cell_series(chunk.iloc[:, i]).str.count('\n').tolist()
+            extra_lines = [max(a, b) for a, b in zip(extra_lines, counts)]
+        for row, extra in zip(rows, extra_lines):
+            height = row_height + extra * line_height
+            if block and used + height > space:
+                yield Table([header] + block, colWidths=col_widths, repeatRows=1, style=pdf_table_style())
+                yielded = True
+                block = []
+                used = header_height
+                space = available_height - 1
+            block.append(row)
+            used += height
+    if block or not yielded:
+        yield Table([header] + block, colWidths=col_widths, repeatRows=1, style=pdf_table_style())
+
+
+# Characters python-docx refuses to put in a document
+WORD_INVALID_XML_CHARS = r'[\x00-\x08\x0b\x0c\x0e-\x1f]'
+
+
+def _word_cell_runs(values):
+    """Turn a Series of cell strings into <w:r> run XML, like setting cell.text"""
+    return (
+        '<w:r><w:t xml:space="preserve">'
+        + values.str.replace(WORD_INVALID_XML_CHARS, '', regex=True)
+        .str.replace('&', '&amp;', regex=False)
+        .str.replace('<', '&lt;', regex=False)
+        .str.replace('>', '&gt;', regex=False)
+        .str.replace('\t', '</w:t><w:tab/><w:t xml:space="preserve">', regex=False)
+        .str.replace(r'\r\n|\r|\n', '</w:t><w:br/><w:t xml:space="preserve">', regex=True)
+        + '</w:t></w:r>'
+    )
+
+
+def add_word_table(doc, chunks, style='Table Grid'):
+    """
+    Add a table holding DataFrame chunks to a python-docx Document.
+
+    Only the header row goes through python-docx's cell API. Body rows are
+    rendered to <w:tr> XML one chunk at a time with vectorised string
+    operations and parsed in a single call, which avoids creating python-docx
+    row and cell objects for every value.
+    """
+    table = None
+    for chunk in chunks:
+        if table is None:
+            table = doc.add_table(rows=1, cols=len(chunk.columns))
+            table.style = style
+            for i, column in enumerate(chunk.columns):
+                table.cell(0, i).text = str(column)
+            tbl = table._tbl
+            cell_prefixes = [
+                f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{grid_col.w}"/></w:tcPr><w:p>'
+                for grid_col in tbl.tblGrid.gridCol_lst
+            ]
+        if not len(chunk):
+            continue
+
+        # Column by column, as DataFrame.map needs pandas 2.1
+        text = chunk.apply(_cell_series)
+        rows = pd.Series('<w:tr>', index=text.index)
+        for i, prefix in enumerate(cell_prefixes):
+            rows = rows + prefix + _word_cell_runs(text.iloc[:, i]) + '</w:p></w:tc>'
+        rows_xml = f"<w:tbl {nsdecls('w')}>{''.join(rows + '</w:tr>')}</w:tbl>"
+        tbl.extend(parse_xml(rows_xml))
+    return table
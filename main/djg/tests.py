@@ -1,3 +1,988 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from . import batch, excel, formats, pdf_text
+from .buffers import SourceBuffer, SourcePath
+from .cache import ConversionCache
+from .downloads import parse_range, serve_file
+from .jobs import DONE, FAILED, PENDING, RUNNING, ConversionJobQueue, JobStore, QueueFullError
+from .uploads import sniff
+
+
+class TempDirMixin:
+    """A scratch directory removed after each test"""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+
+class JobStoreTests(TempDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = JobStore(self.tmp)
+
+    def test_active_count_spans_processes(self):
+        # Jobs queued by other workers are only visible through the store
+        self.store.create('csv', 'pdf', 'a.csv')
+        running = self.store.create('csv', 'pdf', 'b.csv')
+        self.store.update(running['job_id'], status=RUNNING)
+        done = self.store.create('csv', 'pdf', 'c.csv')
+        self.store.update(done['job_id'], status=DONE, finished_at=time.time())
+        self.assertEqual(self.store.active_count(), 2)
+
+    def test_active_count_reads_no_job_files(self):
+        job = self.store.create('csv', 'pdf', 'a.csv')
+        self.store.create('csv', 'pdf', 'b.csv')
+        self.store.update(job['job_id'], status=FAILED, finished_at=time.time())
+        with mock.patch.object(JobStore, 'get', side_effect=AssertionError):
+            self.assertEqual(self.store.active_count(), 1)
+        self.store.delete(job['job_id'])
+        self.assertEqual(self.store.active_count(), 1)
+
+    @override_settings(CONVERTER_JOB_MAX_QUEUED=1)
+    def test_submit_rejects_past_shared_capacity(self):
+        queue = ConversionJobQueue()
+        with override_settings(CONVERTER_JOB_DIR=self.tmp):
+            self.store.create('csv', 'pdf', 'other-worker.csv')
+            job = self.store.create('csv', 'pdf', 'a.csv')
+            with self.assertRaises(QueueFullError):
+                queue.submit(job['job_id'], 'a.csv', 'csv', 'pdf')
+        self.assertIsNone(queue._executor)
+
+    def test_purge_keeps_running_jobs(self):
+        old = time.time() - 3600
+        running = self.store.create('csv', 'pdf', 'a.csv')
+        self.store.update(running['job_id'], status=RUNNING, created_at=old)
+        finished = self.store.create('csv', 'pdf', 'b.csv')
+        self.store.update(finished['job_id'], status=DONE, created_at=old, finished_at=old)
+        recent = self.store.create('csv', 'pdf', 'c.csv')
+        self.store.update(recent['job_id'], status=DONE, created_at=old, finished_at=time.time())
+
+        self.store.purge_expired(60)
+
+        self.assertIsNotNone(self.store.get(running['job_id']))
+        self.assertIsNone(self.store.get(finished['job_id']))
+        self.assertIsNotNone(self.store.get(recent['job_id']))
+
+    @override_settings(CONVERTER_JOB_MAX_QUEUED=2, CONVERTER_JOB_TIMEOUT=10)
+    def test_abandoned_jobs_are_purged_and_not_counted(self):
+        job = self.store.create('csv', 'pdf', 'a.csv')
+        self.store.update(job['job_id'], status=RUNNING, created_at=time.time() - 3600)
+        self.assertEqual(self.store.active_count(), 0)
+        self.store.purge_expired(60)
+        self.assertIsNone(self.store.get(job['job_id']))
+
+
+class ConversionCacheTests(TempDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = ConversionCache()
+        settings_override = override_settings(CONVERTER_CACHE_DIR=self.tmp, CONVERTER_CACHE_MAX_BYTES=25)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def put(self, key, data, age):
+        path = self.cache.put_bytes(key, data)
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    def test_evicts_least_recently_used(self):
+        self.put('a', b'a' * 10, age=30)
+        self.put('b', b'b' * 10, age=20)
+        # A hit makes 'a' the most recently used entry
+        self.cache.open('a').close()
+        self.cache.put_bytes('c', b'c' * 10)
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+    def test_open_entry_survives_eviction(self):
+        self.cache.put_bytes('a', b'a' * 20)
+        with self.cache.open('a') as cached:
+            self.cache.put_bytes('b', b'b' * 20)
+            self.assertIsNone(self.cache.get('a'))
+            self.assertEqual(cached.read(), b'a' * 20)
+
+    def test_counts_hits_and_misses(self):
+        self.cache.put_bytes('a', b'a')
+        self.cache.open('a').close()
+        self.assertIsNone(self.cache.open('missing'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+
+def write_pdf(path, pages):
+    """A PDF with one line of text on each of `pages` pages"""
+    from reportlab.pdfgen import canvas
+    pdf = canvas.Canvas(path)
+    for page in range(pages):
+        pdf.drawString(72, 720, f"page {page}")
+        pdf.showPage()
+    pdf.save()
+
+
+class PdfTextTests(TempDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            CONVERTER_PDF_WORKERS=2, CONVERTER_PDF_PARALLEL_MIN_PAGES=2,
+            CONVERTER_CACHE_MAX_BYTES=0, CONVERTER_JOB_DIR=os.path.join(self.tmp, 'jobs'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(pdf_text._reset_executor)
+        self.addCleanup(lambda: pdf_text._executor and pdf_text._executor.shutdown())
+
+    def test_extracts_pages_in_parallel(self):
+        path = os.path.join(self.tmp, 'a.pdf')
+        write_pdf(path, 5)
+        pages = pdf_text.extract_pages(path)
+        self.assertEqual([page.strip() for page in pages], [f"page {n}" for n in range(5)])
+        self.assertIsNotNone(pdf_text._executor)
+
+    def test_buffer_pages_are_cached_by_content_hash(self):
+        path = os.path.join(self.tmp, 'a.pdf')
+        write_pdf(path, 2)
+        with open(path, 'rb') as f:
+            data = f.read()
+        with override_settings(CONVERTER_CACHE_DIR=os.path.join(self.tmp, 'cache'), CONVERTER_CACHE_MAX_BYTES=10 ** 7):
+            pages = pdf_text.extract_pages(SourceBuffer(data, pdf_text._hash_file(path)))
+            with mock.patch('djg.pdf_text.PyPDF2') as pypdf:
+                # The upload's hash is used as given, and a path with the
+                # same bytes shares the entry
+                self.assertEqual(pdf_text.extract_pages(SourceBuffer(b'', pdf_text._hash_file(path))), pages)
+                self.assertEqual(pdf_text.extract_pages(path), pages)
+            pypdf.PdfReader.assert_not_called()
+
+    def test_known_hash_of_a_path_is_used(self):
+        path = os.path.join(self.tmp, 'a.pdf')
+        write_pdf(path, 2)
+        content_hash = pdf_text._hash_file(path)
+        with override_settings(CONVERTER_CACHE_DIR=os.path.join(self.tmp, 'cache'), CONVERTER_CACHE_MAX_BYTES=10 ** 7):
+            pages = pdf_text.extract_pages(path)
+            with mock.patch('djg.pdf_text._hash_file') as hash_file:
+                self.assertEqual(pdf_text.extract_pages(SourcePath(path, content_hash)), pages)
+            hash_file.assert_not_called()
+
+    def test_job_after_sync_extraction(self):
+        # The sync conversion leaves a page pool in this process; the forked
+        # job worker must not try to use it
+        path = os.path.join(self.tmp, 'a.pdf')
+        write_pdf(path, 4)
+        pdf_text.extract_pages(path)
+
+        queue = ConversionJobQueue()
+        self.addCleanup(lambda: queue._executor and queue._executor.shutdown(wait=False, cancel_futures=True))
+        job = queue.store.create('pdf', 'txt', 'a.pdf')
+        queue.submit(job['job_id'], path, 'pdf', 'txt')
+
+        deadline = time.monotonic() + 30
+        while queue.store.get(job['job_id'])['status'] not in (DONE, FAILED):
+            self.assertLess(time.monotonic(), deadline, "conversion job hung")
+            time.sleep(0.05)
+        job = queue.store.get(job['job_id'])
+        self.assertEqual(job['status'], DONE, job.get('error'))
+        with open(job['result_path'], encoding='utf-8') as f:
+            self.assertIn('page 3', f.read())
+
+
+def write_xlsx(path, rows, dimension=None):
+    """Write rows to a one-sheet workbook, optionally recording a wrong dimension"""
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(path)
+    if dimension:
+        with zipfile.ZipFile(path) as archive:
+            members = {name: archive.read(name) for name in archive.namelist()}
+        sheet = 'xl/worksheets/sheet1.xml'
+        members[sheet] = re.sub(rb'<dimension ref="[^"]*"', f'<dimension ref="{dimension}"'.encode(), members[sheet])
+        with zipfile.ZipFile(path, 'w') as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+
+
+@override_settings(CONVERTER_EXCEL_ENGINE='openpyxl')
+class ExcelChunkTests(TempDirMixin, SimpleTestCase):
+
+    rows = [['a', 'b'], [1, 2], [3, 4], [5, 6, 7], [8, 9]]
+
+    def chunks(self, dimension=None, buffer=False):
+        path = os.path.join(self.tmp, 'sheet.xlsx')
+        write_xlsx(path, self.rows, dimension)
+        if buffer:
+            with open(path, 'rb') as f:
+                return list(excel.iter_excel_chunks(SourceBuffer(f.read()), 'Sheet', chunk_rows=2))
+        return list(excel.iter_excel_chunks(path, 'Sheet', chunk_rows=2))
+
+    def test_later_wider_rows_widen_the_columns(self):
+        chunks = self.chunks()
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2])
+        self.assertEqual(list(chunks[1].iloc[0]), [5, 6, 7])
+        self.assertEqual(list(chunks[0].columns), list(chunks[1].columns))
+
+    def test_rows_wider_than_recorded_are_kept(self):
+        self.rows = [['a', 'b'], [1, 2], [3, 4], [5, 6], [7, 8, 9]]
+        for buffer in (False, True):
+            with self.subTest(buffer=buffer):
+                chunks = self.chunks(dimension='A1:B5', buffer=buffer)
+                self.assertEqual([len(chunk) for chunk in chunks], [2, 2])
+                self.assertEqual(list(chunks[1].iloc[1]), [7, 8, 9])
+                self.assertEqual(list(chunks[0].columns), list(chunks[1].columns))
+
+    def test_recorded_width_beyond_the_cells_is_ignored(self):
+        self.rows = [['a', 'b'], [1, 2], [3, 4], [5, 6]]
+        chunks = self.chunks(dimension='A1:F4')
+        self.assertEqual(list(chunks[0].columns), ['a', 'b'])
+
+    def test_header_only_sheet(self):
+        self.rows = [['a', 'b']]
+        chunks = self.chunks()
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(list(chunks[0].columns), ['a', 'b'])
+
+
+def zip_upload(name, members):
+    """An uploaded zip holding {filename: bytes}"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for filename, data in members.items():
+            archive.writestr(filename, data)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(PASSPORT_BATCH_MAX_BYTES=1000)
+class ReadUploadsTests(SimpleTestCase):
+
+    def test_expands_zips_and_skips_other_members(self):
+        uploads = batch.read_uploads([
+            zip_upload('a.zip', {'x/1.jpg': b'1' * 10, 'notes.txt': b'text'}),
+            SimpleUploadedFile('2.png', b'2' * 10),
+        ])
+        self.assertEqual(uploads, [('1.jpg', b'1' * 10), ('2.png', b'2' * 10)])
+
+    def test_total_unzipped_size_is_limited(self):
+        # Each member is under the per-file limit, and the zip itself is
+        # tiny, but together they inflate past the batch limit
+        upload = zip_upload('bomb.zip', {f"{i}.jpg": bytes(600) for i in range(2)})
+        self.assertLess(upload.size, 1000)
+        with self.assertRaisesMessage(batch.BatchError, 'of photos per batch'):
+            batch.read_uploads([upload])
+
+    def test_plain_files_count_towards_the_limit(self):
+        with self.assertRaises(batch.BatchError):
+            batch.read_uploads([
+                zip_upload('a.zip', {'1.jpg': bytes(600)}),
+                SimpleUploadedFile('2.jpg', bytes(600)),
+            ])
+
+
+class RenderBatchTests(SimpleTestCase):
+
+    def test_process_pool_renders_like_threads(self):
+        import cv2
+        import numpy as np
+        from .layout import get_layout
+        rng = np.random.default_rng(0)
+        uploads = [
+            (f"{i}.jpg", cv2.imencode('.jpg', rng.integers(0, 256, (120, 90, 3), dtype=np.uint8))[1].tobytes())
+            for i in range(3)
+        ] + [('notes.jpg', b'not an image')]
+        layout = get_layout('4x6', 'eu')
+
+        results = {}
+        with mock.patch.dict(batch._executors, clear=True):
+            try:
+                for kind in ('process', 'thread'):
+                    sheets, skipped = batch.render_batch(
+                        uploads, layout, 4, mixed=True, executor=batch.get_executor(kind),
+                    )
+                    results[kind] = (list(sheets), skipped)
+            finally:
+                for executor in batch._executors.values():
+                    executor.shutdown()
+
+        sheets, skipped = results['process']
+        self.assertEqual(skipped, ['notes.jpg'])
+        self.assertEqual([name for name, _ in sheets], ['sheet_001.jpg', 'sheet_002.jpg'])
+        self.assertEqual(results['process'], results['thread'])
+
+
+class ParseRangeTests(SimpleTestCase):
+
+    def test_ranges(self):
+        cases = [
+            ('bytes=0-4', (0, 4)),
+            ('bytes=5-', (5, 9)),
+            ('bytes=-3', (7, 9)),
+            ('bytes=-30', (0, 9)),
+            ('bytes=8-100', (8, 9)),
+        ]
+        for header, expected in cases:
+            self.assertEqual(parse_range(header, 10), expected, header)
+
+    def test_ignored_headers(self):
+        for header in (None, '', 'bytes=-', 'bytes=4-2', 'bytes=0-1,3-4', 'items=0-1', 'bytes=a-b'):
+            self.assertIsNone(parse_range(header, 10), header)
+
+    def test_unsatisfiable(self):
+        for header, size in (('bytes=10-', 10), ('bytes=-0', 10), ('bytes=-5', 0)):
+            with self.assertRaises(ValueError):
+                parse_range(header, size)
+
+
+class ServeFileTests(TempDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.temp_file('out.txt', b'0123456789')
+        self.factory = RequestFactory()
+
+    def temp_file(self, name, data=b'x'):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def serve(self, cleanup=(), **headers):
+        request = self.factory.get('/', headers=headers)
+        return serve_file(request, self.path, 'text/plain', 'out.txt', cleanup)
+
+    def read(self, response):
+        try:
+            return b''.join(response.streaming_content)
+        finally:
+            response.close()
+
+    def test_whole_file(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.read(response), b'0123456789')
+
+    def test_partial_content(self):
+        response = self.serve(Range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+        self.assertEqual(self.read(response), b'2345')
+
+    def test_unsatisfiable_range_removes_cleanup(self):
+        response = self.serve(cleanup=[self.path], Range='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_if_range(self):
+        mtime = http_date(os.stat(self.path).st_mtime)
+        response = self.serve(Range='bytes=2-5', If_Range=mtime)
+        self.assertEqual(response.status_code, 206)
+        self.read(response)
+        # The file changed since the client's first part: send all of it
+        response = self.serve(Range='bytes=2-5', If_Range=http_date(0))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read(response), b'0123456789')
+
+    def test_cleanup_on_close(self):
+        other = self.temp_file('upload.csv')
+        response = self.serve(cleanup=[other, self.path])
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(self.read(response), b'0123456789')
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(other))
+
+    @override_settings(CONVERTER_DOWNLOAD_MODE='x-sendfile')
+    def test_proxy_sends_files_that_outlive_the_request(self):
+        upload = self.temp_file('upload.csv')
+        response = self.serve(cleanup=[upload])
+        self.assertEqual(response['X-Sendfile'], self.path)
+        self.assertFalse(os.path.exists(upload))
+
+    @override_settings(CONVERTER_DOWNLOAD_MODE='x-sendfile')
+    def test_temporary_files_are_streamed_in_proxy_modes(self):
+        response = self.serve(cleanup=[self.path])
+        self.assertNotIn('X-Sendfile', response)
+        self.assertEqual(self.read(response), b'0123456789')
+        self.assertFalse(os.path.exists(self.path))
+
+    @override_settings(CONVERTER_DOWNLOAD_MODE='x-accel-redirect', CONVERTER_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_accel_redirect_is_relative_to_the_private_root(self):
+        with override_settings(CONVERTER_PRIVATE_ROOT=self.tmp):
+            response = self.serve()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/out.txt')
+
+
+class StreamedTableTests(TempDirMixin, SimpleTestCase):
+    """A table converted in chunks comes out as it does when loaded whole"""
+
+    csv_data = b'id,name,price\n1,a,1.5\n2,,2.25\n3,c,\n4,d,10\n5,e,3\n'
+
+    def convert(self, target_format, chunk_rows):
+        source = SourceBuffer(self.csv_data)
+        output = os.path.join(self.tmp, f"{chunk_rows}{formats.EXTENSIONS[target_format][0]}")
+        with override_settings(CONVERTER_CSV_CHUNK_ROWS=chunk_rows):
+            content = formats.read(source, 'csv')
+            self.assertEqual(content.frame() is None, chunk_rows < 5)
+            formats.write(content, output, target_format)
+        return output
+
+    def test_txt_is_byte_identical(self):
+        with open(self.convert('txt', 100), 'rb') as small, open(self.convert('txt', 2), 'rb') as streamed:
+            self.assertEqual(small.read(), streamed.read())
+
+    def test_excel_has_the_same_cells(self):
+        import pandas as pd
+        pd.testing.assert_frame_equal(
+            pd.read_excel(self.convert('excel', 100)), pd.read_excel(self.convert('excel', 2))
+        )
+
+
+class SniffTests(SimpleTestCase):
+
+    heads = {
+        '.pdf': b'%PDF-1.4\n',
+        '.xlsx': b'PK\x03\x04rest',
+        '.docx': b'PK\x05\x06',
+        '.xls': b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1rest',
+        '.doc': b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1rest',
+        '.csv': 'a,b\n\u00e9,2\n'.encode(),
+        '.txt': 'caf\u00e9'.encode()[:-1],  # cut off mid-character
+    }
+
+    def test_accepts_matching_content(self):
+        for ext, head in self.heads.items():
+            with self.subTest(ext):
+                self.assertIsNone(sniff(f"file{ext.upper()}", head))
+
+    def test_rejects_mismatched_content(self):
+        for ext in self.heads:
+            with self.subTest(ext):
+                head = b'\x00\x01binary' if ext in ('.csv', '.txt') else b'plain text'
+                self.assertEqual(sniff(f"file{ext}", head), f"File content does not match its {ext} extension")
+        self.assertEqual(sniff('file.txt', b'\xff\xfe\xfdabc'), "File content does not match its .txt extension")
+
+    def test_rejects_unsupported_extensions(self):
+        self.assertEqual(sniff('file.exe', b'MZ'), 'Unsupported source file format')
+        with override_settings(ALLOWED_UPLOAD_EXTENSIONS=['.csv']):
+            self.assertEqual(sniff('file.pdf', b'%PDF-'), 'Unsupported source file format')
+
+
+class HashingUploadHandlerTests(TempDirMixin, SimpleTestCase):
+    """HashingFileUploadHandler as the converter view drives it"""
+
+    csv = b'a,b\n' + b''.join(f"{i},{i * i}\n".encode() for i in range(400))
+
+    def setUp(self):
+        super().setUp()
+        self.spool_dir = os.path.join(self.tmp, 'spool')
+        os.makedirs(self.spool_dir)
+        settings_override = override_settings(
+            FILE_UPLOAD_TEMP_DIR=self.spool_dir,
+            CONVERTER_PRIVATE_ROOT=os.path.join(self.tmp, 'private'),
+            CONVERTER_CACHE_DIR=os.path.join(self.tmp, 'cache'),
+            CONVERTER_IN_MEMORY_MAX_BYTES=1000,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch('djg.views.conversion_cache', ConversionCache())
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def convert(self, name, data, target_format='txt'):
+        response = self.client.post(reverse('converter'), {
+            'file': SimpleUploadedFile(name, data), 'target_format': target_format,
+        })
+        if response.streaming:
+            b''.join(response.streaming_content)
+        response.close()
+        return response
+
+    def converted_sources(self):
+        """Spy on the on-disk conversion, recording where each source was"""
+        from .views import ConverterView
+        convert_file = ConverterView._convert_file
+        sources = []
+
+        def spy(view, source_path, *args, **kwargs):
+            sources.append((source_path, os.path.exists(source_path)))
+            return convert_file(view, source_path, *args, **kwargs)
+        patcher = mock.patch.object(ConverterView, '_convert_file', autospec=True, side_effect=spy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return sources
+
+    def assertCachedUnder(self, data, source_format, target_format):
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertIsNotNone(self.cache.get(self.cache.make_key(digest, source_format, target_format)))
+
+    def test_small_upload_is_hashed_in_memory(self):
+        data = self.csv[:200]
+        sources = self.converted_sources()
+        response = self.convert('small.csv', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sources, [])
+        self.assertCachedUnder(data, 'csv', 'txt')
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_large_upload_spills_to_its_own_spool_directory(self):
+        self.assertGreater(len(self.csv), 1000)
+        sources = self.converted_sources()
+        response = self.convert('large.csv', self.csv)
+        self.assertEqual(response.status_code, 200)
+        [(source_path, existed)] = sources
+        self.assertTrue(existed)
+        self.assertEqual(os.path.dirname(os.path.dirname(source_path)), self.spool_dir)
+        self.assertEqual(os.path.basename(source_path), 'large.csv')
+        self.assertEqual(source_path.content_hash, hashlib.sha256(self.csv).hexdigest())
+        self.assertCachedUnder(self.csv, 'csv', 'txt')
+        # The upload, its directory and the conversion output are all gone
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    @override_settings(MAX_UPLOAD_SIZE=2000)
+    def test_oversized_upload_is_rejected_and_removed(self):
+        data = self.csv * 2
+        with mock.patch('djg.uploads.HashingFileUploadHandler.chunk_size', 500):
+            response = self.convert('big.csv', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('File is larger than', response.json()['error'])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_mismatched_content_is_rejected_before_spooling(self):
+        response = self.convert('report.pdf', self.csv)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'File content does not match its .pdf extension')
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+
+def xlsx_upload(name, sheets):
+    """An .xlsx upload with a sheet per (title, rows) item of sheets"""
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        worksheet = workbook.create_sheet(title)
+        for row in rows:
+            worksheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(CONVERTER_CACHE_MAX_BYTES=0)
+class ExcelSheetViewTests(SimpleTestCase):
+
+    sheets = {'First': [['a'], [1]], 'Second': [['b'], [2]]}
+
+    def post(self, url_name='converter', **data):
+        data.setdefault('target_format', 'csv')
+        return self.client.post(reverse(url_name), {'file': xlsx_upload('book.xlsx', self.sheets), **data})
+
+    def test_first_sheet_by_default(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'a\n1\n')
+
+    def test_sheet_by_name_or_position(self):
+        self.assertEqual(self.post(sheet='Second').content, b'b\n2\n')
+        self.assertEqual(self.post(sheet='1').content, b'b\n2\n')
+
+    def test_all_sheets(self):
+        response = self.post(all_sheets='true')
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), ['book_First_converted.csv', 'book_Second_converted.csv'])
+            self.assertEqual(archive.read('book_Second_converted.csv'), b'b\n2\n')
+
+    def test_unknown_sheet(self):
+        for url_name in ('converter', 'converter_multi'):
+            with self.subTest(url_name):
+                response = self.post(url_name, sheet='Third', target_formats='csv')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(
+                    response.json()['error'], "Sheet 'Third' not found, the workbook has: First, Second"
+                )
+
+    def test_sheet_for_other_formats(self):
+        upload = SimpleUploadedFile('a.csv', b'a\n1\n')
+        response = self.client.post(reverse('converter'), {'file': upload, 'target_format': 'txt', 'sheet': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConversionJobViewTests(TempDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            CONVERTER_CACHE_MAX_BYTES=0, CONVERTER_JOB_DIR=os.path.join(self.tmp, 'jobs'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.queue = ConversionJobQueue()
+        self.addCleanup(lambda: self.queue._executor and self.queue._executor.shutdown(wait=False, cancel_futures=True))
+        patcher = mock.patch('djg.views.job_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_job_lifecycle(self):
+        upload = SimpleUploadedFile('a.csv', b'a,b\n1,2\n')
+        response = self.client.post(reverse('converter'), {'file': upload, 'target_format': 'txt', 'mode': 'async'})
+        self.assertEqual(response.status_code, 202)
+        submitted = response.json()
+        self.assertEqual(submitted['status'], PENDING)
+
+        deadline = time.monotonic() + 30
+        while True:
+            status = self.client.get(submitted['status_url']).json()
+            if status['status'] in (DONE, FAILED):
+                break
+            self.assertLess(time.monotonic(), deadline, "conversion job hung")
+            time.sleep(0.05)
+        self.assertEqual(status['status'], DONE, status.get('error'))
+        self.assertNotIn('result_path', status)
+        self.assertEqual(status['result_url'], submitted['result_url'])
+
+        response = self.client.get(submitted['result_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b' a  b\n 1  2')
+        response.close()
+
+    def test_unfinished_and_unknown_jobs(self):
+        job = self.queue.store.create('csv', 'txt', 'a.csv')
+        response = self.client.get(reverse('converter_job_result', args=[job['job_id']]))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], PENDING)
+        for url_name in ('converter_job_status', 'converter_job_result'):
+            response = self.client.get(reverse(url_name, args=['missing']))
+            self.assertEqual(response.status_code, 404)
+
+    def test_all_sheets_cannot_be_queued(self):
+        response = self.client.post(reverse('converter'), {
+            'file': xlsx_upload('book.xlsx', {'First': [['a']]}), 'target_format': 'csv',
+            'mode': 'async', 'all_sheets': 'true',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(self.queue.store.jobs()), [])
+
+
+def document_parts(data):
+    """
+    A converted document for comparison: its bytes, or for an Office zip
+    each member's bytes, with the created/modified times (to the second)
+    that openpyxl stamps into the core properties masked
+    """
+    if not data.startswith(b'PK'):
+        return data
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        return {
+            name: re.sub(rb'(<dcterms:(created|modified)\b[^>]*>)[^<]*', rb'\1', archive.read(name))
+            for name in archive.namelist()
+        }
+
+
+class InMemoryConversionTests(TempDirMixin, SimpleTestCase):
+
+    def test_memory_and_disk_outputs_match(self):
+        from .views import ConverterView
+        table = formats.read(io.BytesIO('name,n\na,1\nb & c,2\nd\u00e9j\u00e0,3\n'.encode()), 'csv')
+        sources = {}
+        for source_format in formats.EXTENSIONS:
+            output = io.BytesIO()
+            formats.write(table, output, source_format)
+            sources[source_format] = output.getvalue()
+
+        view = ConverterView()
+        # Without invariant mode reportlab stamps each PDF with the time and a random ID
+        cache_dir = os.path.join(self.tmp, 'cache')
+        with mock.patch('reportlab.rl_config.invariant', 1), override_settings(CONVERTER_CACHE_DIR=cache_dir):
+            for source_format, data in sources.items():
+                source_path = os.path.join(self.tmp, f"source{formats.EXTENSIONS[source_format][0]}")
+                with open(source_path, 'wb') as f:
+                    f.write(data)
+                for target_format in formats.EXTENSIONS:
+                    if target_format == source_format:
+                        continue
+                    with self.subTest(source=source_format, target=target_format):
+                        with open(view._convert_file(source_path, source_format, target_format), 'rb') as f:
+                            on_disk = f.read()
+                        in_memory = view._convert_bytes(data, source_format, target_format)
+                        self.assertEqual(document_parts(in_memory), document_parts(on_disk))
+
+
+class FormatRegistryTests(SimpleTestCase):
+
+    def write(self, content, format_name):
+        output = io.BytesIO()
+        formats.write(content, output, format_name)
+        output.seek(0)
+        return output
+
+    def test_tables_round_trip(self):
+        import pandas as pd
+        table = formats.read(io.BytesIO(b'name,n\na,1\nb,2\n'), 'csv')
+        self.assertEqual(table.kind, 'table')
+        for format_name in ('csv', 'excel'):
+            with self.subTest(format_name):
+                content = formats.read(self.write(table, format_name), format_name)
+                self.assertEqual(content.kind, 'table')
+                pd.testing.assert_frame_equal(content.frame(), table.frame())
+
+    def test_text_round_trips(self):
+        text = formats.read(io.BytesIO('first line\nsecond, line\n'.encode()), 'txt')
+        self.assertEqual(text.kind, 'text')
+        self.assertEqual(formats.read(self.write(text, 'txt'), 'txt').text, text.text)
+        # Word output starts with the title as a heading
+        self.assertEqual(formats.read(self.write(text, 'word'), 'word').lines(), [text.title] + text.lines())
+        rows = [row.strip() for row in self.write(text, 'csv').read().decode('utf-8').splitlines()]
+        self.assertEqual(rows[1:], ['first line', '"second, line"'])
+
+    def test_unknown_formats(self):
+        text = formats.TextContent('Title', 'text', ['text'])
+        with self.assertRaisesMessage(NotImplementedError, 'Reading odt is not implemented'):
+            formats.read(io.BytesIO(b'text'), 'odt')
+        with self.assertRaisesMessage(NotImplementedError, 'Writing text content as odt is not implemented'):
+            formats.write(text, io.BytesIO(), 'odt')
+
+
+class MultiFormatConverterViewTests(TempDirMixin, SimpleTestCase):
+
+    csv = b'name,n\na,1\nb,2\n'
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            FILE_UPLOAD_TEMP_DIR=self.tmp,
+            CONVERTER_PRIVATE_ROOT=os.path.join(self.tmp, 'private'),
+            CONVERTER_CACHE_DIR=os.path.join(self.tmp, 'cache'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def convert(self, upload, **fields):
+        response = self.client.post(reverse('converter_multi'), {'file': upload, **fields})
+        self.assertEqual(response.status_code, 200, getattr(response, 'content', b''))
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        response.close()
+        return archive
+
+    def test_one_member_per_target_parsed_once(self):
+        for in_memory_max_bytes in (1024, 0):
+            # A cache of its own, so the second upload is converted again
+            settings_override = override_settings(
+                CONVERTER_IN_MEMORY_MAX_BYTES=in_memory_max_bytes,
+                CONVERTER_CACHE_DIR=os.path.join(self.tmp, f"cache{in_memory_max_bytes}"),
+            )
+            with self.subTest(in_memory=bool(in_memory_max_bytes)), settings_override, \
+                    mock.patch('djg.formats.read', wraps=formats.read) as read:
+                archive = self.convert(
+                    SimpleUploadedFile('data.csv', self.csv), target_formats=['excel, txt', 'word', 'EXCEL'],
+                )
+                self.assertEqual(archive.namelist(), [
+                    'data_converted.xlsx', 'data_converted.txt', 'data_converted.docx',
+                ])
+                self.assertEqual(read.call_count, 1)
+                excel_output = formats.read(io.BytesIO(archive.read('data_converted.xlsx')), 'excel')
+                self.assertEqual(excel_output.frame().values.tolist(), [['a', 1], ['b', 2]])
+                self.assertIn('name', archive.read('data_converted.txt').decode('utf-8'))
+
+    def test_all_sheets_for_each_target(self):
+        archive = self.convert(
+            xlsx_upload('book.xlsx', {'First': [['a'], [1]], 'Second': [['b'], [2]]}),
+            target_formats='csv,txt', all_sheets='true',
+        )
+        self.assertEqual(archive.namelist(), [
+            'book_First_converted.csv', 'book_First_converted.txt',
+            'book_Second_converted.csv', 'book_Second_converted.txt',
+        ])
+        self.assertEqual(archive.read('book_Second_converted.csv').decode('utf-8').split(), ['b', '2'])
+
+    def test_invalid_targets(self):
+        for target_formats, error in [
+            ('', 'Target formats not specified'),
+            ('pdf,odt', 'Unsupported target format: odt'),
+            ('pdf,csv', 'Source and target formats are the same'),
+        ]:
+            with self.subTest(target_formats):
+                response = self.client.post(reverse('converter_multi'), {
+                    'file': SimpleUploadedFile('data.csv', self.csv), 'target_formats': target_formats,
+                })
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], error)
+
+
+class PdfTableTests(SimpleTestCase):
+
+    def test_blocks_fit_the_frame_with_the_header_on_each(self):
+        import pandas as pd
+        from .tables import iter_frame_chunks, pdf_table_flowables
+        df = pd.DataFrame({
+            'id': range(200),
+            'note': ['two\nlines' if i % 7 == 0 else f"row {i}" for i in range(200)],
+        })
+        with override_settings(CONVERTER_CSV_CHUNK_ROWS=30):
+            tables = list(pdf_table_flowables(lambda: iter_frame_chunks(df), 400, 500, first_height=300))
+
+        self.assertGreater(len(tables), 2)
+        for i, table in enumerate(tables):
+            self.assertEqual(table._cellvalues[0], ['id', 'note'])
+            self.assertEqual(table._colWidths, tables[0]._colWidths)
+            self.assertLessEqual(table.wrap(400, 500)[1], 300 if i == 0 else 500)
+        self.assertLessEqual(sum(tables[0]._colWidths), 400)
+        rows = [row for table in tables for row in table._cellvalues[1:]]
+        self.assertEqual(rows, df.values.tolist())
+
+
+class WordTableTests(SimpleTestCase):
+
+    def test_cells_round_trip(self):
+        import docx
+        import pandas as pd
+        from .tables import add_word_table
+        values = ['a & b', '<tag> 1 > 0', 'x\ty', 'one\ntwo', 'three\r\nfour', '', 'plain']
+        df = pd.DataFrame({'text': values, 'n': range(len(values))})
+        doc = docx.Document()
+        add_word_table(doc, [df.iloc[:3], df.iloc[3:]])
+        buffer = io.BytesIO()
+        doc.save(buffer)
+
+        table = docx.Document(buffer).tables[0]
+        cells = [[cell.text for cell in row.cells] for row in table.rows]
+        expected = [[value.replace('\r\n', '\n'), str(n)] for n, value in enumerate(values)]
+        self.assertEqual(cells, [['text', 'n']] + expected)
+
+
+
+def nested_loop_positions(paper, photo_name):
+    """(x, y) of each photo in the order the per-slot loop before djg.passport placed them"""
+    from .layout import GAP, PAPER_SIZES, PHOTO_SIZES
+    sheet_w, sheet_h = PAPER_SIZES[paper]
+    photo_w, photo_h = PHOTO_SIZES[photo_name]
+    cols = sheet_w // (photo_w + GAP)
+    rows = sheet_h // (photo_h + GAP)
+    for r in range(rows):
+        for col in range(cols):
+            yield col * (photo_w + GAP), r * (photo_h + GAP)
+
+
+
+class PassportTilingTests(SimpleTestCase):
+
+    def photo(self, photo_name, seed):
+        import numpy as np
+        from .layout import PHOTO_SIZES
+        width, height = PHOTO_SIZES[photo_name]
+        return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    def test_every_copy_count_matches_the_nested_loop(self):
+        import numpy as np
+        from .layout import PAPER_SIZES, PHOTO_SIZES, get_layout
+        from .passport import tile_photos
+        for paper in PAPER_SIZES:
+            for photo_name in PHOTO_SIZES:
+                layout = get_layout(paper, photo_name)
+                photo = self.photo(photo_name, 0)
+                photo_h, photo_w = photo.shape[:2]
+                sheet = np.empty((layout.sheet_size[1], layout.sheet_size[0], 3), dtype=np.uint8)
+                # The loop's sheet for `copies` photos, one more slot each round
+                expected = np.full_like(sheet, 255)
+                positions = list(nested_loop_positions(paper, photo_name))
+                for copies in range(len(positions) + 2):
+                    if 0 < copies <= len(positions):
+                        x, y = positions[copies - 1]
+                        expected[y:y + photo_h, x:x + photo_w] = photo
+                    with self.subTest(paper=paper, photo=photo_name, copies=copies):
+                        sheet.fill(255)
+                        self.assertEqual(tile_photos(sheet, photo, copies, layout), min(copies, len(positions)))
+                        self.assertTrue(np.array_equal(sheet, expected))
+
+    def test_consecutive_placements_continue_mid_row(self):
+        import numpy as np
+        from .layout import get_layout
+        from .passport import tile_photos
+        layout = get_layout('a4', 'passport')
+        first, second = self.photo('passport', 1), self.photo('passport', 2)
+        photo_h, photo_w = first.shape[:2]
+        positions = list(nested_loop_positions('a4', 'passport'))
+        sheet = np.empty((layout.sheet_size[1], layout.sheet_size[0], 3), dtype=np.uint8)
+        # Every slot holds the second photo until the split moves past it
+        expected = np.full_like(sheet, 255)
+        for x, y in positions:
+            expected[y:y + photo_h, x:x + photo_w] = second
+        for split in range(len(positions) + 1):
+            if split:
+                x, y = positions[split - 1]
+                expected[y:y + photo_h, x:x + photo_w] = first
+            with self.subTest(split=split):
+                sheet.fill(255)
+                slot = tile_photos(sheet, first, split, layout)
+                slot += tile_photos(sheet, second, len(positions), layout, start=slot)
+                self.assertEqual(slot, len(positions))
+                self.assertTrue(np.array_equal(sheet, expected))
+
+
+class SheetPoolTests(TempDirMixin, SimpleTestCase):
+
+    def test_buffers_are_reused_white(self):
+        from .layout import SheetPool
+        pool = SheetPool()
+        with pool.sheet((4, 3)) as sheet:
+            self.assertEqual(sheet.shape, (3, 4, 3))
+            self.assertTrue((sheet == 255).all())
+            sheet[:] = 7
+            first = sheet
+        with pool.sheet((4, 3)) as sheet:
+            self.assertIs(sheet, first)
+            self.assertTrue((sheet == 255).all())
+        self.assertEqual(pool.metrics(), {'allocated': 1, 'reused': 1, 'idle': 1})
+
+    @override_settings(PASSPORT_SHEET_POOL_SIZE=1)
+    def test_held_buffers_are_not_shared_and_idle_ones_are_bounded(self):
+        from .layout import SheetPool
+        pool = SheetPool()
+        with pool.sheet((4, 3)) as first, pool.sheet((4, 3)) as second, pool.sheet((2, 2)) as other:
+            self.assertIsNot(first, second)
+            self.assertEqual(other.shape, (2, 2, 3))
+        self.assertEqual(pool.metrics(), {'allocated': 3, 'reused': 0, 'idle': 2})
+
+    def test_requests_do_not_see_earlier_photos(self):
+        import cv2
+        import numpy as np
+        from .layout import SheetPool, get_layout
+        pool = SheetPool()
+        photo = cv2.imencode('.jpg', np.zeros((500, 400, 3), dtype=np.uint8))[1].tobytes()
+        layout = get_layout()
+        photo_w, photo_h = layout.photo_size
+        sheets = []
+        with override_settings(MEDIA_ROOT=self.tmp), mock.patch('djg.views.sheet_pool', pool):
+            for copies in (30, 1):
+                response = self.client.post(reverse('passport_sheet'), {
+                    'photo': SimpleUploadedFile('me.jpg', photo, content_type='image/jpeg'),
+                    'copies': str(copies),
+                })
+                self.assertEqual(response.status_code, 200)
+                name = os.path.basename(response.json()['sheet_url'])
+                sheets.append(cv2.imread(os.path.join(self.tmp, name)))
+
+        self.assertEqual(pool.metrics(), {'allocated': 1, 'reused': 1, 'idle': 1})
+        for copies, sheet in zip((30, 1), sheets):
+            for slot, (x, y) in enumerate(layout.slots):
+                cell = sheet[y:y + photo_h, x:x + photo_w]
+                # JPEG blurs edges, so look at the middle of each slot
+                middle = cell[photo_h // 4:-photo_h // 4, photo_w // 4:-photo_w // 4].mean()
+                self.assertEqual(middle < 128, slot < copies, msg=f"{copies} copies, slot {slot}")
@@ -0,0 +1,208 @@
+"""
+Single-pass upload ingestion for the converter.
+
+HashingFileUploadHandler keeps uploads of up to CONVERTER_IN_MEMORY_MAX_BYTES
+in memory and writes larger ones straight to their own directory,
+FILE_UPLOAD_TEMP_DIR/<uuid>/<name>, hashing them as the chunks arrive. It
+checks the first bytes against the file's extension, so an unsupported or
+mislabeled file is rejected before the rest of it is written. The view
+converts the spooled file where it is instead of copying it.
+"""
+import io
+import os
+import shutil
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from .cache import new_hasher
+
+
+# Bytes read before deciding whether the content matches the extension
+SNIFF_BYTES = 2048
+
+ZIP_MAGIC = (b'PK\x03\x04', b'PK\x05\x06')  # local file header, empty archive
+OLE2_MAGIC = (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',)  # legacy Office documents
+
+
+def _is_pdf(head):
+    # The header may be preceded by junk within the first 1024 bytes
+    return b'%PDF-' in head[:1024]
+
+
+def _is_text(head):
+    """UTF-8 without NUL bytes; a character cut off at the end of head is fine"""
+    if b'\x00' in head:
+        return False
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return e.start >= len(head) - 3 and e.reason == 'unexpected end of data'
+    return True
+
+
+SNIFFERS = {
+    '.pdf': _is_pdf,
+    '.xlsx': lambda head: head.startswith(ZIP_MAGIC),
+    '.docx': lambda head: head.startswith(ZIP_MAGIC),
+    '.xls': lambda head: head.startswith(OLE2_MAGIC),
+    '.doc': lambda head: head.startswith(OLE2_MAGIC),
+    '.csv': _is_text,
+    '.txt': _is_text,
+}
+
+
+def sniff(file_name, head):
+    """
+    Return None if head (the start of a file) fits the file's extension,
+    otherwise the reason it doesn't.
+    """
+    ext = os.path.splitext(file_name.lower())[1]
+    if ext not in settings.ALLOWED_UPLOAD_EXTENSIONS or ext not in SNIFFERS:
+        return 'Unsupported source file format'
+    if not SNIFFERS[ext](head):
+        return f"File content does not match its {ext} extension"
+    return None
+
+
+class HashingUploadedFile(UploadedFile):
+    """
+    An upload spooled to disk by HashingFileUploadHandler, with the SHA-256
+    of its content. Closing it removes the file and its directory.
+    """
+
+    def __init__(self, path, name, content_type, size, charset, content_type_extra=None, content_hash=None):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset, content_type_extra)
+        self.path = path
+        self.content_hash = content_hash
+        self._spooled = True
+
+    def temporary_file_path(self):
+        return self.path
+
+    def move_to(self, directory):
+        """Move the spooled file into directory and return its new path"""
+        os.makedirs(directory, exist_ok=True)
+        self.file.close()
+        target = os.path.join(directory, os.path.basename(self.path))
+        shutil.move(self.path, target)
+        self._remove_dir()
+        self.path = target
+        self._spooled = False
+        self.file = open(target, 'rb')
+        return target
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            if self._spooled:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+                self._remove_dir()
+
+    def _remove_dir(self):
+        # Only removed once empty: conversion outputs may still be written
+        # alongside the upload and are cleaned up by their own owner
+        try:
+            os.rmdir(os.path.dirname(self.path))
+        except OSError:
+            pass
+
+
+class HashingInMemoryUploadedFile(InMemoryUploadedFile):
+    """A small upload kept in memory by HashingFileUploadHandler, with its SHA-256"""
+
+    def __init__(self, *args, content_hash=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.content_hash = content_hash
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """
+    Keep small uploads in memory and spool the rest to
+    FILE_UPLOAD_TEMP_DIR/<uuid>/<name>, hashing and sniffing them in the
+    same pass over the chunks.
+
+    A rejected upload stops the request's upload parsing, and the reason is
+    left on request.upload_error for the view to report.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        # Written to memory until the upload outgrows CONVERTER_IN_MEMORY_MAX_BYTES
+        self.buffer = io.BytesIO()
+        self.spool = None
+        self.hasher = new_hasher()
+        self.head = b''
+        self.sniffed = False
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.MAX_UPLOAD_SIZE:
+            self._reject(f"File is larger than {settings.MAX_UPLOAD_SIZE // (1024 * 1024)}MB")
+        if not self.sniffed:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self._sniff()
+        self.hasher.update(raw_data)
+        if self.spool is None and self.size > settings.CONVERTER_IN_MEMORY_MAX_BYTES:
+            self._spill()
+        if self.spool is None:
+            self.buffer.write(raw_data)
+        else:
+            self.spool.write(raw_data)
+
+    def file_complete(self, file_size):
+        if not self.sniffed:
+            self._sniff()
+        if self.spool is None:
+            self.buffer.seek(0)
+            return HashingInMemoryUploadedFile(
+                self.buffer, self.field_name, self.file_name, self.content_type, file_size,
+                self.charset, self.content_type_extra, content_hash=self.hasher.hexdigest(),
+            )
+        self.spool.close()
+        self.spool = None
+        return HashingUploadedFile(
+            self.path, self.file_name, self.content_type, file_size, self.charset,
+            self.content_type_extra, self.hasher.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, 'buffer'):
+            self._discard()
+
+    def _spill(self):
+        """Move what has been received so far from memory to the spool file"""
+        self.directory = os.path.join(settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(), uuid.uuid4().hex)
+        os.makedirs(self.directory)
+        self.path = os.path.join(self.directory, os.path.basename(self.file_name))
+        self.spool = open(self.path, 'wb')
+        self.spool.write(self.buffer.getvalue())
+        self.buffer = None
+
+    def _sniff(self):
+        self.sniffed = True
+        error = sniff(self.file_name, self.head)
+        if error:
+            self._reject(error)
+
+    def _reject(self, error):
+        self.request.upload_error = error
+        self._discard()
+        # The rest of the body is still read, but only to be thrown away,
+        # so the client gets a normal error response
+        raise StopUpload(connection_reset=False)
+
+    def _discard(self):
+        self.buffer = None
+        if self.spool is not None:
+            self.spool.close()
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -1,9 +1,14 @@
 # djg/urls.py
 from django.urls import path
-from .views import PassportSheetView, ConverterView
+from .views import PassportSheetView, PassportBatchView, ConverterView, MultiFormatConverterView, ConversionJobStatusView, ConversionJobResultView, ConversionCacheStatsView
 
 urlpatterns = [
     path('', PassportSheetView.as_view(), name='home'),  # Root URL shows passport form
     path('photocollage/', PassportSheetView.as_view(), name='passport_sheet'),  # Your existing API
+    path('photocollage/batch/', PassportBatchView.as_view(), name='passport_batch'),
     path('converter/', ConverterView.as_view(), name='converter'),  # New converter endpoint
+    path('converter/multi/', MultiFormatConverterView.as_view(), name='converter_multi'),
+    path('converter/cache/stats/', ConversionCacheStatsView.as_view(), name='converter_cache_stats'),
+    path('converter/jobs/<str:job_id>/', ConversionJobStatusView.as_view(), name='converter_job_status'),
+    path('converter/jobs/<str:job_id>/result/', ConversionJobResultView.as_view(), name='converter_job_result'),
 ]
\ No newline at end of file
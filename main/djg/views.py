@@ -1,7 +1,5 @@
-import cv2
 import os
 import uuid
-import numpy as np
 from django.views import View
 from django.shortcuts import render
 from django.http import JsonResponse
@@ -10,105 +8,117 @@ from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-import pandas as pd
-from io import BytesIO
-from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse
-from django.views import View
-from django.conf import settings
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
-from django.utils.decorators import method_decorator
-from django.views.decorators.csrf import csrf_exempt
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-import openpyxl
-from openpyxl.utils.dataframe import dataframe_to_rows
-from docx import Document
-from docx.shared import Inches
-import PyPDF2
-import csv
-import json
-import tempfile
+import io
+import time
+import zipfile
+from itertools import chain
+from django.urls import reverse
+from . import batch, excel, formats, passport
+from .buffers import SourceBuffer, SourcePath, is_path
+from .cache import conversion_cache, link_or_copy, new_hasher
+from .downloads import serve_bytes, serve_file, serve_zip
+from .jobs import job_queue, QueueFullError, DONE
+from .layout import DEFAULT_PAPER, DEFAULT_PHOTO, PAPER_SIZES, PHOTO_SIZES, get_layout, sheet_pool
+from .uploads import HashingFileUploadHandler, HashingInMemoryUploadedFile, HashingUploadedFile
 
 
-PASSPORT_SIZE = (295, 413)  # (width, height) in pixels approx. passport size at 300dpi
-GAP = 5  # gap between photos in pixels
+def sheet_options(data):
+    """
+    Copy count and layout from the posted form. Raises ValueError with a
+    message for the user when they're invalid.
+    """
+    try:
+        num_copies = int(data.get("copies", "1"))
+    except Exception:
+        raise ValueError("Invalid copy count.")
+    if num_copies < 1 or num_copies > 30:
+        raise ValueError("Choose 1-30 copies.")
+    try:
+        layout = get_layout(data.get("paper", DEFAULT_PAPER), data.get("photo_size", DEFAULT_PHOTO))
+    except KeyError:
+        raise ValueError("Unknown paper or photo size.")
+    return num_copies, layout
 
 
 @method_decorator(csrf_exempt, name='dispatch')  # Remove in production for security
 class PassportSheetView(View):
     def get(self, request):
-        return render(request, "home.html")
+        return render(request, "home.html", {"papers": PAPER_SIZES, "photo_sizes": PHOTO_SIZES})
 
     def post(self, request):
         file = request.FILES.get("photo")
         try:
-            num_copies = int(request.POST.get("copies", "1"))
-            if num_copies < 1 or num_copies > 30:
-                return JsonResponse({"error": "Choose 1-30 copies."}, status=400)
-        except Exception:
-            return JsonResponse({"error": "Invalid copy count."}, status=400)
+            num_copies, layout = sheet_options(request.POST)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
         if not file:
             return JsonResponse({"error": "No photo uploaded"}, status=400)
 
-        # Save uploaded photo temporarily
-        temp_name = f"{uuid.uuid4().hex}.jpg"
-        temp_path = os.path.join(settings.MEDIA_ROOT, temp_name)
-        default_storage.save(temp_name, ContentFile(file.read()))
-
-        # Read photo and validate
-        img = cv2.imread(temp_path)
+        # Decode straight from the upload, without a temporary copy on disk
+        img = passport.decode_image(file.read())
         if img is None:
-            default_storage.delete(temp_name)
             return JsonResponse({"error": "Invalid image file."}, status=400)
 
-        # Center crop to square and resize passport size
-        h, w = img.shape[:2]
-        size = min(h, w)
-        center_y, center_x = h // 2, w // 2
-        cropped = img[center_y - size // 2:center_y + size // 2, center_x - size // 2:center_x + size // 2]
-        passport_img = cv2.resize(cropped, PASSPORT_SIZE)
+        photo = passport.passport_photo(img, layout.photo_size)
+        with sheet_pool.sheet(layout.sheet_size) as sheet:
+            passport.tile_photos(sheet, photo, num_copies, layout)
+            # Encode in memory and store the finished sheet with a single write
+            data = passport.encode_jpeg(sheet)
+        final_name = default_storage.save(f"sheet_{uuid.uuid4().hex}.jpg", ContentFile(data))
 
-        # Prepare A4 sheet at 300 dpi: 2480x3508 pixels (WxH)
-        SHEET_SIZE = (2480, 3508)
-        sheet = np.ones((SHEET_SIZE[1], SHEET_SIZE[0], 3), dtype=np.uint8) * 255
+        url = settings.MEDIA_URL + final_name
+        return JsonResponse({"sheet_url": url})
 
-        # Calculate how many can fit horizontally and vertically (with gap)
-        cols = SHEET_SIZE[0] // (PASSPORT_SIZE[0] + GAP)
-        rows = SHEET_SIZE[1] // (PASSPORT_SIZE[1] + GAP)
-        max_photos = cols * rows
-        to_place = min(num_copies, max_photos)
 
-        c = 0
-        for r in range(rows):
-            for col in range(cols):
-                if c >= to_place:
-                    break
-                y = r * (PASSPORT_SIZE[1] + GAP)
-                x = col * (PASSPORT_SIZE[0] + GAP)
-                sheet[y:y + PASSPORT_SIZE[1], x:x + PASSPORT_SIZE[0]] = passport_img
-                c += 1
-            if c >= to_place:
-                break
+@method_decorator(csrf_exempt, name='dispatch')  # Remove in production for security
+class PassportBatchView(View):
+    """
+    Passport sheets for many photos at once, returned as a streamed zip.
 
-        # Save final sheet image
-        final_name = f"sheet_{uuid.uuid4().hex}.jpg"
-        final_path = os.path.join(settings.MEDIA_ROOT, final_name)
-        cv2.imwrite(final_path, sheet, [int(cv2.IMWRITE_JPEG_QUALITY), 95])
+    POST multipart fields:
+        photos: image files and/or zip archives of images
+        copies, paper, photo_size: as for PassportSheetView, per photo
+        mixed: "true" to fill photos one after another onto shared sheets
+               instead of one sheet per photo
+    """
 
-        # Clean up temp uploaded file
-        default_storage.delete(temp_name)
+    def post(self, request):
+        try:
+            num_copies, layout = sheet_options(request.POST)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        mixed = request.POST.get("mixed", "false").lower() in ("1", "true", "yes", "on")
 
-        url = settings.MEDIA_URL + final_name
-        return JsonResponse({"sheet_url": url})
+        files = request.FILES.getlist("photos") or request.FILES.getlist("photo")
+        if not files:
+            return JsonResponse({"error": "No photos uploaded"}, status=400)
+        try:
+            uploads = batch.read_uploads(files)
+        except batch.BatchError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        sheets, skipped = batch.render_batch(uploads, layout, num_copies, mixed)
+        if len(skipped) == len(uploads):
+            return JsonResponse({"error": "No valid image files.", "skipped": skipped}, status=400)
+        if skipped:
+            sheets = chain(sheets, [("skipped.txt", "\n".join(skipped).encode("utf-8"))])
 
+        return serve_zip(sheets, "passport_sheets.zip")
 
 
+def reader_options(data, source_format):
+    """
+    Reader options and the all-sheets flag from the posted converter form.
+    Raises ValueError with a message for the user when they don't apply.
+    """
+    sheet = data.get('sheet', '').strip()
+    all_sheets = data.get('all_sheets', 'false').lower() in ('1', 'true', 'yes', 'on')
+    if (sheet or all_sheets) and source_format != 'excel':
+        raise ValueError('Sheets can only be chosen for Excel files')
+    if sheet and all_sheets:
+        raise ValueError('Choose either a sheet or all sheets')
+    return ({'sheet': sheet} if sheet else {}), all_sheets
 
 
 class ConverterView(View):
@@ -118,14 +128,20 @@ class ConverterView(View):
     - CSV ↔ PDF, Excel, Word, TXT
     - Excel ↔ PDF, CSV, Word, TXT
     - Word ↔ PDF, CSV, Excel, TXT
+    
+    Excel sources convert their first sheet, or the one named (or numbered
+    from 0) by the "sheet" field; "all_sheets" converts each sheet into its
+    own file, returned together as a zip.
     """
     
-    SUPPORTED_FORMATS = {
-        'pdf': ['.pdf'],
-        'csv': ['.csv'],
-        'excel': ['.xlsx', '.xls'],
-        'word': ['.docx', '.doc'],
-        'txt': ['.txt']
+    SUPPORTED_FORMATS = formats.EXTENSIONS
+    
+    CONTENT_TYPES = {
+        'pdf': 'application/pdf',
+        'csv': 'text/csv',
+        'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'word': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'txt': 'text/plain'
     }
     
     def get(self, request):
@@ -133,14 +149,17 @@ class ConverterView(View):
         return render(request, 'converter.html')
     
     @method_decorator(csrf_exempt)
-    def dispatch(self, *args, **kwargs):
-        return super().dispatch(*args, **kwargs)
+    def dispatch(self, request, *args, **kwargs):
+        # Spool, hash and sniff uploads in one pass (see uploads.py)
+        request.upload_handlers = [HashingFileUploadHandler(request)]
+        return super().dispatch(request, *args, **kwargs)
     
     def post(self, request):
         """Handle file conversion requests"""
         try:
             if 'file' not in request.FILES:
-                return JsonResponse({'error': 'No file provided'}, status=400)
+                error = getattr(request, 'upload_error', None)
+                return JsonResponse({'error': error or 'No file provided'}, status=400)
             
             uploaded_file = request.FILES['file']
             target_format = request.POST.get('target_format', '').lower()
@@ -159,21 +178,51 @@ class ConverterView(View):
             if source_format == target_format:
                 return JsonResponse({'error': 'Source and target formats are the same'}, status=400)
             
+            try:
+                options, all_sheets = reader_options(request.POST, source_format)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            
+            if request.POST.get('mode') == 'async':
+                if all_sheets:
+                    return JsonResponse({'error': 'All sheets can only be converted synchronously'}, status=400)
+                return self._submit_job(uploaded_file, source_format, target_format, options)
+            
+            if all_sheets:
+                # One output per sheet, sent as a zip
+                return self._convert_to_zip(uploaded_file, source_format, [target_format], options, all_sheets)
+            
+            if isinstance(uploaded_file, HashingInMemoryUploadedFile):
+                # Small upload: convert from and to memory, no temp files
+                return self._convert_in_memory(request, uploaded_file, source_format, target_format, options)
+            
             # Save uploaded file temporarily
-            temp_path = self._save_temp_file(uploaded_file)
+            temp_path, content_hash = self._save_temp_file(uploaded_file)
+            cache_key = conversion_cache.make_key(content_hash, source_format, target_format, options)
+            output_name = self._output_name(uploaded_file.name, target_format)
+            converted_file_path = None
             
             try:
-                # Convert file
-                converted_file_path = self._convert_file(temp_path, source_format, target_format)
+                # Serve a previous conversion of the same content if we have
+                # one, opened now so that eviction can't pull it away
+                cached_file = conversion_cache.open(cache_key)
+                if cached_file is None:
+                    converted_file_path = self._convert_file(temp_path, source_format, target_format, options)
+                    conversion_cache.put(cache_key, converted_file_path)
                 
-                # Serve converted file
-                response = self._serve_converted_file(converted_file_path, target_format)
-                return response
+                # Serve converted file; temp files are removed once it has been sent
+                return self._serve_converted_file(
+                    request, converted_file_path or cached_file.name, target_format, output_name,
+                    cleanup=[path for path in (temp_path, converted_file_path) if path], file=cached_file,
+                )
                 
-            finally:
+            except BaseException:
                 # Cleanup
-                self._cleanup_files([temp_path])
+                self._cleanup_files([path for path in (temp_path, converted_file_path) if path])
+                raise
                 
+        except excel.SheetError as e:
+            return JsonResponse({'error': str(e)}, status=400)
         except Exception as e:
             return JsonResponse({'error': f'Conversion failed: {str(e)}'}, status=500)
     
@@ -185,378 +234,282 @@ class ConverterView(View):
                 return format_name
         return None
     
-    def _save_temp_file(self, uploaded_file):
-        """Save uploaded file to temporary location"""
-        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
+    def _output_name(self, filename, target_format, sheet=None):
+        """Download name for the converted version of filename (or of one of its sheets)"""
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        if sheet is not None:
+            stem = f"{stem}_{sheet}"
+        return f"{stem}_converted{self.SUPPORTED_FORMATS[target_format][0]}"
+    
+    def _convert_in_memory(self, request, uploaded_file, source_format, target_format, options=None):
+        """Convert an upload held in memory and send the result from memory"""
+        cache_key = conversion_cache.make_key(uploaded_file.content_hash, source_format, target_format, options)
+        output_name = self._output_name(uploaded_file.name, target_format)
+        
+        cached_file = conversion_cache.open(cache_key)
+        if cached_file is not None:
+            return self._serve_converted_file(request, cached_file.name, target_format, output_name, file=cached_file)
+        
+        data = self._convert_bytes(
+            uploaded_file.read(), source_format, target_format, options, uploaded_file.content_hash
+        )
+        conversion_cache.put_bytes(cache_key, data)
+        return serve_bytes(data, self.CONTENT_TYPES[target_format], output_name)
+    
+    def _submit_job(self, uploaded_file, source_format, target_format, options=None):
+        """Queue a background conversion and return its job id"""
+        store = job_queue.store
+        store.purge_expired(settings.CONVERTER_JOB_RETENTION)
+        job = store.create(source_format, target_format, uploaded_file.name)
+        job_id = job['job_id']
+        job_dir = store.job_dir(job_id)
+        
+        source_path, content_hash = self._save_temp_file(uploaded_file, job_dir)
+        cache_key = conversion_cache.make_key(content_hash, source_format, target_format, options)
+        
+        cached_path = conversion_cache.get(cache_key)
+        if cached_path is not None:
+            # Already converted before: finish the job without queueing it
+            result_path = os.path.join(job_dir, self._output_name(uploaded_file.name, target_format))
+            try:
+                link_or_copy(cached_path, result_path)
+            except FileNotFoundError:
+                # Evicted since the lookup: convert it again
+                cached_path = None
+            else:
+                job = store.update(job_id, status=DONE, finished_at=time.time(), result_path=result_path)
+        if cached_path is None:
+            try:
+                job_queue.submit(job_id, source_path, source_format, target_format, cache_key, options)
+            except QueueFullError as e:
+                store.delete(job_id)
+                return JsonResponse({'error': str(e)}, status=503)
+        
+        return JsonResponse({
+            'job_id': job_id,
+            'status': job['status'],
+            'status_url': reverse('converter_job_status', args=[job_id]),
+            'result_url': reverse('converter_job_result', args=[job_id]),
+        }, status=202)
+    
+    def _save_temp_file(self, uploaded_file, temp_dir=None):
+        """
+        Save uploaded file to temporary location, returning its path (a
+        SourcePath carrying the hash) and content hash
+        """
+        if isinstance(uploaded_file, HashingUploadedFile):
+            # Already on disk and hashed by the upload handler: use it in place
+            if temp_dir is not None:
+                uploaded_file.move_to(temp_dir)
+            content_hash = uploaded_file.content_hash
+            return SourcePath(uploaded_file.temporary_file_path(), content_hash), content_hash
+        
+        if temp_dir is None:
+            temp_dir = os.path.join(settings.CONVERTER_PRIVATE_ROOT, 'temp')
         os.makedirs(temp_dir, exist_ok=True)
         
         temp_path = os.path.join(temp_dir, uploaded_file.name)
+        hasher = new_hasher()
         with open(temp_path, 'wb') as f:
             for chunk in uploaded_file.chunks():
+                hasher.update(chunk)
                 f.write(chunk)
-        return temp_path
+        content_hash = hasher.hexdigest()
+        return SourcePath(temp_path, content_hash), content_hash
     
-    def _convert_file(self, source_path, source_format, target_format):
+    def _convert_file(self, source_path, source_format, target_format, options=None):
         """Main conversion logic"""
-        conversion_method = f"_convert_{source_format}_to_{target_format}"
-        if hasattr(self, conversion_method):
-            return getattr(self, conversion_method)(source_path)
-        else:
-            raise NotImplementedError(f"Conversion from {source_format} to {target_format} not implemented")
+        output_path = self._output_path(source_path, target_format)
+        self._convert(source_path, output_path, source_format, target_format, options)
+        return output_path
     
-    # PDF Conversions
-    def _convert_pdf_to_csv(self, pdf_path):
-        """Extract text from PDF and save as CSV"""
-        text_data = self._extract_pdf_text(pdf_path)
-        csv_path = pdf_path.replace('.pdf', '_converted.csv')
-        
-        # Convert text to CSV format (basic implementation)
-        lines = text_data.split('\n')
-        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Content'])
-            for line in lines:
-                if line.strip():
-                    writer.writerow([line.strip()])
-        return csv_path
-    
-    def _convert_pdf_to_excel(self, pdf_path):
-        """Extract text from PDF and save as Excel"""
-        text_data = self._extract_pdf_text(pdf_path)
-        excel_path = pdf_path.replace('.pdf', '_converted.xlsx')
-        
-        lines = [line.strip() for line in text_data.split('\n') if line.strip()]
-        df = pd.DataFrame({'Content': lines})
-        df.to_excel(excel_path, index=False)
-        return excel_path
-    
-    def _convert_pdf_to_word(self, pdf_path):
-        """Extract text from PDF and save as Word document"""
-        text_data = self._extract_pdf_text(pdf_path)
-        word_path = pdf_path.replace('.pdf', '_converted.docx')
-        
-        doc = Document()
-        doc.add_heading('Converted from PDF', 0)
-        doc.add_paragraph(text_data)
-        doc.save(word_path)
-        return word_path
-    
-    def _convert_pdf_to_txt(self, pdf_path):
-        """Extract text from PDF and save as TXT"""
-        text_data = self._extract_pdf_text(pdf_path)
-        txt_path = pdf_path.replace('.pdf', '_converted.txt')
-        
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            f.write(text_data)
-        return txt_path
-    
-    # CSV Conversions
-    def _convert_csv_to_pdf(self, csv_path):
-        """Convert CSV to PDF table"""
-        pdf_path = csv_path.replace('.csv', '_converted.pdf')
-        
-        df = pd.read_csv(csv_path)
-        
-        doc = SimpleDocTemplate(pdf_path, pagesize=A4)
-        elements = []
-        
-        # Add title
-        styles = getSampleStyleSheet()
-        title = Paragraph("CSV Data", styles['Title'])
-        elements.append(title)
-        
-        # Convert DataFrame to table
-        data = [df.columns.tolist()] + df.values.tolist()
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
-        
-        doc.build(elements)
-        return pdf_path
+    def _output_path(self, source_path, target_format, suffix=''):
+        """Path the target_format version of source_path is written to, alongside it"""
+        stem = os.path.splitext(source_path)[0]
+        return f"{stem}{suffix}_converted{self.SUPPORTED_FORMATS[target_format][0]}"
     
-    def _convert_csv_to_excel(self, csv_path):
-        """Convert CSV to Excel"""
-        excel_path = csv_path.replace('.csv', '_converted.xlsx')
-        df = pd.read_csv(csv_path)
-        df.to_excel(excel_path, index=False)
-        return excel_path
+    def _convert_bytes(self, data, source_format, target_format, options=None, content_hash=None):
+        """Convert a small document held in memory, returning the output bytes"""
+        output = io.BytesIO()
+        self._convert(SourceBuffer(data, content_hash), output, source_format, target_format, options)
+        return output.getvalue()
     
-    def _convert_csv_to_word(self, csv_path):
-        """Convert CSV to Word document with table"""
-        word_path = csv_path.replace('.csv', '_converted.docx')
-        df = pd.read_csv(csv_path)
-        
-        doc = Document()
-        doc.add_heading('CSV Data', 0)
-        
-        # Create table
-        table = doc.add_table(rows=1, cols=len(df.columns))
-        table.style = 'Table Grid'
-        
-        # Add headers
-        for i, column in enumerate(df.columns):
-            table.cell(0, i).text = str(column)
-        
-        # Add data
-        for _, row in df.iterrows():
-            cells = table.add_row().cells
-            for i, value in enumerate(row):
-                cells[i].text = str(value)
-        
-        doc.save(word_path)
-        return word_path
+    def _convert(self, source, output, source_format, target_format, options=None):
+        """
+        Convert source into output; each is a path or a binary buffer.
+        options are passed to the reader, see reader_options.
+        """
+        formats.write(formats.read(source, source_format, **(options or {})), output, target_format)
     
-    def _convert_csv_to_txt(self, csv_path):
-        """Convert CSV to TXT"""
-        txt_path = csv_path.replace('.csv', '_converted.txt')
-        df = pd.read_csv(csv_path)
-        
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            f.write(df.to_string(index=False))
-        return txt_path
-    
-    # Excel Conversions
-    def _convert_excel_to_pdf(self, excel_path):
-        """Convert Excel to PDF"""
-        pdf_path = excel_path.replace('.xlsx', '_converted.pdf').replace('.xls', '_converted.pdf')
-        df = pd.read_excel(excel_path)
-        
-        doc = SimpleDocTemplate(pdf_path, pagesize=A4)
-        elements = []
-        
-        styles = getSampleStyleSheet()
-        title = Paragraph("Excel Data", styles['Title'])
-        elements.append(title)
-        
-        data = [df.columns.tolist()] + df.values.tolist()
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
-        
-        doc.build(elements)
-        return pdf_path
-    
-    def _convert_excel_to_csv(self, excel_path):
-        """Convert Excel to CSV"""
-        csv_path = excel_path.replace('.xlsx', '_converted.csv').replace('.xls', '_converted.csv')
-        df = pd.read_excel(excel_path)
-        df.to_csv(csv_path, index=False)
-        return csv_path
-    
-    def _convert_excel_to_word(self, excel_path):
-        """Convert Excel to Word document"""
-        word_path = excel_path.replace('.xlsx', '_converted.docx').replace('.xls', '_converted.docx')
-        df = pd.read_excel(excel_path)
-        
-        doc = Document()
-        doc.add_heading('Excel Data', 0)
-        
-        table = doc.add_table(rows=1, cols=len(df.columns))
-        table.style = 'Table Grid'
-        
-        for i, column in enumerate(df.columns):
-            table.cell(0, i).text = str(column)
-        
-        for _, row in df.iterrows():
-            cells = table.add_row().cells
-            for i, value in enumerate(row):
-                cells[i].text = str(value)
-        
-        doc.save(word_path)
-        return word_path
-    
-    def _convert_excel_to_txt(self, excel_path):
-        """Convert Excel to TXT"""
-        txt_path = excel_path.replace('.xlsx', '_converted.txt').replace('.xls', '_converted.txt')
-        df = pd.read_excel(excel_path)
-        
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            f.write(df.to_string(index=False))
-        return txt_path
-    
-    # Word Conversions
-    def _convert_word_to_pdf(self, word_path):
-        """Convert Word to PDF (basic text extraction)"""
-        pdf_path = word_path.replace('.docx', '_converted.pdf').replace('.doc', '_converted.pdf')
-        
-        # Extract text from Word document
-        doc = Document(word_path)
-        text_content = []
-        for paragraph in doc.paragraphs:
-            text_content.append(paragraph.text)
-        
-        # Create PDF
-        doc_pdf = SimpleDocTemplate(pdf_path, pagesize=A4)
-        styles = getSampleStyleSheet()
-        elements = []
-        
-        elements.append(Paragraph("Converted from Word Document", styles['Title']))
-        for text in text_content:
-            if text.strip():
-                elements.append(Paragraph(text, styles['Normal']))
-        
-        doc_pdf.build(elements)
-        return pdf_path
-    
-    def _convert_word_to_csv(self, word_path):
-        """Convert Word to CSV (extract text as rows)"""
-        csv_path = word_path.replace('.docx', '_converted.csv').replace('.doc', '_converted.csv')
-        
-        doc = Document(word_path)
-        text_lines = []
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text_lines.append(paragraph.text.strip())
-        
-        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Content'])
-            for line in text_lines:
-                writer.writerow([line])
+    def _convert_to_zip(self, uploaded_file, source_format, target_formats, options=None, all_sheets=False):
+        """
+        Convert an upload to each target format, for every sheet of a
+        workbook with all_sheets, and stream the outputs back as a zip
+        """
+        if isinstance(uploaded_file, HashingInMemoryUploadedFile):
+            # Small upload: outputs are converted in memory
+            content_hash, cleanup = uploaded_file.content_hash, []
+            source = SourceBuffer(uploaded_file.read(), content_hash)
+        else:
+            source, content_hash = self._save_temp_file(uploaded_file)
+            cleanup = [source]
         
-        return csv_path
+        try:
+            if all_sheets:
+                sheets = excel.sheet_names(source)
+            else:
+                sheets = [None]
+            entries = []
+            for i, sheet in enumerate(sheets):
+                sheet_reader_options = {'sheet': sheet} if sheet is not None else options
+                suffix = f"_sheet{i}" if sheet is not None else ''
+                outputs = self._convert_all(
+                    source, content_hash, source_format, target_formats, cleanup, sheet_reader_options, suffix
+                )
+                entries.extend(
+                    (self._output_name(uploaded_file.name, target_format, sheet), output)
+                    for target_format, output in outputs
+                )
+            archive_name = f"{os.path.splitext(os.path.basename(uploaded_file.name))[0]}_converted.zip"
+            return serve_zip(entries, archive_name, zipfile.ZIP_DEFLATED, cleanup)
+        except BaseException:
+            self._cleanup_files(cleanup)
+            raise
     
-    def _convert_word_to_excel(self, word_path):
-        """Convert Word to Excel"""
-        excel_path = word_path.replace('.docx', '_converted.xlsx').replace('.doc', '_converted.xlsx')
-        
-        doc = Document(word_path)
-        text_lines = []
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text_lines.append(paragraph.text.strip())
-        
-        df = pd.DataFrame({'Content': text_lines})
-        df.to_excel(excel_path, index=False)
-        return excel_path
+    def _convert_all(self, source, content_hash, source_format, target_formats, cleanup, options=None, suffix=''):
+        """
+        (target format, output) for each target format, the output being
+        bytes, a path or an open cache entry. The source is only parsed if
+        some output isn't cached; new output files are added to cleanup.
+        """
+        entries = []
+        content = None
+        for target_format in target_formats:
+            cache_key = conversion_cache.make_key(content_hash, source_format, target_format, options)
+            cached_file = conversion_cache.open(cache_key)
+            if cached_file is not None:
+                entries.append((target_format, cached_file))
+                continue
+            
+            if content is None:
+                content = formats.read(source, source_format, **(options or {}))
+            if is_path(source):
+                output = self._output_path(source, target_format, suffix)
+                formats.write(content, output, target_format)
+                cleanup.append(output)
+                conversion_cache.put(cache_key, output)
+                entries.append((target_format, output))
+            else:
+                output = io.BytesIO()
+                formats.write(content, output, target_format)
+                conversion_cache.put_bytes(cache_key, output.getvalue())
+                entries.append((target_format, output.getvalue()))
+        return entries
     
-    def _convert_word_to_txt(self, word_path):
-        """Convert Word to TXT"""
-        txt_path = word_path.replace('.docx', '_converted.txt').replace('.doc', '_converted.txt')
-        
-        doc = Document(word_path)
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            for paragraph in doc.paragraphs:
-                f.write(paragraph.text + '\n')
-        
-        return txt_path
+    def _serve_converted_file(self, request, file_path, target_format, filename=None, cleanup=(), file=None):
+        """Stream the converted file as download, with Range support"""
+        filename = filename or os.path.basename(file_path)
+        return serve_file(
+            request, file_path, self.CONTENT_TYPES.get(target_format, 'application/octet-stream'), filename,
+            cleanup, file,
+        )
     
-    # TXT Conversions
-    def _convert_txt_to_pdf(self, txt_path):
-        """Convert TXT to PDF"""
-        pdf_path = txt_path.replace('.txt', '_converted.pdf')
-        
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        doc = SimpleDocTemplate(pdf_path, pagesize=A4)
-        styles = getSampleStyleSheet()
-        elements = []
-        
-        elements.append(Paragraph("Text Document", styles['Title']))
-        
-        # Split content into paragraphs
-        paragraphs = content.split('\n\n')
-        for para in paragraphs:
-            if para.strip():
-                elements.append(Paragraph(para.replace('\n', ' '), styles['Normal']))
-        
-        doc.build(elements)
-        return pdf_path
-    
-    def _convert_txt_to_csv(self, txt_path):
-        """Convert TXT to CSV"""
-        csv_path = txt_path.replace('.txt', '_converted.csv')
-        
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Content'])
-            for line in lines:
-                if line.strip():
-                    writer.writerow([line.strip()])
-        
-        return csv_path
+    def _cleanup_files(self, file_paths):
+        """Clean up temporary files"""
+        for path in file_paths:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except:
+                pass
+
+
+class MultiFormatConverterView(ConverterView):
+    """
+    Convert one upload to several formats at once, returned as a streamed zip.
+
+    POST multipart fields:
+        file: the document to convert
+        target_formats: formats to convert to, repeated or comma separated
+        sheet, all_sheets: as for ConverterView
+
+    The document is parsed once and every output is written from the same
+    parsed content (see formats.py). Outputs already in the conversion cache
+    are served from it.
+    """
     
-    def _convert_txt_to_excel(self, txt_path):
-        """Convert TXT to Excel"""
-        excel_path = txt_path.replace('.txt', '_converted.xlsx')
-        
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            lines = [line.strip() for line in f.readlines() if line.strip()]
+    def post(self, request):
+        try:
+            if 'file' not in request.FILES:
+                error = getattr(request, 'upload_error', None)
+                return JsonResponse({'error': error or 'No file provided'}, status=400)
+            
+            uploaded_file = request.FILES['file']
+            target_formats = []
+            for value in request.POST.getlist('target_formats'):
+                for target_format in value.lower().split(','):
+                    target_format = target_format.strip()
+                    if target_format and target_format not in target_formats:
+                        target_formats.append(target_format)
+            
+            if not target_formats:
+                return JsonResponse({'error': 'Target formats not specified'}, status=400)
+            
+            source_format = self._detect_format(uploaded_file.name)
+            if not source_format:
+                return JsonResponse({'error': 'Unsupported source file format'}, status=400)
+            
+            for target_format in target_formats:
+                if target_format not in self.SUPPORTED_FORMATS:
+                    return JsonResponse({'error': f'Unsupported target format: {target_format}'}, status=400)
+                if target_format == source_format:
+                    return JsonResponse({'error': 'Source and target formats are the same'}, status=400)
+            
+            try:
+                options, all_sheets = reader_options(request.POST, source_format)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            
+            return self._convert_to_zip(uploaded_file, source_format, target_formats, options, all_sheets)
         
-        df = pd.DataFrame({'Content': lines})
-        df.to_excel(excel_path, index=False)
-        return excel_path
+        except excel.SheetError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': f'Conversion failed: {str(e)}'}, status=500)
+
+
+class ConversionJobStatusView(View):
+    """Report the status of a background conversion job"""
     
-    def _convert_txt_to_word(self, txt_path):
-        """Convert TXT to Word"""
-        word_path = txt_path.replace('.txt', '_converted.docx')
-        
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        doc = Document()
-        doc.add_heading('Text Document', 0)
-        doc.add_paragraph(content)
-        doc.save(word_path)
-        return word_path
+    def get(self, request, job_id):
+        job = job_queue.store.get(job_id)
+        if job is None:
+            return JsonResponse({'error': 'Job not found'}, status=404)
+        
+        job.pop('result_path')
+        if job['status'] == DONE:
+            job['result_url'] = reverse('converter_job_result', args=[job_id])
+        return JsonResponse(job)
+
+
+class ConversionJobResultView(ConverterView):
+    """Download the output of a finished background conversion job"""
     
-    # Helper methods
-    def _extract_pdf_text(self, pdf_path):
-        """Extract text from PDF file"""
-        text = ""
-        try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-        except Exception as e:
-            raise Exception(f"Error extracting PDF text: {str(e)}")
-        return text
+    http_method_names = ['get']
     
-    def _serve_converted_file(self, file_path, target_format):
-        """Serve the converted file as download"""
-        filename = os.path.basename(file_path)
+    def get(self, request, job_id):
+        job = job_queue.store.get(job_id)
+        if job is None:
+            return JsonResponse({'error': 'Job not found'}, status=404)
         
-        content_types = {
-            'pdf': 'application/pdf',
-            'csv': 'text/csv',
-            'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'word': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'txt': 'text/plain'
-        }
+        if job['status'] != DONE:
+            return JsonResponse({'error': 'Job is not finished', 'status': job['status']}, status=409)
         
-        with open(file_path, 'rb') as f:
-            response = HttpResponse(f.read(), content_type=content_types.get(target_format, 'application/octet-stream'))
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+        return self._serve_converted_file(request, job['result_path'], job['target_format'])
+
+
+class ConversionCacheStatsView(View):
+    """Report hit/miss counters and size of the conversion cache"""
     
-    def _cleanup_files(self, file_paths):
-        """Clean up temporary files"""
-        for path in file_paths:
-            try:
-                if os.path.exists(path):
-                    os.remove(path)
-            except:
-                pass
\ No newline at end of file
+    def get(self, request):
+        return JsonResponse(conversion_cache.stats())
@@ -6,149 +6,544 @@
 # generator/ai_service.py - IMPROVED AI SERVICE
 # =============================================
 
-from transformers import GPT2LMHeadModel, GPT2Tokenizer
-import torch
+import gc
+import os
 import re
 import logging
+import threading
+import time
+from functools import partial
+from django.conf import settings
+from .batching import BatchScheduler
+from .inference import apply_backend, configure_threads, warm_up
+from .kv_cache import SessionKVCache
+from .response_cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
+# Enhanced prompts for better responses
+
+# Canned answer for "what is heat" style questions
+HEAT_RESPONSE = "Question: What is heat?\nAnswer: Heat is a form of energy that transfers between objects due to temperature differences. It flows naturally from hotter objects to cooler ones through three main mechanisms: conduction (direct contact), convection (through fluids like air or water), and radiation (electromagnetic waves). Heat is measured in joules or calories and plays a crucial role in thermodynamics, weather patterns, and everyday phenomena like cooking and heating systems."
+
+# Templates as (text before, text after) the user's prompt, which is joined
+# on with a single space. Each piece ends or starts at a boundary GPT-2's
+# tokenizer never merges across (the space goes with the prompt, the
+# newline starts a new token), so the pieces are tokenised once per model
+# load and concatenated with the prompt's ids.
+PROMPT_TEMPLATES = {
+    "definition": ("Please provide a comprehensive definition.\nQuestion:", "\nAnswer: This term refers to"),
+    "explain": ("Let me explain this concept clearly.\nTopic:", "\nExplanation: This is"),
+    "how": ("Here's a detailed explanation of how this works.\nQuestion:", "\nAnswer: The process involves"),
+    "what": ("Let me provide a comprehensive answer about this topic.\nQuestion:", "\nAnswer: This refers to"),
+    "chat": ("Human:", "\nAI: I'd be happy to help you with that question. Let me provide a comprehensive answer:"),
+}
+
+# Prompts are truncated to this many tokens
+PROMPT_MAX_TOKENS = 200
+
+# Tokens generated at the least, unless max_new_tokens is lower
+MIN_NEW_TOKENS = 50
+
+# Role tags echoed back by the model, removed in a single pass: "Human:"
+# and "Question:" up to the end of the line, "AI:" up to the next word
+# unless that word starts a "Human:"/"Question:" tag (whose removal would
+# leave "AI:" with nothing to strip up to)
+RESPONSE_TAG_PATTERN = re.compile(
+    r'(?:human|question):.*|ai:[^\w\n]*(?=\w)(?!(?:human|question):)',
+    re.IGNORECASE,
+)
+
+
+def tokenize_templates(tokenizer):
+    """Token ids of each template's prefix and suffix, spliced around prompts"""
+    return {
+        name: (tokenizer(prefix)['input_ids'], tokenizer(suffix)['input_ids'])
+        for name, (prefix, suffix) in PROMPT_TEMPLATES.items()
+    }
+
+
 class AITextGenerator:
     def __init__(self):
         # Use GPT2-medium for better responses (you already downloaded it)
         self.model_name = "gpt2-medium"
         
+        # The model is loaded on first use (or by load()), not at import time,
+        # so processes that never generate text don't pay for it
+        self.tokenizer = None
+        self.model = None
+        self.backend = None
+        self._load_lock = threading.Lock()
+        # Process the model was last prepared to run in, see _prepare_process
+        self._prepared_pid = None
+        self._batcher = None
+        self._kv_cache = None
+        self._response_cache = None
+        self._template_ids = None
+        self._metrics_lock = threading.Lock()
+        self._streams = 0
+        self._ttft_total = 0.0
+        self._ttft_max = 0.0
+    
+    @property
+    def is_loaded(self):
+        return self.model is not None
+    
+    def load(self):
+        """
+        Load tokenizer and weights once and prepare this process to run
+        them; safe to call from several threads
+        """
+        with self._load_lock:
+            self._load_weights()
+            if self._prepared_pid != os.getpid():
+                self._prepare_process()
+                self._prepared_pid = os.getpid()
+    
+    def _load_weights(self):
+        if self.is_loaded:
+            return
+        
         try:
             logger.info(f"Loading model: {self.model_name}")
-            self.tokenizer = GPT2Tokenizer.from_pretrained(self.model_name)
-            self.model = GPT2LMHeadModel.from_pretrained(self.model_name)
-            
-            # Fix padding token
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
-                
+            self._load_pretrained(self.model_name)
             logger.info("Model loaded successfully")
-            
+        
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             # Fallback to base GPT2
             self.model_name = "gpt2"
-            self.tokenizer = GPT2Tokenizer.from_pretrained(self.model_name)
-            self.model = GPT2LMHeadModel.from_pretrained(self.model_name)
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
+            self._load_pretrained(self.model_name)
     
-    def generate_response(self, prompt, conversation_history=None, max_new_tokens=150):
-        """Generate comprehensive AI responses like ChatGPT"""
+    def _prepare_process(self):
+        """
+        Set torch's thread count and run the model once, in the process that
+        will serve requests.
+        
+        Both start torch's thread pools, which don't survive fork(), so they
+        happen after the fork rather than in a pre-fork master. A backend
+        that fails on its first run is swapped for the eager model.
+        """
+        configure_threads(settings.AI_TORCH_THREADS)
         try:
-            # Enhanced prompts for better responses
-            enhanced_prompts = {
-                "heat": "Question: What is heat?\nAnswer: Heat is a form of energy that transfers between objects due to temperature differences. It flows naturally from hotter objects to cooler ones through three main mechanisms: conduction (direct contact), convection (through fluids like air or water), and radiation (electromagnetic waves). Heat is measured in joules or calories and plays a crucial role in thermodynamics, weather patterns, and everyday phenomena like cooking and heating systems.",
-                
-                "definition": f"Please provide a comprehensive definition.\nQuestion: {prompt}\nAnswer: This term refers to",
-                
-                "explain": f"Let me explain this concept clearly.\nTopic: {prompt}\nExplanation: This is",
-                
-                "how": f"Here's a detailed explanation of how this works.\nQuestion: {prompt}\nAnswer: The process involves",
-                
-                "what": f"Let me provide a comprehensive answer about this topic.\nQuestion: {prompt}\nAnswer: This refers to"
-            }
-            
-            # Choose appropriate prompt based on user input
-            prompt_lower = prompt.lower()
-            if "heat" in prompt_lower and ("what" in prompt_lower or "definition" in prompt_lower):
-                return enhanced_prompts["heat"]
-            elif "definition" in prompt_lower:
-                base_prompt = enhanced_prompts["definition"]
-            elif "explain" in prompt_lower:
-                base_prompt = enhanced_prompts["explain"]
-            elif "how" in prompt_lower:
-                base_prompt = enhanced_prompts["how"]
-            elif "what" in prompt_lower:
-                base_prompt = enhanced_prompts["what"]
-            else:
-                base_prompt = f"Human: {prompt}\nAI: I'd be happy to help you with that question. Let me provide a comprehensive answer:"
-            
-            # Tokenize with proper attention mask
-            inputs = self.tokenizer(
-                base_prompt,
-                return_tensors="pt",
-                max_length=200,
-                truncation=True,
-                padding=True
+            warm_up(self.model)
+        except Exception as e:
+            if self.backend == 'eager':
+                raise
+            logger.error(f"Inference backend {self.backend!r} failed, using eager: {e}")
+            self._load_pretrained(self.model_name, backend='eager')
+    
+    def _load_pretrained(self, model_name, backend=None):
+        from transformers import GPT2LMHeadModel, GPT2Tokenizer
+        
+        tokenizer = GPT2Tokenizer.from_pretrained(model_name)
+        # safetensors weights are read through mmap rather than unpickled,
+        # and low_cpu_mem_usage skips the throwaway random initialisation
+        try:
+            model = GPT2LMHeadModel.from_pretrained(
+                model_name,
+                use_safetensors=True,
+                low_cpu_mem_usage=True,
             )
+        except OSError as e:
+            # Older local checkpoints only have pytorch_model.bin
+            logger.info(f"No safetensors weights for {model_name}, loading the pickled ones: {e}")
+            model = GPT2LMHeadModel.from_pretrained(model_name, low_cpu_mem_usage=True)
+        model.eval()
+        model, self.backend = apply_backend(
+            model, backend or settings.AI_INFERENCE_BACKEND, warm_up_model=False
+        )
+        logger.info(f"Using {self.backend} inference backend")
+        
+        # Fix padding token
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # Decoder-only models continue from the right, so batches pad on the left
+        tokenizer.padding_side = 'left'
+        
+        self._template_ids = tokenize_templates(tokenizer)
+        
+        self.tokenizer = tokenizer
+        self.model = model
+    
+    def load_weights(self):
+        """Load tokenizer and weights once without running the model, e.g. to download them"""
+        with self._load_lock:
+            self._load_weights()
+    
+    def share_with_workers(self):
+        """
+        Load the model in a pre-fork server process (e.g. the gunicorn master).
+        
+        Forked workers then share the weight pages copy-on-write instead of
+        each holding a copy. gc.freeze() moves everything allocated so far
+        out of the collector's reach, so collections in the workers don't
+        write to (and therefore copy) those pages. Nothing is run here: each
+        worker sets up torch and warms the model up on its first load().
+        """
+        self.load_weights()
+        gc.freeze()
+    
+    def generate_response(self, prompt, conversation_history=None, max_new_tokens=150, session_id=None):
+        """
+        Generate comprehensive AI responses like ChatGPT.
+        
+        With a session_id the conversation history is given to the model as
+        context and its key/values are cached for the session's next turn;
+        without one, concurrent calls are batched together.
+        """
+        try:
+            self.load()
             
-            # Generate longer, more detailed responses
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    input_ids=inputs['input_ids'],
-                    attention_mask=inputs['attention_mask'],
-                    max_new_tokens=max_new_tokens,
-                    min_new_tokens=50,  # Ensure minimum length
-                    num_return_sequences=1,
-                    temperature=0.8,
-                    top_k=50,
-                    top_p=0.9,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.pad_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    repetition_penalty=1.2,
-                    length_penalty=1.1,  # Encourage longer responses
-                    early_stopping=False
-                )
+            base_prompt, prompt_ids, canned_response = self._select_prompt(prompt)
+            if canned_response is not None:
+                return canned_response
             
-            # Decode the full response
-            generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            cache_key = self._response_cache_key(prompt, conversation_history, max_new_tokens, session_id)
+            if cache_key is not None:
+                cached_response = self.response_cache.get(cache_key)
+                if cached_response is not None:
+                    return cached_response
             
-            # Extract only the new generated content
-            if "Answer:" in generated_text:
-                response = generated_text.split("Answer:")[-1].strip()
-            elif "AI:" in generated_text:
-                response = generated_text.split("AI:")[-1].strip()
-            elif "Explanation:" in generated_text:
-                response = generated_text.split("Explanation:")[-1].strip()
+            if session_id is not None:
+                generated_text = self._generate_in_session(
+                    session_id, conversation_history, prompt_ids, max_new_tokens
+                )
             else:
-                # Remove the original prompt from response
-                response = generated_text[len(base_prompt):].strip()
-            
-            # Clean and enhance the response
-            response = self.clean_and_enhance_response(response, prompt)
-            
-            # Ensure minimum quality response
-            if len(response) < 50:
-                response = self.get_detailed_fallback_response(prompt)
+                # Generate and decode; concurrent calls are batched together
+                generated_text = self.batcher.submit(prompt_ids, max_new_tokens)
             
+            response = self._finish_response(generated_text, base_prompt, prompt)
+            if cache_key is not None:
+                self.response_cache.put(cache_key, response)
             return response
             
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             return self.get_detailed_fallback_response(prompt)
     
+    def stream_response(self, prompt, conversation_history=None, max_new_tokens=150, session_id=None):
+        """
+        Generate a response token by token.
+        
+        Yields ("token", text) for each decoded piece as the model produces
+        it, then one ("done", response) with the cleaned full response, the
+        same text generate_response would have returned. session_id works
+        as in generate_response.
+        """
+        started_at = time.perf_counter()
+        try:
+            self.load()
+            
+            base_prompt, prompt_ids, canned_response = self._select_prompt(prompt)
+            cache_key = self._response_cache_key(prompt, conversation_history, max_new_tokens, session_id)
+            if canned_response is None and cache_key is not None:
+                canned_response = self.response_cache.get(cache_key)
+            if canned_response is not None:
+                self._record_first_token(started_at)
+                yield "token", canned_response
+                yield "done", canned_response
+                return
+            
+            from transformers import TextIteratorStreamer
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+            if session_id is not None:
+                generate = partial(
+                    self._generate_in_session,
+                    session_id, conversation_history, prompt_ids, max_new_tokens, streamer
+                )
+            else:
+                generate = partial(self._generate_single, prompt_ids, max_new_tokens, streamer)
+            errors = []
+            thread = threading.Thread(
+                target=self._generate_into_streamer,
+                args=(generate, streamer, errors),
+                daemon=True,
+            )
+            thread.start()
+            
+            pieces = []
+            for text in streamer:
+                if not text:
+                    continue
+                if not pieces:
+                    self._record_first_token(started_at)
+                pieces.append(text)
+                yield "token", text
+            thread.join()
+            if errors:
+                raise errors[0]
+            
+            response = self._finish_response(base_prompt + ''.join(pieces), base_prompt, prompt)
+            if cache_key is not None:
+                self.response_cache.put(cache_key, response)
+            yield "done", response
+            
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            yield "done", self.get_detailed_fallback_response(prompt)
+    
+    def _generate_into_streamer(self, generate, streamer, errors):
+        try:
+            generate()
+        except Exception as e:
+            errors.append(e)
+            # Unblock the consumer waiting on the streamer
+            streamer.end()
+    
+    def _record_first_token(self, started_at):
+        with self._metrics_lock:
+            ttft = time.perf_counter() - started_at
+            self._streams += 1
+            self._ttft_total += ttft
+            self._ttft_max = max(self._ttft_max, ttft)
+    
+    def _select_prompt(self, prompt):
+        """
+        Return (base_prompt, prompt_ids, None), or (None, None, canned_response)
+        when no generation is needed.
+        """
+        # Choose appropriate prompt based on user input
+        prompt_lower = prompt.lower()
+        if "heat" in prompt_lower and ("what" in prompt_lower or "definition" in prompt_lower):
+            return None, None, HEAT_RESPONSE
+        elif "definition" in prompt_lower:
+            name = "definition"
+        elif "explain" in prompt_lower:
+            name = "explain"
+        elif "how" in prompt_lower:
+            name = "how"
+        elif "what" in prompt_lower:
+            name = "what"
+        else:
+            name = "chat"
+        
+        prefix, suffix = PROMPT_TEMPLATES[name]
+        prefix_ids, suffix_ids = self._template_ids[name]
+        base_prompt = f"{prefix} {prompt}{suffix}"
+        # Only the user's text needs tokenising; the template pieces were
+        # tokenised at load time and give the same ids as the whole string
+        prompt_ids = prefix_ids + self.tokenizer(f" {prompt}")['input_ids'] + suffix_ids
+        return base_prompt, prompt_ids[:PROMPT_MAX_TOKENS], None
+    
+    def _finish_response(self, generated_text, base_prompt, prompt):
+        """Turn the decoded prompt + continuation into the final response"""
+        # Extract only the new generated content
+        if "Answer:" in generated_text:
+            response = generated_text.split("Answer:")[-1].strip()
+        elif "AI:" in generated_text:
+            response = generated_text.split("AI:")[-1].strip()
+        elif "Explanation:" in generated_text:
+            response = generated_text.split("Explanation:")[-1].strip()
+        else:
+            # Remove the original prompt from response
+            response = generated_text[len(base_prompt):].strip()
+        
+        # Clean and enhance the response
+        response = self.clean_and_enhance_response(response, prompt)
+        
+        # Ensure minimum quality response
+        if len(response) < 50:
+            response = self.get_detailed_fallback_response(prompt)
+        
+        return response
+    
+    def generate_batch(self, prompts, max_new_tokens):
+        """Generate continuations for several tokenised prompts in one left-padded batch"""
+        import torch
+        
+        # Pad with proper attention mask
+        inputs = self.tokenizer.pad(
+            {'input_ids': prompts},
+            return_tensors="pt",
+            padding=True
+        )
+        
+        # Generate longer, more detailed responses
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=inputs['input_ids'],
+                attention_mask=inputs['attention_mask'],
+                **self._generation_kwargs(max_new_tokens)
+            )
+        
+        # Decode the full responses
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+    
+    def _generate_single(self, prompt_ids, max_new_tokens, streamer=None):
+        """Generate a continuation for one tokenised prompt outside the batcher"""
+        import torch
+        
+        inputs = torch.tensor([prompt_ids])
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=inputs,
+                attention_mask=torch.ones_like(inputs),
+                streamer=streamer,
+                **self._generation_kwargs(max_new_tokens)
+            )
+        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+    
+    def _session_token_ids(self, conversation_history, prompt_ids, max_new_tokens):
+        """
+        Token ids of the session transcript to put ahead of this turn's prompt.
+        
+        Each message is tokenised on its own so a message always maps to the
+        same ids and earlier turns form a stable prefix across turns. When the
+        transcript no longer fits the context window the oldest messages are
+        dropped until it fills half of the room left, so the following turns
+        can reuse the cache again instead of sliding the window every turn.
+        """
+        lines = [
+            f"{'AI' if message['role'] == 'assistant' else 'Human'}: {message['content']}\n"
+            for message in conversation_history or []
+        ]
+        message_ids = self.tokenizer(lines)['input_ids'] if lines else []
+        
+        room = self.model.config.max_position_embeddings - max_new_tokens - len(prompt_ids)
+        total = sum(len(ids) for ids in message_ids)
+        if total > room:
+            start = 0
+            while start < len(message_ids) and total > room // 2:
+                total -= len(message_ids[start])
+                start += 1
+            message_ids = message_ids[start:]
+        
+        return [token_id for ids in message_ids for token_id in ids]
+    
+    def _generate_in_session(self, session_id, conversation_history, prompt_ids, max_new_tokens, streamer=None):
+        """
+        Generate with the session's conversation as context.
+        
+        Key/values cached for the transcript on the previous turn are passed
+        to generate, so the forward pass only covers the messages added since
+        and this turn's prompt. Afterwards the cache is cropped back to the
+        transcript and stored for the next turn.
+        """
+        import torch
+        
+        transcript_ids = self._session_token_ids(conversation_history, prompt_ids, max_new_tokens)
+        input_ids = transcript_ids + prompt_ids
+        past_key_values, _ = self.kv_cache.take(session_id, input_ids)
+        
+        inputs = torch.tensor([input_ids])
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=inputs,
+                attention_mask=torch.ones_like(inputs),
+                past_key_values=past_key_values,
+                return_dict_in_generate=True,
+                streamer=streamer,
+                **self._generation_kwargs(max_new_tokens)
+            )
+        
+        if transcript_ids:
+            cache = outputs.past_key_values
+            extra = cache.get_seq_length() - len(transcript_ids)
+            if extra:
+                cache.crop(-extra)
+            self.kv_cache.put(session_id, transcript_ids, cache)
+        
+        # Same text the batched path decodes: the prompt plus its continuation
+        return self.tokenizer.decode(outputs.sequences[0, len(transcript_ids):], skip_special_tokens=True)
+    
+    def _generation_kwargs(self, max_new_tokens):
+        kwargs = dict(
+            max_new_tokens=max_new_tokens,
+            # Ensure minimum length, which can't exceed the maximum
+            min_new_tokens=min(MIN_NEW_TOKENS, max_new_tokens),
+            num_return_sequences=1,
+            pad_token_id=self.tokenizer.pad_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            repetition_penalty=1.2,
+            length_penalty=1.1,  # Encourage longer responses
+            early_stopping=False
+        )
+        if settings.AI_DO_SAMPLE:
+            kwargs.update(do_sample=True, temperature=0.8, top_k=50, top_p=0.9)
+        else:
+            kwargs.update(do_sample=False)
+        return kwargs
+    
+    def _response_cache_key(self, prompt, conversation_history, max_new_tokens, session_id):
+        """Cache key for a request, or None when responses aren't deterministic"""
+        if settings.AI_DO_SAMPLE:
+            return None
+        # History only reaches the model for session turns
+        history = conversation_history if session_id is not None else None
+        return ResponseCache.make_key(prompt, history, max_new_tokens)
+    
+    @property
+    def batcher(self):
+        with self._load_lock:
+            if self._batcher is None:
+                self._batcher = BatchScheduler(
+                    self.generate_batch,
+                    max_batch_size=settings.AI_BATCH_MAX_SIZE,
+                    max_wait_ms=settings.AI_BATCH_MAX_WAIT_MS,
+                )
+            return self._batcher
+    
+    @property
+    def kv_cache(self):
+        with self._load_lock:
+            if self._kv_cache is None:
+                self._kv_cache = SessionKVCache(
+                    max_sessions=settings.AI_KV_CACHE_MAX_SESSIONS,
+                    max_bytes=settings.AI_KV_CACHE_MAX_BYTES,
+                )
+            return self._kv_cache
+    
+    @property
+    def response_cache(self):
+        with self._load_lock:
+            if self._response_cache is None:
+                self._response_cache = ResponseCache(
+                    max_entries=settings.AI_RESPONSE_CACHE_MAX_ENTRIES,
+                    ttl=settings.AI_RESPONSE_CACHE_TTL,
+                )
+            return self._response_cache
+    
+    def forget_session(self, session_id):
+        """Drop anything cached for a chat session"""
+        self.kv_cache.invalidate(session_id)
+    
+    def metrics(self):
+        with self._metrics_lock:
+            streaming = {
+                'streams': self._streams,
+                'mean_time_to_first_token_ms': 1000 * self._ttft_total / self._streams if self._streams else 0.0,
+                'max_time_to_first_token_ms': 1000 * self._ttft_max,
+            }
+        return {
+            'backend': self.backend,
+            'batching': self.batcher.metrics(),
+            'streaming': streaming,
+            'kv_cache': self.kv_cache.metrics(),
+            'response_cache': self.response_cache.metrics(),
+        }
+    
     def clean_and_enhance_response(self, response, original_prompt):
         """Clean response and make it more comprehensive"""
-        # Remove unwanted patterns
-        response = re.sub(r'Human:.*', '', response, flags=re.IGNORECASE)
-        response = re.sub(r'Question:.*', '', response, flags=re.IGNORECASE)
-        response = re.sub(r'AI:.*?(?=\w)', '', response, flags=re.IGNORECASE)
-        
-        # Clean whitespace and newlines
-        response = re.sub(r'\n+', ' ', response)
-        response = re.sub(r'\s+', ' ', response)
+        # Remove unwanted patterns, then split on any run of whitespace
+        # (which also collapses newlines and repeated spaces)
+        words = RESPONSE_TAG_PATTERN.sub('', response).split()
         
         # Remove repetitive phrases
-        words = response.split()
         cleaned_words = []
-        for i, word in enumerate(words):
-            if i == 0 or word.lower() != words[i-1].lower():
+        previous = None
+        for word in words:
+            lowered = word.lower()
+            if lowered != previous:
                 cleaned_words.append(word)
+            previous = lowered
         response = ' '.join(cleaned_words)
         
         # Ensure proper sentence structure
-        sentences = [s.strip() for s in response.split('.') if s.strip()]
+        sentences = [s for s in map(str.strip, response.split('.')) if s]
         if sentences:
             # Capitalize first letter of each sentence
-            sentences = [s[0].upper() + s[1:] if s else s for s in sentences]
-            response = '. '.join(sentences)
+            response = '. '.join([s[0].upper() + s[1:] for s in sentences])
             if not response.endswith('.'):
                 response += '.'
         
@@ -180,5 +575,5 @@ class AITextGenerator:
         else:
             return f"""That's a great question about "{prompt}"! I'd be happy to provide you with a comprehensive answer. This topic involves multiple aspects that are worth exploring in detail. Let me break this down for you with clear explanations and relevant examples. Understanding this concept requires looking at both the fundamental principles and practical applications. Would you like me to focus on any particular aspect of this topic?"""
 
-# Initialize the AI service globally
+# Initialize the AI service globally (the model itself loads on first use)
 ai_generator = AITextGenerator()
\ No newline at end of file
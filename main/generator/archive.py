@@ -0,0 +1,121 @@
+"""
+Archival of idle chat sessions.
+
+Sessions not updated for CHAT_ARCHIVE_AFTER_DAYS are moved out of the
+ChatSession/ChatMessage tables into one ChatArchive row each, holding the
+messages as compressed JSON (Zstandard when the zstandard package is
+installed, zlib otherwise). The hot tables then only hold recent chats. An
+archived session is restored into the hot tables the next time it is opened.
+"""
+import json
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatArchive, ChatMessage, ChatSession
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Archives are written once and read rarely, so favour ratio over speed
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 9
+
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("This chat was archived with zstd; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def archive_session(session, codec=None):
+    """Move one session and its messages into a ChatArchive row"""
+    codec = codec or default_codec()
+    messages = [
+        [role, content, timestamp.isoformat()]
+        for role, content, timestamp in session.messages.order_by('timestamp', 'id')
+        .values_list('role', 'content', 'timestamp')
+    ]
+    payload = json.dumps(messages, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    with transaction.atomic():
+        archive = ChatArchive.objects.create(
+            session_id=session.session_id,
+            title=session.title,
+            created_at=session.created_at,
+            updated_at=session.updated_at,
+            message_count=len(messages),
+            codec=codec,
+            data=compress(payload, codec),
+        )
+        session.delete()
+    return archive
+
+
+def archive_idle_sessions(older_than=None, batch_size=100, codec=None):
+    """
+    Archive sessions not updated within `older_than` (default
+    CHAT_ARCHIVE_AFTER_DAYS). Returns the number of sessions archived.
+    """
+    if older_than is None:
+        older_than = timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+    cutoff = timezone.now() - older_than
+    archived = 0
+    while True:
+        batch = list(ChatSession.objects.filter(updated_at__lt=cutoff).order_by('updated_at', 'id')[:batch_size])
+        if not batch:
+            return archived
+        for session in batch:
+            archive_session(session, codec)
+            archived += 1
+
+
+def restore_session(session_id):
+    """
+    Move an archived session back into the hot tables.
+
+    Returns the restored ChatSession, or None if there is no archive for
+    session_id. Messages and the session keep their original created_at;
+    the session's updated_at is now, as opening it is activity, so it isn't
+    archived again straight away.
+    """
+    with transaction.atomic():
+        archive = ChatArchive.objects.select_for_update().filter(session_id=session_id).first()
+        if archive is None:
+            return None
+        messages = json.loads(decompress(bytes(archive.data), archive.codec))
+
+        session = ChatSession.objects.create(session_id=archive.session_id, title=archive.title)
+        # auto_now_add overwrites created_at on save, so put the original
+        # back with a direct update
+        ChatSession.objects.filter(pk=session.pk).update(created_at=archive.created_at)
+        session.created_at = archive.created_at
+
+        restored = ChatMessage.objects.bulk_create([
+            ChatMessage(session=session, role=role, content=content)
+            for role, content, _ in messages
+        ])
+        for message, (_, _, timestamp) in zip(restored, messages):
+            message.timestamp = parse_datetime(timestamp)
+        ChatMessage.objects.bulk_update(restored, ['timestamp'], batch_size=500)
+
+        archive.delete()
+    return session
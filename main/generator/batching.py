@@ -0,0 +1,115 @@
+"""
+Dynamic request batching for text generation.
+
+Concurrent generate calls are queued and a single background thread
+collects them for up to AI_BATCH_MAX_WAIT_MS (or until AI_BATCH_MAX_SIZE
+prompts are waiting), runs them through the model as one padded batch and
+hands each caller its own result.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ('prompt', 'max_new_tokens', 'future', 'enqueued_at')
+
+    def __init__(self, prompt, max_new_tokens):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchScheduler:
+    """Collects concurrent prompts and runs them through run_batch together"""
+
+    def __init__(self, run_batch, max_batch_size, max_wait_ms):
+        # run_batch(prompts, max_new_tokens) -> list of generated texts
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._requests = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    def submit(self, prompt, max_new_tokens):
+        """Queue a prompt and block until its generated text is ready"""
+        self._ensure_started()
+        request = _Request(prompt, max_new_tokens)
+        self._queue.put(request)
+        return request.future.result()
+
+    def _ensure_started(self):
+        # Started on first use so the thread is created in the process that
+        # serves requests, not in a pre-fork master
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='generate-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Block for one request, then gather more until the batch is full or the wait expires"""
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started_at = time.perf_counter()
+
+            # Requests asking for different lengths can't share one generate call
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.max_new_tokens, []).append(request)
+
+            for max_new_tokens, requests in groups.items():
+                self._record(requests, started_at)
+                try:
+                    texts = self.run_batch([r.prompt for r in requests], max_new_tokens)
+                except Exception as e:
+                    logger.error(f"Batched generation failed: {e}")
+                    for request in requests:
+                        request.future.set_exception(e)
+                else:
+                    for request, text in zip(requests, texts):
+                        request.future.set_result(text)
+
+    def _record(self, requests, started_at):
+        with self._metrics_lock:
+            self._batch_sizes[len(requests)] += 1
+            self._requests += len(requests)
+            for request in requests:
+                wait = started_at - request.enqueued_at
+                self._queue_wait_total += wait
+                self._queue_wait_max = max(self._queue_wait_max, wait)
+
+    def metrics(self):
+        with self._metrics_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                'requests': self._requests,
+                'batches': batches,
+                'mean_batch_size': self._requests / batches if batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'mean_queue_wait_ms': 1000 * self._queue_wait_total / self._requests if self._requests else 0.0,
+                'max_queue_wait_ms': 1000 * self._queue_wait_max,
+                'queued': self._queue.qsize(),
+            }
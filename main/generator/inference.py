@@ -0,0 +1,103 @@
+"""
+CPU inference backends for the text generation model.
+
+AI_INFERENCE_BACKEND picks how the loaded model runs:
+
+- 'eager': the model as loaded, in float32
+- 'int8': dynamic int8 quantization of the linear layers (weights stored as
+  int8, activations quantized on the fly), which cuts the matmul cost that
+  dominates decoding on CPU
+- 'compile': the forward pass compiled with torch.compile
+
+A backend that can't be applied on this host falls back to 'eager'.
+"""
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+BACKENDS = ('eager', 'int8', 'compile')
+
+
+def configure_threads(num_threads):
+    """Set torch's intra-op thread count (None leaves torch's default)"""
+    import torch
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+
+def _conv1d_to_linear(model):
+    """
+    Replace GPT-2's Conv1D layers with equivalent nn.Linear layers.
+
+    Conv1D is a linear layer with a transposed weight, but quantize_dynamic
+    only recognises nn.Linear.
+    """
+    from torch import nn
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = nn.Linear(in_features, out_features)
+                linear.weight = nn.Parameter(child.weight.detach().t().contiguous())
+                linear.bias = nn.Parameter(child.bias.detach())
+                setattr(parent, name, linear)
+    return model
+
+
+def _quantize_int8(model):
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+
+    return quantize_dynamic(_conv1d_to_linear(model), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _compile(model):
+    import torch
+
+    # dynamic=True keeps one graph for the growing sequence length instead
+    # of recompiling for every decode step
+    model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def warm_up(model):
+    """Run one tiny forward pass so a backend that fails lazily fails here"""
+    import torch
+
+    with torch.no_grad():
+        model(input_ids=torch.tensor([[0, 1]]))
+
+
+def apply_backend(model, backend, warm_up_model=True):
+    """
+    Return (model, backend actually in use) for an eval-mode model.
+
+    Unknown backends and backends that fail to build or run fall back to the
+    eager model unchanged. With warm_up_model=False the built backend isn't
+    run here (e.g. in a pre-fork master); call warm_up() before serving.
+    """
+    if backend == 'eager':
+        return model, 'eager'
+    if backend not in BACKENDS:
+        logger.error(f"Unknown inference backend {backend!r}, using eager")
+        return model, 'eager'
+
+    try:
+        if backend == 'int8':
+            # Quantize a copy so the eager model is still intact to fall back to
+            optimized = _quantize_int8(copy.deepcopy(model))
+        else:
+            optimized = _compile(model)
+        if warm_up_model:
+            warm_up(optimized)
+    except Exception as e:
+        logger.error(f"Inference backend {backend!r} unavailable, using eager: {e}")
+        # Drop the compiled forward set on the instance, if any
+        model.__dict__.pop('forward', None)
+        return model, 'eager'
+    return optimized, backend
@@ -0,0 +1,110 @@
+"""
+Per-session reuse of the model's attention key/value cache.
+
+Each chat session keeps the token ids of its conversation transcript and the
+past key/values the model computed for them. The next turn in the session
+only has to run the forward pass over the tokens added since, instead of
+re-encoding the whole conversation. Entries are evicted least recently used
+first once AI_KV_CACHE_MAX_SESSIONS sessions or AI_KV_CACHE_MAX_BYTES of
+tensors are held.
+"""
+import threading
+from collections import OrderedDict
+
+
+def cache_nbytes(past_key_values):
+    """Memory held by the key/value tensors of a transformers Cache"""
+    return sum(
+        layer.keys.nbytes + layer.values.nbytes
+        for layer in past_key_values.layers
+        if getattr(layer, 'keys', None) is not None
+    )
+
+
+class _Entry:
+    __slots__ = ('token_ids', 'past_key_values', 'nbytes')
+
+    def __init__(self, token_ids, past_key_values):
+        self.token_ids = token_ids
+        self.past_key_values = past_key_values
+        self.nbytes = cache_nbytes(past_key_values)
+
+
+class SessionKVCache:
+    """LRU map of session id -> (transcript token ids, past key/values)"""
+
+    def __init__(self, max_sessions, max_bytes):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._reused_tokens = 0
+
+    def take(self, session_id, token_ids):
+        """
+        Remove and return the session's past key/values if they cover a prefix
+        of token_ids, along with the number of tokens they cover.
+
+        Generation extends the cache in place, so an entry is handed to one
+        caller at a time; a concurrent turn in the same session simply misses.
+        Returns (None, 0) on a miss.
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+            cached = len(entry.token_ids) if entry is not None else 0
+            # At least one new token must be left for the model to process
+            if entry is None or cached >= len(token_ids) or token_ids[:cached] != entry.token_ids:
+                self._misses += 1
+                return None, 0
+            self._hits += 1
+            self._reused_tokens += cached
+            return entry.past_key_values, cached
+
+    def put(self, session_id, token_ids, past_key_values):
+        """Store the past key/values covering token_ids for a session"""
+        entry = _Entry(list(token_ids), past_key_values)
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[session_id] = entry
+            self._bytes += entry.nbytes
+            while len(self._entries) > self.max_sessions or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._evictions += 1
+
+    def invalidate(self, session_id):
+        """Drop a session's entry, e.g. when the session is deleted"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'sessions': len(self._entries),
+                'bytes': self._bytes,
+                'max_sessions': self.max_sessions,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+                'reused_tokens': self._reused_tokens,
+            }
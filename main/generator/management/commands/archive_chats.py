@@ -0,0 +1,104 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from generator.archive import archive_idle_sessions, default_codec
+from generator.models import ChatArchive, ChatMessage, ChatSession
+from generator.pagination import ChatMessageCursorPagination, ChatSessionCursorPagination
+
+
+class Command(BaseCommand):
+    help = "Compact idle chat sessions into compressed ChatArchive rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=float, default=None,
+                            help="Archive sessions idle this long (default: CHAT_ARCHIVE_AFTER_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--codec', choices=['zstd', 'zlib'], default=None,
+                            help="Compression (default: zstd if installed, else zlib)")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running, archiving every --interval seconds")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Seconds between runs with --loop (default: CHAT_ARCHIVE_INTERVAL)")
+        parser.add_argument('--measure', action='store_true',
+                            help="Report table sizes and chat query latency before and after")
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        older_than = timedelta(days=days if days is not None else settings.CHAT_ARCHIVE_AFTER_DAYS)
+        interval = options['interval'] or settings.CHAT_ARCHIVE_INTERVAL
+
+        while True:
+            before = self._measure() if options['measure'] else None
+            start = time.perf_counter()
+            archived = archive_idle_sessions(older_than, options['batch_size'], options['codec'])
+            self.stdout.write(f"Archived {archived} sessions idle for more than "
+                              f"{older_than.total_seconds() / 86400:g} days "
+                              f"({options['codec'] or default_codec()}) in {time.perf_counter() - start:.2f}s")
+            if before is not None:
+                self._report(before, self._measure())
+            if not options['loop']:
+                return
+            time.sleep(interval)
+
+    def _measure(self):
+        return {
+            'sessions': ChatSession.objects.count(),
+            'messages': ChatMessage.objects.count(),
+            'archives': ChatArchive.objects.count(),
+            'session bytes': self._table_bytes(ChatSession._meta.db_table),
+            'message bytes': self._table_bytes(ChatMessage._meta.db_table),
+            'archive bytes': self._table_bytes(ChatArchive._meta.db_table),
+            'history page ms': self._latency(self._history_page),
+            'messages page ms': self._latency(self._messages_page),
+        }
+
+    def _table_bytes(self, table):
+        """On-disk size of a table and its indexes, when SQLite's dbstat is available"""
+        if connection.vendor != 'sqlite':
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name = %s "
+                    "OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                    [table, table],
+                )
+                return cursor.fetchone()[0] or 0
+        except Exception:
+            return None
+
+    def _history_page(self):
+        ordering = ChatSessionCursorPagination.ordering
+        list(ChatSession.objects.annotate(message_count=Count('messages'))
+             .order_by(*ordering)[:ChatSessionCursorPagination.page_size])
+
+    def _messages_page(self):
+        session = ChatSession.objects.order_by('updated_at').first()
+        if session is not None:
+            list(session.messages.order_by(*ChatMessageCursorPagination.ordering)
+                 .values('id', 'role', 'content', 'timestamp')[:ChatMessageCursorPagination.page_size])
+
+    def _latency(self, query, repeat=20):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            timings.append(time.perf_counter() - start)
+        return 1000 * statistics.median(timings)
+
+    def _report(self, before, after):
+        self.stdout.write(f"{'':<18} {'before':>12} {'after':>12}")
+        for name in before:
+            values = [before[name], after[name]]
+            if None in values:
+                continue
+            if name.endswith('ms'):
+                self.stdout.write(f"{name:<18} {values[0]:>12.2f} {values[1]:>12.2f}")
+            else:
+                self.stdout.write(f"{name:<18} {values[0]:>12,} {values[1]:>12,}")
@@ -0,0 +1,128 @@
+import copy
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.ai_service import AITextGenerator, ai_generator
+from generator.inference import BACKENDS, apply_backend, configure_threads
+
+
+# Fixed prompt set, run through the same templates as chat requests
+PROMPTS = [
+    "What is photosynthesis?",
+    "Explain how a compiler works",
+    "How do vaccines train the immune system?",
+    "Give me a definition of entropy",
+    "What causes the seasons on Earth?",
+    "Tell me about the history of the printing press",
+    "How does a refrigerator keep food cold?",
+    "Explain the difference between weather and climate",
+]
+
+
+class Command(BaseCommand):
+    help = ("Compare latency and throughput of the text generation inference backends "
+            "and check their greedy output against the eager model")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', default=','.join(BACKENDS),
+                            help="Comma-separated backends to compare (eager is always run)")
+        parser.add_argument('--model', default=None,
+                            help="Model name or path (default: the configured model)")
+        parser.add_argument('--max-new-tokens', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Timed runs per prompt for the latency figures")
+        parser.add_argument('--threads', type=int, default=None,
+                            help="torch intra-op threads (default: AI_TORCH_THREADS)")
+
+    def handle(self, *args, **options):
+        backends = [b for b in options['backends'].split(',') if b]
+        unknown = set(backends) - set(BACKENDS)
+        if unknown:
+            raise CommandError(f"Unknown backends: {', '.join(sorted(unknown))}")
+        if 'eager' in backends:
+            backends.remove('eager')
+        backends.insert(0, 'eager')
+
+        generator = AITextGenerator()
+        generator.model_name = options['model'] or ai_generator.model_name
+        generator._load_pretrained(generator.model_name, backend='eager')
+        if options['threads']:
+            configure_threads(options['threads'])
+        eager_model = generator.model
+
+        prompts = [generator._select_prompt(p)[0] for p in PROMPTS]
+        prompts = [p for p in prompts if p is not None]
+        max_new_tokens = options['max_new_tokens']
+
+        self.stdout.write(f"Model {generator.model_name}, {len(prompts)} prompts, "
+                          f"{max_new_tokens} new tokens, greedy decoding")
+        self.stdout.write(f"{'backend':<10} {'p50 ms':>9} {'p95 ms':>9} {'tok/s':>8} "
+                          f"{'batch tok/s':>12} {'exact':>6} {'agree':>6}")
+
+        reference = None
+        for backend in backends:
+            model, used = apply_backend(copy.deepcopy(eager_model), backend)
+            if used != backend:
+                self.stdout.write(f"{backend:<10} unavailable on this host, skipped")
+                continue
+            generator.model = model
+
+            outputs = [self._generate(generator, [p], max_new_tokens)[0] for p in prompts]
+            if reference is None:
+                reference = outputs
+
+            latencies = []
+            for _ in range(options['repeat']):
+                for prompt in prompts:
+                    start = time.perf_counter()
+                    self._generate(generator, [prompt], max_new_tokens)
+                    latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            p50 = statistics.median(latencies)
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+            # Untimed first batch: a compiled model specialises on the batch shape
+            self._generate(generator, prompts, max_new_tokens)
+            start = time.perf_counter()
+            self._generate(generator, prompts, max_new_tokens)
+            batch_rate = len(prompts) * max_new_tokens / (time.perf_counter() - start)
+
+            exact, agree = self._agreement(reference, outputs)
+            self.stdout.write(f"{backend:<10} {1000 * p50:>9.1f} {1000 * p95:>9.1f} "
+                              f"{max_new_tokens / p50:>8.1f} {batch_rate:>12.1f} "
+                              f"{exact:>6.0%} {agree:>6.0%}")
+
+        self.stdout.write("exact: prompts whose greedy tokens match eager exactly; "
+                          "agree: mean share of tokens generated before the first divergence")
+
+    def _generate(self, generator, prompts, max_new_tokens):
+        """Greedy, fixed-length generation returning the new token ids of each prompt"""
+        import torch
+
+        inputs = generator.tokenizer(prompts, return_tensors="pt", max_length=200,
+                                     truncation=True, padding=True)
+        with torch.no_grad():
+            outputs = generator.model.generate(
+                input_ids=inputs['input_ids'],
+                attention_mask=inputs['attention_mask'],
+                max_new_tokens=max_new_tokens,
+                min_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=generator.tokenizer.pad_token_id,
+            )
+        return outputs[:, inputs['input_ids'].shape[1]:].tolist()
+
+    def _agreement(self, reference, outputs):
+        exact = 0
+        shares = []
+        for expected, actual in zip(reference, outputs):
+            same = 0
+            for a, b in zip(expected, actual):
+                if a != b:
+                    break
+                same += 1
+            exact += same == len(expected) == len(actual)
+            shares.append(same / max(len(expected), 1))
+        return exact / len(reference), statistics.mean(shares)
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+from generator.models import ChatMessage, ChatSession
+
+
+BENCH_ALIAS = 'bench_chat_writes'
+
+# SQLite options before and after WAL tuning (see DATABASES in settings)
+SQLITE_CONFIGS = {
+    'rollback': {},
+    'wal': {
+        'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        'timeout': 20,
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+
+
+def write_turn_separately(session, n):
+    """The old chat_api write pattern: each row in its own transaction"""
+    ChatMessage.objects.using(BENCH_ALIAS).create(session=session, role='user', content=f"question {n}")
+    ChatMessage.objects.using(BENCH_ALIAS).create(session=session, role='assistant', content=f"answer {n}" * 40)
+    session.save(using=BENCH_ALIAS)
+
+
+def write_turn_batched(session, n):
+    """The save_chat_turn write pattern: one transaction per turn"""
+    with transaction.atomic(using=BENCH_ALIAS):
+        session.save(using=BENCH_ALIAS)
+        ChatMessage.objects.using(BENCH_ALIAS).bulk_create([
+            ChatMessage(session=session, role='user', content=f"question {n}"),
+            ChatMessage(session=session, role='assistant', content=f"answer {n}" * 40),
+        ])
+
+
+WRITE_PATTERNS = {
+    'separate': write_turn_separately,
+    'batched': write_turn_batched,
+}
+
+
+class Command(BaseCommand):
+    help = ("Measure chat turns written per second by parallel clients on a scratch SQLite "
+            "database, per write pattern and journal configuration")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 8, 16])
+        parser.add_argument('--turns', type=int, default=50, help="Turns written by each client")
+        parser.add_argument('--configs', nargs='+', default=list(SQLITE_CONFIGS),
+                            choices=list(SQLITE_CONFIGS))
+        parser.add_argument('--patterns', nargs='+', default=list(WRITE_PATTERNS),
+                            choices=list(WRITE_PATTERNS))
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'config':<10} {'pattern':<10} {'clients':>7} {'turns/s':>9} "
+                          f"{'locked errors':>14}")
+        for config in options['configs']:
+            for pattern in options['patterns']:
+                for clients in options['clients']:
+                    rate, errors = self._run(config, WRITE_PATTERNS[pattern], clients, options['turns'])
+                    self.stdout.write(f"{config:<10} {pattern:<10} {clients:>7} {rate:>9.1f} {errors:>14}")
+
+    def _run(self, config, write_turn, clients, turns):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self._open_scratch_database(os.path.join(tmp_dir, 'bench.sqlite3'), SQLITE_CONFIGS[config])
+            try:
+                errors = []
+                barrier = threading.Barrier(clients + 1)
+
+                def client():
+                    session = ChatSession.objects.using(BENCH_ALIAS).create(session_id=uuid.uuid4().hex)
+                    failed = 0
+                    barrier.wait()
+                    for n in range(turns):
+                        try:
+                            write_turn(session, n)
+                        except OperationalError:
+                            failed += 1
+                    errors.append(failed)
+                    connections[BENCH_ALIAS].close()
+
+                threads = [threading.Thread(target=client) for _ in range(clients)]
+                for thread in threads:
+                    thread.start()
+                barrier.wait()
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+            finally:
+                connections[BENCH_ALIAS].close()
+                del connections[BENCH_ALIAS]
+                del connections.settings[BENCH_ALIAS]
+        failed = sum(errors)
+        return (clients * turns - failed) / elapsed, failed
+
+    def _open_scratch_database(self, path, sqlite_options):
+        """Register a scratch database alias and create the chat tables in it"""
+        settings_dict = dict(connections.settings['default'], NAME=path, OPTIONS=sqlite_options)
+        connections.settings[BENCH_ALIAS] = settings_dict
+        with connections[BENCH_ALIAS].schema_editor() as editor:
+            editor.create_model(ChatSession)
+            editor.create_model(ChatMessage)
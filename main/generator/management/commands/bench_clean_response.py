@@ -0,0 +1,86 @@
+import random
+import re
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from generator.ai_service import AITextGenerator
+
+
+VOCABULARY = ('the energy of a system is the total work it can do and heat flows '
+              'from hot to cold bodies until they reach equilibrium').split()
+
+
+def sample_generation(words, rng):
+    """Text shaped like raw model output: sentences, repeats, newlines and echoed role tags"""
+    parts = []
+    for _ in range(words):
+        word = rng.choice(VOCABULARY)
+        roll = rng.random()
+        if roll < 0.05:
+            word = f"{word} {word.upper()}"
+        elif roll < 0.15:
+            word += '.'
+        elif roll < 0.18:
+            word += '\n'
+        elif roll < 0.19:
+            word = f"\nAI: {word}"
+        elif roll < 0.195:
+            word = f"\nHuman: {word}"
+        parts.append(word)
+    return ' '.join(parts)
+
+
+def legacy_clean_and_enhance_response(response, original_prompt):
+    """clean_and_enhance_response as it was before the rewrite"""
+    response = re.sub(r'Human:.*', '', response, flags=re.IGNORECASE)
+    response = re.sub(r'Question:.*', '', response, flags=re.IGNORECASE)
+    response = re.sub(r'AI:.*?(?=\w)', '', response, flags=re.IGNORECASE)
+
+    response = re.sub(r'\n+', ' ', response)
+    response = re.sub(r'\s+', ' ', response)
+
+    words = response.split()
+    cleaned_words = []
+    for i, word in enumerate(words):
+        if i == 0 or word.lower() != words[i-1].lower():
+            cleaned_words.append(word)
+    response = ' '.join(cleaned_words)
+
+    sentences = [s.strip() for s in response.split('.') if s.strip()]
+    if sentences:
+        sentences = [s[0].upper() + s[1:] if s else s for s in sentences]
+        response = '. '.join(sentences)
+        if not response.endswith('.'):
+            response += '.'
+
+    if len(response) < 100 and any(word in original_prompt.lower() for word in ['heat', 'energy', 'temperature']):
+        response += " Heat transfer is fundamental in physics and engineering, affecting everything from climate systems to industrial processes."
+
+    return response.strip()
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark clean_and_enhance_response against the previous version"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, nargs='+', default=[50, 200, 1000, 5000])
+        parser.add_argument('--number', type=int, default=0,
+                            help="Calls per timing (default: scaled to the input size)")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        clean = AITextGenerator().clean_and_enhance_response
+        for words in options['words']:
+            text = sample_generation(words, rng)
+            prompt = "What is energy?"
+            if clean(text, prompt) != legacy_clean_and_enhance_response(text, prompt):
+                self.stderr.write(f"{words:>6} words: outputs differ")
+                continue
+
+            number = options['number'] or max(10, 200000 // words)
+            new = min(timeit.repeat(lambda: clean(text, prompt), number=number, repeat=5)) / number
+            old = min(timeit.repeat(lambda: legacy_clean_and_enhance_response(text, prompt),
+                                    number=number, repeat=5)) / number
+            self.stdout.write(f"{words:>6} words  current: {1e6 * new:>9.1f} us  "
+                              f"legacy: {1e6 * old:>9.1f} us  speedup: {old / new:.2f}x")
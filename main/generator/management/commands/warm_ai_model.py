@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from generator.ai_service import ai_generator
+
+
+class Command(BaseCommand):
+    help = "Load the text generation model (downloading it if needed) and run one warm-up generation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-generate', action='store_true',
+                            help="Only load the weights, skip the warm-up generation")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['no_generate']:
+            # load() would run the model once to prepare this process
+            ai_generator.load_weights()
+        else:
+            ai_generator.load()
+        self.stdout.write(f"Loaded {ai_generator.model_name} in {time.perf_counter() - start:.1f}s")
+
+        if not options['no_generate']:
+            start = time.perf_counter()
+            # Short on purpose: the minimum length is capped at max_new_tokens
+            ai_generator.generate_response("Hello", max_new_tokens=8)
+            self.stdout.write(f"Warm-up generation took {time.perf_counter() - start:.1f}s")
@@ -27,6 +27,30 @@ class ChatMessage(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['session', 'timestamp'], name='chatmessage_session_time_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.role}: {self.content[:50]}..."
\ No newline at end of file
+        return f"{self.role}: {self.content[:50]}..."
+
+
+class ChatArchive(models.Model):
+    """A chat session compacted out of the hot tables into one compressed row"""
+    CODEC_CHOICES = [
+        ('zlib', 'zlib'),
+        ('zstd', 'Zstandard'),
+    ]
+    
+    session_id = models.CharField(max_length=100, unique=True)
+    title = models.CharField(max_length=200)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    # JSON list of messages, compressed with `codec`
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES)
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Archived chat: {self.title}"
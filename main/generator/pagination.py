@@ -0,0 +1,44 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CombinedQuerySet:
+    """
+    The union of querysets selecting the same values() columns, which cursor
+    pagination can filter, order and slice like a single queryset.
+
+    Django only allows ordering and slicing on a union, so filters are
+    applied to each queryset before they are combined.
+    """
+
+    def __init__(self, *querysets, ordering=()):
+        self.querysets = querysets
+        self.ordering = ordering
+
+    def filter(self, *args, **kwargs):
+        return CombinedQuerySet(*(qs.filter(*args, **kwargs) for qs in self.querysets), ordering=self.ordering)
+
+    def order_by(self, *ordering):
+        return CombinedQuerySet(*self.querysets, ordering=ordering)
+
+    def __getitem__(self, k):
+        first, *rest = (qs.order_by() for qs in self.querysets)
+        return first.union(*rest, all=True).order_by(*self.ordering)[k]
+
+
+class ChatSessionCursorPagination(CursorPagination):
+    """
+    Most recently updated sessions first; session_id breaks ties between
+    equal timestamps, and is unique across live and archived sessions
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-updated_at', '-session_id')
+
+
+class ChatMessageCursorPagination(CursorPagination):
+    """Messages of one session, oldest first"""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('timestamp', 'id')
@@ -0,0 +1,75 @@
+"""
+Memo of finished responses for deterministic generation.
+
+With sampling turned off (AI_DO_SAMPLE = False) the same prompt and history
+always produce the same response, so repeated questions are answered from
+here instead of running the model. The prompt is keyed exactly as typed:
+the model (and the fallback reply, which echoes it) sees its case and
+spacing, so folding either would answer with another request's text.
+Entries expire after AI_RESPONSE_CACHE_TTL seconds and the least recently
+used are evicted beyond AI_RESPONSE_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def history_hash(conversation_history):
+    """Stable digest of the messages a response was generated after"""
+    messages = [(m['role'], m['content']) for m in conversation_history or []]
+    return hashlib.sha256(json.dumps(messages).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU of response texts with a time-to-live"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def make_key(prompt, conversation_history, max_new_tokens):
+        return (prompt, history_hash(conversation_history), max_new_tokens)
+
+    def get(self, key):
+        """Return the cached response, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+            }
@@ -1,3 +1,593 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .ai_service import PROMPT_MAX_TOKENS, PROMPT_TEMPLATES, AITextGenerator, tokenize_templates
+from .batching import BatchScheduler
+from .kv_cache import SessionKVCache, cache_nbytes
+from .management.commands.bench_clean_response import legacy_clean_and_enhance_response
+from .archive import archive_idle_sessions, archive_session, restore_session
+from .models import ChatArchive, ChatMessage, ChatSession
+from .response_cache import ResponseCache
+
+
+# Fragments that exercise each step: role tags in any case, separators,
+# repeated words, sentence breaks and characters whose case mapping changes
+# their length
+FRAGMENTS = [
+    'Human:', 'human:', 'HUMAN: ', 'Question:', 'question :', 'QuEsTiOn:',
+    'AI:', 'ai: ', 'Ai:--', 'AI: ...', 'AI:\n', 'AI:Human:', 'ai: question:',
+    'hum', 'an:', 'quest', 'ion:', 'a', 'i:',
+    ' ', '  ', '\n', '\n\n', '\t', '\r\n', '\x0b', ' ', ' ', '\x1c',
+    '.', '..', '. ', ' .', '...', '?', '!', ',', '-', ':', "'",
+    'the', 'The', 'THE', 'heat', 'energy', 'word', 'Word',
+    'ß', 'ŉ', 'ǆ', 'İ', 'ſ', 'Σ', 'é', '中文', '1', '42', '_',
+]
+
+
+def random_response(rng):
+    return ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 40)))
+
+
+class CleanAndEnhanceResponseTests(SimpleTestCase):
+    """The rewritten cleaner must produce exactly the legacy output"""
+
+    def setUp(self):
+        self.generator = AITextGenerator()
+
+    def assertMatchesLegacy(self, response, prompt='tell me something'):
+        self.assertEqual(
+            self.generator.clean_and_enhance_response(response, prompt),
+            legacy_clean_and_enhance_response(response, prompt),
+            msg=f"response={response!r} prompt={prompt!r}",
+        )
+
+    def test_random_fragment_strings(self):
+        rng = random.Random(20240514)
+        for _ in range(5000):
+            self.assertMatchesLegacy(random_response(rng), rng.choice(['what is heat', 'hello']))
+
+    def test_random_printable_strings(self):
+        rng = random.Random(7)
+        alphabet = 'aiAIhumnqestoHQ:. \n\t,!?-' + 'ßİΣ'
+        for _ in range(5000):
+            text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+            self.assertMatchesLegacy(text)
+
+    def test_known_cases(self):
+        cases = [
+            '',
+            '   \n\n  ',
+            '...',
+            'AI: hello. hello world',
+            'ai: human: hidden\nshown here',
+            'AI:Human: x',
+            'AI: ... \nnext line',
+            'The the THE answer is is here. second  sentence',
+            'Question: echoed\nAnswer text.',
+            'ß is lowercase. ŉ starts this one',
+        ]
+        for response in cases:
+            self.assertMatchesLegacy(response)
+            self.assertMatchesLegacy(response, 'what is heat energy')
+
+
+def create_session(session_id, messages):
+    session = ChatSession.objects.create(session_id=session_id, title=session_id)
+    ChatMessage.objects.bulk_create([
+        ChatMessage(session=session, role='user' if i % 2 == 0 else 'assistant', content=f"message {i}")
+        for i in range(messages)
+    ])
+    return session
+
+
+
+def fake_load_pretrained(generator, model_name, backend=None):
+    generator.model = mock.Mock()
+    generator.backend = backend or 'eager'
+
+
+@mock.patch('generator.ai_service.warm_up')
+@mock.patch('generator.ai_service.configure_threads')
+@mock.patch.object(AITextGenerator, '_load_pretrained', autospec=True, side_effect=fake_load_pretrained)
+class ModelLoadTests(SimpleTestCase):
+
+    @mock.patch('generator.ai_service.gc.freeze')
+    def test_pre_fork_load_runs_nothing(self, freeze, load_pretrained, configure_threads, warm_up):
+        AITextGenerator().share_with_workers()
+        load_pretrained.assert_called_once()
+        configure_threads.assert_not_called()
+        warm_up.assert_not_called()
+
+    def test_each_process_prepares_once(self, load_pretrained, configure_threads, warm_up):
+        generator = AITextGenerator()
+        generator.load()
+        generator.load()
+        self.assertEqual(warm_up.call_count, 1)
+        # A forked worker prepares again, but reuses the loaded weights
+        with mock.patch('generator.ai_service.os.getpid', return_value=-1):
+            generator.load()
+        self.assertEqual(warm_up.call_count, 2)
+        self.assertEqual(configure_threads.call_count, 2)
+        load_pretrained.assert_called_once()
+
+    def test_failed_warm_up_falls_back_to_eager(self, load_pretrained, configure_threads, warm_up):
+        warm_up.side_effect = RuntimeError('backend failed')
+        generator = AITextGenerator()
+        generator._load_pretrained(generator.model_name, 'compile')
+        generator.load()
+        self.assertEqual(generator.backend, 'eager')
+
+    def test_warm_command_can_skip_running_the_model(self, load_pretrained, configure_threads, warm_up):
+        generator = AITextGenerator()
+        with mock.patch('generator.management.commands.warm_ai_model.ai_generator', generator):
+            call_command('warm_ai_model', '--no-generate', stdout=io.StringIO())
+        load_pretrained.assert_called_once()
+        warm_up.assert_not_called()
+
+
+def tiny_gpt2_config():
+    """A GPT-2 configuration small enough to build and run in a test"""
+    from transformers import GPT2Config
+    return GPT2Config(n_layer=2, n_head=2, n_embd=8, vocab_size=50, n_positions=64, bos_token_id=0, eos_token_id=0)
+
+
+class PretrainedLoadTests(SimpleTestCase):
+
+    def setUp(self):
+        import torch
+        from transformers import GPT2LMHeadModel
+        self.checkpoint = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.checkpoint, ignore_errors=True)
+        config = tiny_gpt2_config()
+        config.save_pretrained(self.checkpoint)
+        # A checkpoint saved before safetensors: pickled weights only
+        torch.save(GPT2LMHeadModel(config).state_dict(), os.path.join(self.checkpoint, 'pytorch_model.bin'))
+
+    @override_settings(AI_INFERENCE_BACKEND='eager')
+    @mock.patch('transformers.GPT2Tokenizer.from_pretrained')
+    def test_loads_pickled_weights_without_safetensors(self, tokenizer):
+        tokenizer.return_value.return_value = {'input_ids': [1]}
+        generator = AITextGenerator()
+        generator._load_pretrained(self.checkpoint)
+        self.assertTrue(generator.is_loaded)
+        self.assertEqual(generator.model.config.n_embd, 8)
+
+    def test_minimum_length_never_exceeds_the_maximum(self):
+        generator = AITextGenerator()
+        generator.tokenizer = mock.Mock(pad_token_id=0, eos_token_id=0)
+        kwargs = generator._generation_kwargs(8)
+        self.assertEqual((kwargs['min_new_tokens'], kwargs['max_new_tokens']), (8, 8))
+        self.assertEqual(generator._generation_kwargs(200)['min_new_tokens'], 50)
+
+
+
+class BatchSchedulerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.batches = []
+
+    def run_batch(self, prompts, max_new_tokens):
+        self.batches.append((sorted(prompts), max_new_tokens))
+        if max_new_tokens == 0:
+            raise ValueError('no tokens')
+        return [f"{prompt}:{max_new_tokens}" for prompt in prompts]
+
+    def submit_all(self, requests):
+        # A long wait, so the batch closes once every request has arrived
+        scheduler = BatchScheduler(self.run_batch, max_batch_size=len(requests), max_wait_ms=5000)
+        with ThreadPoolExecutor(len(requests)) as pool:
+            return [pool.submit(scheduler.submit, *request) for request in requests], scheduler
+
+    def test_concurrent_requests_share_a_batch(self):
+        futures, scheduler = self.submit_all([(f"p{i}", 10) for i in range(4)])
+        self.assertEqual([future.result() for future in futures], [f"p{i}:10" for i in range(4)])
+        self.assertEqual(self.batches, [(['p0', 'p1', 'p2', 'p3'], 10)])
+        self.assertEqual(scheduler.metrics()['batch_size_histogram'], {4: 1})
+
+    def test_failures_reach_only_their_callers(self):
+        futures, _ = self.submit_all([('a', 10), ('b', 0), ('c', 10), ('d', 0)])
+        self.assertEqual(futures[0].result(), 'a:10')
+        self.assertEqual(futures[2].result(), 'c:10')
+        for future in (futures[1], futures[3]):
+            with self.assertRaisesMessage(ValueError, 'no tokens'):
+                future.result()
+        # Different lengths are generated separately
+        self.assertCountEqual(self.batches, [(['a', 'c'], 10), (['b', 'd'], 0)])
+
+
+def kv_cache_of(tokens, layers=2):
+    """A DynamicCache holding `tokens` positions of zeros, 64 bytes per position and layer"""
+    import torch
+    from transformers import DynamicCache
+    cache = DynamicCache()
+    for layer in range(layers):
+        cache.update(torch.zeros(1, 2, tokens, 2), torch.zeros(1, 2, tokens, 2), layer)
+    return cache
+
+
+class SessionKVCacheTests(SimpleTestCase):
+
+    def test_nbytes_follow_crop(self):
+        cache = kv_cache_of(10)
+        self.assertEqual(cache_nbytes(cache), 10 * 64)
+        cache.crop(-3)
+        self.assertEqual((cache.get_seq_length(), cache_nbytes(cache)), (7, 7 * 64))
+
+    def test_take_needs_a_prefix_and_a_new_token(self):
+        kv = SessionKVCache(max_sessions=4, max_bytes=10 ** 6)
+        for token_ids, expected in (([1, 2, 3, 4], 3), ([1, 2, 3], 0), ([1, 9, 3, 4], 0)):
+            kv.put('s', [1, 2, 3], kv_cache_of(3))
+            self.assertEqual(kv.take('s', token_ids)[1], expected)
+        # Taken entries are gone until put back
+        self.assertEqual(kv.take('s', [1, 2, 3, 4]), (None, 0))
+        self.assertEqual(kv.metrics()['reused_tokens'], 3)
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        kv = SessionKVCache(max_sessions=10, max_bytes=25 * 64)
+        kv.put('a', [1], kv_cache_of(10))
+        kv.put('b', [1], kv_cache_of(10))
+        kv.put('c', [1], kv_cache_of(10))
+        metrics = kv.metrics()
+        self.assertEqual((metrics['sessions'], metrics['bytes'], metrics['evictions']), (2, 20 * 64, 1))
+        self.assertEqual(kv.take('a', [1, 2]), (None, 0))
+        # Too large to ever fit: not stored, nothing evicted for it
+        kv.put('d', [1], kv_cache_of(30))
+        self.assertEqual(kv.metrics()['sessions'], 2)
+        self.assertEqual(kv.take('d', [1, 2]), (None, 0))
+
+    def test_evicts_past_max_sessions(self):
+        kv = SessionKVCache(max_sessions=1, max_bytes=10 ** 6)
+        kv.put('a', [1], kv_cache_of(1))
+        kv.put('b', [1], kv_cache_of(1))
+        self.assertEqual(kv.take('a', [1, 2])[1], 0)
+        self.assertEqual(kv.take('b', [1, 2])[1], 1)
+
+    def test_invalidated_sessions_are_dropped(self):
+        # Deleted or archived sessions are forgotten through invalidate
+        kv = SessionKVCache(max_sessions=4, max_bytes=10 ** 6)
+        kv.put('s', [1], kv_cache_of(4))
+        kv.invalidate('s')
+        self.assertEqual(kv.metrics()['bytes'], 0)
+        self.assertEqual(kv.take('s', [1, 2]), (None, 0))
+
+
+class FakeTokenizer:
+    """One token per character, enough for generating in a session"""
+
+    pad_token_id = eos_token_id = 0
+
+    def __call__(self, texts):
+        return {'input_ids': [[1 + ord(c) % 40 for c in text] for text in texts]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return ' '.join(str(int(i)) for i in ids)
+
+
+@override_settings(AI_DO_SAMPLE=False)
+class SessionGenerationTests(SimpleTestCase):
+
+    def generator(self):
+        import torch
+        from transformers import GPT2LMHeadModel
+        torch.manual_seed(0)
+        generator = AITextGenerator()
+        generator.model = GPT2LMHeadModel(tiny_gpt2_config()).eval()
+        generator.tokenizer = FakeTokenizer()
+        return generator
+
+    def test_cache_is_cropped_to_the_transcript_and_reused(self):
+        history = [{'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'hello'}]
+        generator = self.generator()
+        generator._generate_in_session('s', history, [5, 6], 4)
+        transcript = generator._session_token_ids(history, [5, 6], 4)
+        entry = generator.kv_cache._entries['s']
+        self.assertEqual(entry.token_ids, transcript)
+        self.assertEqual(entry.past_key_values.get_seq_length(), len(transcript))
+
+        history += [{'role': 'user', 'content': 'again'}, {'role': 'assistant', 'content': 'ok'}]
+        cached = generator._generate_in_session('s', history, [7], 4)
+        self.assertEqual(generator.kv_cache.metrics()['reused_tokens'], len(transcript))
+        # The same text as generating the turn from scratch
+        self.assertEqual(cached, self.generator()._generate_in_session('s', history, [7], 4))
+
+
+class PromptTemplateTests(SimpleTestCase):
+    """Spliced template ids against tokenising the whole prompt string"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from tokenizers import ByteLevelBPETokenizer
+        from transformers import GPT2Tokenizer
+        # A small byte-level BPE with GPT-2's pre-tokenisation, trained on the
+        # templates so their words merge as they would in GPT-2's vocabulary
+        corpus = [f"{prefix} question {suffix}" for prefix, suffix in PROMPT_TEMPLATES.values()]
+        bpe = ByteLevelBPETokenizer()
+        bpe.train_from_iterator(corpus * 10, vocab_size=500, min_frequency=1, show_progress=False)
+        tmp = tempfile.mkdtemp()
+        try:
+            bpe.save_model(tmp)
+            cls.tokenizer = GPT2Tokenizer(os.path.join(tmp, 'vocab.json'), os.path.join(tmp, 'merges.txt'))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_spliced_ids_match_the_whole_prompt(self):
+        generator = AITextGenerator()
+        generator.tokenizer = self.tokenizer
+        generator._template_ids = tokenize_templates(self.tokenizer)
+        prompts = [
+            'What is a question?', 'Explain  the answer', 'how does it work\n',
+            'definition of café ', ' hello', 'emoji 😀', 'long ' * 300,
+        ]
+        for prompt in prompts:
+            with self.subTest(prompt=prompt[:20]):
+                base_prompt, prompt_ids, canned_response = generator._select_prompt(prompt)
+                self.assertIsNone(canned_response)
+                self.assertEqual(prompt_ids, self.tokenizer(base_prompt)['input_ids'][:PROMPT_MAX_TOKENS])
+
+
+class ResponseCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('generator.response_cache.time.monotonic', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_and_miss(self):
+        cache = ResponseCache(max_entries=4, ttl=60)
+        key = ResponseCache.make_key('Hi there', None, 150)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, 'Hello!')
+        self.assertEqual(cache.get(key), 'Hello!')
+        self.assertIsNone(cache.get(ResponseCache.make_key('Hi there', None, 50)))
+        history = [{'role': 'user', 'content': 'earlier'}]
+        self.assertIsNone(cache.get(ResponseCache.make_key('Hi there', history, 150)))
+        metrics = cache.metrics()
+        self.assertEqual((metrics['hits'], metrics['misses']), (1, 3))
+
+    def test_prompt_is_keyed_as_typed(self):
+        cache = ResponseCache(max_entries=4, ttl=60)
+        cache.put(ResponseCache.make_key('what is HEAT', None, 150), 'what is HEAT...')
+        self.assertIsNone(cache.get(ResponseCache.make_key('What is heat', None, 150)))
+        self.assertIsNone(cache.get(ResponseCache.make_key('what  is HEAT', None, 150)))
+
+    def test_entries_expire(self):
+        cache = ResponseCache(max_entries=4, ttl=60)
+        key = ResponseCache.make_key('Hi', None, 150)
+        cache.put(key, 'Hello!')
+        self.clock.return_value += 60
+        self.assertEqual(cache.get(key), 'Hello!')
+        self.clock.return_value += 1
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.metrics()['entries'], 0)
+
+    def test_least_recently_used_are_evicted(self):
+        cache = ResponseCache(max_entries=2, ttl=60)
+        a, b, c = (ResponseCache.make_key(prompt, None, 150) for prompt in 'abc')
+        cache.put(a, 'A')
+        cache.put(b, 'B')
+        cache.get(a)
+        cache.put(c, 'C')
+        self.assertEqual([cache.get(a), cache.get(b), cache.get(c)], ['A', None, 'C'])
+
+
+class ChatHistoryApiTests(TestCase):
+
+    def setUp(self):
+        for i in range(5):
+            create_session(f"session-{i}", messages=i + 1)
+
+    def test_one_query_regardless_of_session_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('chat_history'))
+        counts = {chat['id']: chat['message_count'] for chat in response.json()['chats']}
+        self.assertEqual(counts, {f"session-{i}": i + 1 for i in range(5)})
+
+    def test_cursor_pagination_visits_every_session_once(self):
+        seen = []
+        url = reverse('chat_history') + '?page_size=2'
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()
+            self.assertLessEqual(len(data['chats']), 2)
+            seen.extend(chat['id'] for chat in data['chats'])
+            url = data['next']
+        self.assertEqual(sorted(seen), [f"session-{i}" for i in range(5)])
+
+    def test_archived_sessions_are_listed(self):
+        archive_session(ChatSession.objects.get(session_id='session-0'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('chat_history'))
+        chats = {chat['id']: chat for chat in response.json()['chats']}
+        self.assertEqual(len(chats), 5)
+        self.assertTrue(chats['session-0']['archived'])
+        self.assertEqual(chats['session-0']['message_count'], 1)
+        self.assertFalse(chats['session-1']['archived'])
+
+    def test_pagination_spans_live_and_archived_sessions(self):
+        for session_id in ('session-1', 'session-3'):
+            archive_session(ChatSession.objects.get(session_id=session_id))
+        seen = []
+        url = reverse('chat_history') + '?page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(chat['id'] for chat in data['chats'])
+            url = data['next']
+        self.assertEqual(sorted(seen), [f"session-{i}" for i in range(5)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('chat_history') + '?cursor=bogus')
+        self.assertEqual(response.status_code, 404)
+
+
+class ChatMessagesApiTests(TestCase):
+
+    def setUp(self):
+        create_session('long', messages=25)
+
+    def test_pages_in_order_with_constant_queries(self):
+        contents = []
+        url = reverse('chat_messages', args=['long']) + '?page_size=10'
+        while url:
+            # Session lookup + one page of messages
+            with self.assertNumQueries(2):
+                data = self.client.get(url).json()
+            contents.extend(message['content'] for message in data['messages'])
+            url = data['next']
+        self.assertEqual(contents, [f"message {i}" for i in range(25)])
+
+    def test_unknown_session(self):
+        response = self.client.get(reverse('chat_messages', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(AI_HISTORY_MAX_MESSAGES=6)
+@mock.patch('generator.views.ai_generator.generate_response', return_value='A generated reply.')
+class ChatApiTests(TestCase):
+
+    def post(self, message, session_id=None):
+        return self.client.post(reverse('chat_api'), data=json.dumps({
+            'message': message, 'session_id': session_id
+        }), content_type='application/json')
+
+    def test_first_turn_queries(self, generate_response):
+        # One transaction (a savepoint inside TestCase): insert the titled
+        # session, then both messages
+        with self.assertNumQueries(4):
+            response = self.post('Hello there')
+        self.assertEqual(response.json()['title'], 'Hello there')
+        self.assertEqual(
+            list(ChatMessage.objects.values_list('role', 'content')),
+            [('user', 'Hello there'), ('assistant', 'A generated reply.')],
+        )
+        self.assertEqual(generate_response.call_args.kwargs['conversation_history'], [])
+
+    def test_later_turn_queries_and_history(self, generate_response):
+        create_session('chat', messages=4)
+        # Session with message count, history window, then one transaction
+        # updating the session and inserting both messages
+        with self.assertNumQueries(6):
+            response = self.post('Next question', session_id='chat')
+        self.assertEqual(response.json()['title'], 'chat')
+        history = generate_response.call_args.kwargs['conversation_history']
+        self.assertEqual([m['content'] for m in history], [f"message {i}" for i in range(4)])
+
+    def test_history_window_is_bounded(self, generate_response):
+        create_session('chat', messages=15)
+        with self.assertNumQueries(6):
+            self.post('Next question', session_id='chat')
+        history = generate_response.call_args.kwargs['conversation_history']
+        self.assertLessEqual(len(history), 6)
+        # The window ends with the latest message before this turn
+        self.assertEqual(history[-1]['content'], 'message 14')
+
+    def test_turns_are_batched_by_default(self, generate_response):
+        create_session('chat', messages=2)
+        self.post('Next question', session_id='chat')
+        self.assertIsNone(generate_response.call_args.kwargs['session_id'])
+
+    @override_settings(AI_SESSION_CONTEXT=True)
+    def test_session_context_opt_in(self, generate_response):
+        create_session('chat', messages=2)
+        self.post('Next question', session_id='chat')
+        self.assertEqual(generate_response.call_args.kwargs['session_id'], 'chat')
+
+
+
+def fake_stream_response(message, **kwargs):
+    yield 'token', 'A generated'
+    yield 'token', ' reply.'
+    yield 'done', 'A generated reply.'
+
+
+@mock.patch('generator.views.ai_generator.stream_response', side_effect=fake_stream_response)
+class ChatStreamApiTests(TestCase):
+
+    def test_events_and_saved_turn(self, stream_response):
+        response = self.client.post(reverse('chat_stream'), data=json.dumps({
+            'message': 'Hello there', 'session_id': 'chat'
+        }), content_type='application/json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = []
+        for chunk in response.streaming_content:
+            event, data = chunk.decode().strip().split('\n')
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+            if events[-1][0] == 'token':
+                # Nothing is saved until the reply is complete
+                self.assertFalse(ChatMessage.objects.exists())
+
+        self.assertEqual(events, [
+            ('token', {'text': 'A generated'}),
+            ('token', {'text': ' reply.'}),
+            ('done', {'message': 'A generated reply.', 'session_id': 'chat', 'title': 'Hello there'}),
+        ])
+        self.assertEqual(
+            list(ChatMessage.objects.filter(session__session_id='chat').values_list('role', 'content')),
+            [('user', 'Hello there'), ('assistant', 'A generated reply.')],
+        )
+
+    def test_empty_message(self, stream_response):
+        response = self.client.post(reverse('chat_stream'), data=json.dumps({'message': ' '}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        stream_response.assert_not_called()
+
+
+class ChatArchiveTests(TestCase):
+
+    def setUp(self):
+        self.session = create_session('old', messages=7)
+        self.messages = list(self.session.messages.values_list('role', 'content', 'timestamp'))
+
+    def test_archive_and_restore_round_trip(self):
+        archive_session(self.session)
+        self.assertFalse(ChatSession.objects.filter(session_id='old').exists())
+        self.assertEqual(ChatMessage.objects.count(), 0)
+        self.assertEqual(ChatArchive.objects.get(session_id='old').message_count, 7)
+
+        session = restore_session('old')
+        self.assertEqual(list(session.messages.values_list('role', 'content', 'timestamp')), self.messages)
+        self.assertEqual(session.title, 'old')
+        self.assertFalse(ChatArchive.objects.exists())
+
+    def test_restore_marks_session_active(self):
+        ChatSession.objects.filter(pk=self.session.pk).update(updated_at=timezone.now() - timedelta(days=60))
+        self.session.refresh_from_db()
+        archive_session(self.session)
+        before = timezone.now()
+        restore_session('old')
+        session = ChatSession.objects.get(session_id='old')
+        self.assertGreaterEqual(session.updated_at, before)
+        self.assertEqual(session.created_at, self.session.created_at)
+
+    def test_only_idle_sessions_are_archived(self):
+        create_session('recent', messages=2)
+        ChatSession.objects.filter(session_id='old').update(updated_at=timezone.now() - timedelta(days=60))
+        with self.settings(CHAT_ARCHIVE_AFTER_DAYS=30):
+            self.assertEqual(archive_idle_sessions(), 1)
+        self.assertEqual(list(ChatSession.objects.values_list('session_id', flat=True)), ['recent'])
+
+    def test_messages_api_restores_archived_session(self):
+        archive_session(self.session)
+        response = self.client.get(reverse('chat_messages', args=['old']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['content'] for m in response.json()['messages']], [m[1] for m in self.messages])
+
+    def test_delete_archived_session(self):
+        archive_session(self.session)
+        response = self.client.delete(reverse('delete_chat', args=['old']))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ChatArchive.objects.exists())
@@ -8,7 +8,9 @@ urlpatterns = [
     
     # API endpoints
     path('api/chat/', views.chat_api, name='chat_api'),
+    path('api/chat/stream/', views.chat_stream_api, name='chat_stream'),
     path('api/history/', views.chat_history_api, name='chat_history'),
+    path('api/metrics/', views.metrics_api, name='generator_metrics'),
     path('api/chat/<str:session_id>/', views.chat_messages_api, name='chat_messages'),
     path('api/chat/<str:session_id>/delete/', views.delete_chat_api, name='delete_chat'),
 ]
\ No newline at end of file
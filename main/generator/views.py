@@ -1,15 +1,23 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Value
+from asgiref.sync import sync_to_async
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 import json
 import uuid
 import logging
-from .models import ChatSession, ChatMessage
+from .models import ChatSession, ChatMessage, ChatArchive
+from .archive import restore_session
 from .ai_service import ai_generator
+from .pagination import ChatMessageCursorPagination, ChatSessionCursorPagination, CombinedQuerySet
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +38,73 @@ def generate_text(request):
     
     return render(request, "generator/generate.html", {"output": output_text})
 
+def get_or_create_session(session_id):
+    """
+    Return the chat session with this id, or a new unsaved one (with a new id
+    if none given) that save_chat_turn inserts. Archived sessions are
+    restored first.
+    
+    The session carries message_count, the number of messages it held
+    before this turn, fetched in the same query.
+    """
+    if session_id:
+        sessions = ChatSession.objects.annotate(message_count=Count('messages'))
+        try:
+            return sessions.get(session_id=session_id)
+        except ChatSession.DoesNotExist:
+            if restore_session(session_id) is not None:
+                return sessions.get(session_id=session_id)
+    session = ChatSession(session_id=session_id or str(uuid.uuid4()))
+    session.message_count = 0
+    return session
+
+def generation_session_id(session):
+    """
+    The session_id to generate a turn under, or None.
+
+    Generating in a session gives the model the history as context and
+    reuses its cached key/values, but runs the turn on its own; without one
+    concurrent turns are batched. AI_SESSION_CONTEXT opts into the former.
+    """
+    return session.session_id if settings.AI_SESSION_CONTEXT else None
+
+def recent_history(session):
+    """
+    The messages before this turn to give the model as context.
+    
+    At most AI_HISTORY_MAX_MESSAGES are fetched. Once a session is longer
+    the window start advances in steps of half that size instead of one
+    message per turn, so consecutive turns share their leading messages and
+    the session's cached key/values stay reusable.
+    """
+    count = session.message_count
+    if not count:
+        return []
+    limit = settings.AI_HISTORY_MAX_MESSAGES
+    step = max(limit // 2, 1)
+    start = -(-(count - limit) // step) * step if count > limit else 0
+    return list(session.messages.order_by('timestamp', 'id').values('role', 'content')[start:count])
+
+def save_chat_turn(session, message, ai_response):
+    """
+    Save a turn's user and assistant messages and the session in one transaction.
+    
+    A turn is a single write transaction instead of one per row, so
+    concurrent chats contend for SQLite's write lock once per turn.
+    """
+    # Update session title for first message
+    if session.message_count == 0:
+        title = message[:50] + ('...' if len(message) > 50 else '')
+        session.title = title
+    
+    with transaction.atomic():
+        # Inserts a new session, otherwise bumps updated_at
+        session.save()
+        ChatMessage.objects.bulk_create([
+            ChatMessage(session=session, role='user', content=message),
+            ChatMessage(session=session, role='assistant', content=ai_response),
+        ])
+
 # API endpoint for chat interface
 @csrf_exempt
 @api_view(['POST'])
@@ -44,44 +119,22 @@ def chat_api(request):
             return Response({'error': 'Message is required'}, status=400)
         
         # Get or create session
-        if session_id:
-            try:
-                session = ChatSession.objects.get(session_id=session_id)
-            except ChatSession.DoesNotExist:
-                session = ChatSession.objects.create(session_id=session_id)
-        else:
-            session_id = str(uuid.uuid4())
-            session = ChatSession.objects.create(session_id=session_id)
-        
-        # Save user message
-        ChatMessage.objects.create(
-            session=session,
-            role='user',
-            content=message
-        )
+        session = get_or_create_session(session_id)
+        session_id = session.session_id
         
         # Get conversation history
-        history = list(session.messages.values('role', 'content'))
+        history = recent_history(session)
         
         # Generate comprehensive AI response
         ai_response = ai_generator.generate_response(
             message, 
-            conversation_history=history[:-1],
-            max_new_tokens=200  # Longer responses
+            conversation_history=history,
+            max_new_tokens=200,  # Longer responses
+            session_id=generation_session_id(session)
         )
         
-        # Save AI response
-        ChatMessage.objects.create(
-            session=session,
-            role='assistant',
-            content=ai_response
-        )
-        
-        # Update session title for first message
-        if session.messages.count() == 2:
-            title = message[:50] + ('...' if len(message) > 50 else '')
-            session.title = title
-            session.save()
+        # Save the user message and AI response
+        save_chat_turn(session, message, ai_response)
         
         return Response({
             'message': ai_response,
@@ -93,48 +146,161 @@ def chat_api(request):
         logger.error(f"Chat API error: {e}")
         return Response({'error': 'Internal server error'}, status=500)
 
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def save_streamed_reply(session, message, ai_response):
+    """Persist the turn once the stream completes"""
+    save_chat_turn(session, message, ai_response)
+    return {
+        'message': ai_response,
+        'session_id': session.session_id,
+        'title': session.title
+    }
+
+def chat_stream_events(session, message, history):
+    """Yield SSE events for a chat turn, saving the reply at the end"""
+    tokens = ai_generator.stream_response(
+        message, conversation_history=history, max_new_tokens=200,
+        session_id=generation_session_id(session)
+    )
+    for kind, text in tokens:
+        if kind == 'token':
+            yield sse_event('token', {'text': text})
+        else:
+            yield sse_event('done', save_streamed_reply(session, message, text))
+
+async def async_chat_stream_events(session, message, history):
+    """Async version of chat_stream_events for ASGI servers"""
+    # Generation blocks, so each step runs in a worker thread and the event
+    # loop stays free to serve other connections between tokens
+    tokens = ai_generator.stream_response(
+        message, conversation_history=history, max_new_tokens=200,
+        session_id=generation_session_id(session)
+    )
+    next_token = sync_to_async(next, thread_sensitive=False)
+    while True:
+        item = await next_token(tokens, None)
+        if item is None:
+            break
+        kind, text = item
+        if kind == 'token':
+            yield sse_event('token', {'text': text})
+        else:
+            reply = await sync_to_async(save_streamed_reply)(session, message, text)
+            yield sse_event('done', reply)
+
+# Streaming API endpoint for chat interface
+@csrf_exempt
+@require_http_methods(['POST'])
+def chat_stream_api(request):
+    """
+    Chat API that streams the reply as server-sent events.
+    
+    Emits a "token" event ({"text": ...}) for each piece of text as the model
+    produces it and a final "done" event with the same payload chat_api
+    returns, after the turn has been saved.
+    """
+    try:
+        data = json.loads(request.body)
+        message = data.get('message', '').strip()
+        session_id = data.get('session_id')
+        
+        if not message:
+            return JsonResponse({'error': 'Message is required'}, status=400)
+        
+        session = get_or_create_session(session_id)
+        
+        # Get conversation history
+        history = recent_history(session)
+    except Exception as e:
+        logger.error(f"Chat stream API error: {e}")
+        return JsonResponse({'error': 'Internal server error'}, status=500)
+    
+    if isinstance(request, ASGIRequest):
+        events = async_chat_stream_events(session, message, history)
+    else:
+        events = chat_stream_events(session, message, history)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @api_view(['GET'])
 def chat_history_api(request):
-    """Get chat history"""
+    """
+    Get chat history, a page of sessions at a time.
+    
+    Archived sessions are listed alongside live ones, flagged 'archived';
+    opening one restores it.
+    """
     try:
-        sessions = ChatSession.objects.all()[:20]
+        fields = ('session_id', 'title', 'created_at', 'updated_at', 'message_count', 'archived')
+        sessions = ChatSession.objects.annotate(
+            message_count=Count('messages'), archived=Value(False)
+        ).values(*fields)
+        archives = ChatArchive.objects.annotate(archived=Value(True)).values(*fields)
+        paginator = ChatSessionCursorPagination()
         history = []
         
-        for session in sessions:
+        for session in paginator.paginate_queryset(CombinedQuerySet(sessions, archives), request):
             history.append({
-                'id': session.session_id,
-                'title': session.title,
-                'created_at': session.created_at.isoformat(),
-                'updated_at': session.updated_at.isoformat(),
-                'message_count': session.messages.count()
+                'id': session['session_id'],
+                'title': session['title'],
+                'created_at': session['created_at'].isoformat(),
+                'updated_at': session['updated_at'].isoformat(),
+                'message_count': session['message_count'],
+                'archived': session['archived']
             })
         
-        return Response({'chats': history})
+        return Response({
+            'chats': history,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link()
+        })
+    except NotFound:
+        return Response({'error': 'Invalid cursor'}, status=404)
     except Exception as e:
         logger.error(f"History API error: {e}")
         return Response({'error': 'Failed to fetch history'}, status=500)
 
 @api_view(['GET'])
 def chat_messages_api(request, session_id):
-    """Get messages for specific session"""
+    """Get messages for specific session, a page at a time"""
     try:
-        session = ChatSession.objects.get(session_id=session_id)
+        try:
+            session = ChatSession.objects.get(session_id=session_id)
+        except ChatSession.DoesNotExist:
+            # Archived sessions are brought back when opened
+            session = restore_session(session_id)
+            if session is None:
+                raise
+        paginator = ChatMessageCursorPagination()
+        page = paginator.paginate_queryset(
+            session.messages.values('id', 'role', 'content', 'timestamp'), request
+        )
         messages = []
         
-        for msg in session.messages.all():
+        for msg in page:
             messages.append({
-                'role': msg.role,
-                'content': msg.content,
-                'timestamp': msg.timestamp.isoformat()
+                'role': msg['role'],
+                'content': msg['content'],
+                'timestamp': msg['timestamp'].isoformat()
             })
         
         return Response({
             'session_id': session_id,
             'title': session.title,
-            'messages': messages
+            'messages': messages,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link()
         })
     except ChatSession.DoesNotExist:
         return Response({'error': 'Session not found'}, status=404)
+    except NotFound:
+        return Response({'error': 'Invalid cursor'}, status=404)
     except Exception as e:
         logger.error(f"Messages API error: {e}")
         return Response({'error': 'Failed to fetch messages'}, status=500)
@@ -144,11 +310,19 @@ def chat_messages_api(request, session_id):
 def delete_chat_api(request, session_id):
     """Delete chat session"""
     try:
-        session = ChatSession.objects.get(session_id=session_id)
-        session.delete()
+        deleted, _ = ChatArchive.objects.filter(session_id=session_id).delete()
+        if not deleted:
+            session = ChatSession.objects.get(session_id=session_id)
+            session.delete()
+        ai_generator.forget_session(session_id)
         return Response({'message': 'Chat deleted successfully'})
     except ChatSession.DoesNotExist:
         return Response({'error': 'Session not found'}, status=404)
     except Exception as e:
         logger.error(f"Delete API error: {e}")
-        return Response({'error': 'Failed to delete chat'}, status=500)
\ No newline at end of file
+        return Response({'error': 'Failed to delete chat'}, status=500)
+
+@api_view(['GET'])
+def metrics_api(request):
+    """Get text generation metrics"""
+    return Response(ai_generator.metrics())
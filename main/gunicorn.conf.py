@@ -0,0 +1,28 @@
+# Gunicorn settings: gunicorn -c gunicorn.conf.py
+#
+# The app is loaded once in the master and the text generation model is
+# loaded there too, before workers are forked, so all workers share one copy
+# of the weights copy-on-write instead of loading N copies.
+
+wsgi_app = 'main.wsgi:application'
+preload_app = True
+workers = 4
+# Threads let one worker hold several chat requests at once, which the
+# generator's request batching needs to form batches
+worker_class = 'gthread'
+threads = 8
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before workers fork.
+    # Only load weights here; running inference in the master would start
+    # torch's thread pools, which are not safe to carry across fork().
+    from generator.ai_service import ai_generator
+    ai_generator.share_with_workers()
+
+
+def post_fork(server, worker):
+    # Runs in each worker right after the fork: set torch's threads and warm
+    # the model up here, before the worker takes its first request
+    from generator.ai_service import ai_generator
+    ai_generator.load()
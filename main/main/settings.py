@@ -78,6 +78,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Run on every new connection: WAL lets readers carry on while a
+            # write is in progress, and NORMAL is crash-safe under WAL
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            # Seconds to wait for the write lock before "database is locked"
+            'timeout': 20,
+            # Take the write lock when a transaction begins, so a transaction
+            # never fails trying to upgrade a read lock midway
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -153,4 +163,94 @@ ALLOWED_UPLOAD_EXTENSIONS = [
 # Maximum file size (50MB)
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+# Converter working files (uploads, jobs, cached results). Kept out of
+# MEDIA_ROOT, which is publicly served
+CONVERTER_PRIVATE_ROOT = os.path.join(BASE_DIR, 'private')
+
+# Background conversion jobs (ConverterView with mode=async)
+CONVERTER_JOB_DIR = os.path.join(CONVERTER_PRIVATE_ROOT, 'jobs')
+CONVERTER_JOB_WORKERS = 2          # worker processes per web process
+CONVERTER_JOB_MAX_QUEUED = 16      # queued + running jobs before rejecting
+CONVERTER_JOB_TIMEOUT = 300        # seconds a single conversion may run
+CONVERTER_JOB_RETENTION = 60 * 60  # seconds finished jobs are kept on disk
+
+# How converted files are downloaded: 'stream' sends them from Django in
+# blocks; 'x-accel-redirect' (nginx) and 'x-sendfile' (Apache, lighttpd)
+# hand files that outlive the request to the fronting proxy. For nginx,
+# CONVERTER_ACCEL_REDIRECT_PREFIX is an internal location aliased to
+# CONVERTER_PRIVATE_ROOT
+CONVERTER_DOWNLOAD_MODE = 'stream'
+CONVERTER_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Content-addressed cache of conversion results
+CONVERTER_CACHE_DIR = os.path.join(CONVERTER_PRIVATE_ROOT, 'cache')
+CONVERTER_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1GB, 0 disables the cache
+
+# CSV files and Excel sheets longer than this many rows are converted in
+# row batches
+CONVERTER_CSV_CHUNK_ROWS = 50000
+
+# Excel reader: 'auto' (python-calamine if installed, else openpyxl),
+# 'calamine', 'openpyxl', or 'pandas' to load whole sheets with
+# pd.read_excel (see djg/excel.py)
+CONVERTER_EXCEL_ENGINE = 'auto'
+
+# Uploads up to this size are converted entirely in memory; larger ones are
+# spooled to FILE_UPLOAD_TEMP_DIR and converted on disk. 0 always uses disk
+CONVERTER_IN_MEMORY_MAX_BYTES = 1024 * 1024  # 1MB
+
+# PDF text extraction: PDFs with at least this many pages are split
+# across CONVERTER_PDF_WORKERS processes
+CONVERTER_PDF_WORKERS = 4
+CONVERTER_PDF_PARALLEL_MIN_PAGES = 16
+
+# Conversion libraries are imported on first use. Formats listed here have
+# their backends imported at startup instead (see djg/backends.py)
+CONVERTER_PRELOAD_FORMATS = []
+
+# Passport sheets are drawn on recycled buffers; this many idle buffers are
+# kept per paper size (see djg/layout.py)
+PASSPORT_SHEET_POOL_SIZE = 2
+
+# Batch passport sheets (photocollage/batch/) are rendered on a 'thread' or
+# 'process' pool of PASSPORT_BATCH_WORKERS workers. OpenCV releases the GIL,
+# so threads scale without pickling images between processes
+PASSPORT_BATCH_EXECUTOR = 'thread'
+PASSPORT_BATCH_WORKERS = 4
+PASSPORT_BATCH_MAX_PHOTOS = 100
+PASSPORT_BATCH_MAX_BYTES = 200 * 1024 * 1024  # photos in total, after unzipping
+
+# Text generation: concurrent prompts are collected for up to
+# AI_BATCH_MAX_WAIT_MS and run through the model as one batch
+AI_BATCH_MAX_SIZE = 8
+AI_BATCH_MAX_WAIT_MS = 10
+
+# Give chat turns their session's history as context, reusing a per-session
+# attention key/value cache across turns. Such turns run one at a time, so
+# this is off by default and chat turns are batched like other prompts.
+# The cache evicts least recently used sessions when either limit is exceeded
+AI_SESSION_CONTEXT = False
+AI_KV_CACHE_MAX_SESSIONS = 32
+AI_KV_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+# How the text generation model runs on CPU: 'eager', 'int8' (dynamic
+# quantization of the linear layers) or 'compile' (torch.compile); falls
+# back to 'eager' if the chosen backend can't be used on this host
+AI_INFERENCE_BACKEND = 'eager'
+AI_TORCH_THREADS = None  # intra-op threads, None keeps torch's default
+
+# Sampling makes replies vary; with AI_DO_SAMPLE = False decoding is greedy
+# and identical requests are answered from a response cache
+AI_DO_SAMPLE = True
+AI_RESPONSE_CACHE_MAX_ENTRIES = 1024
+AI_RESPONSE_CACHE_TTL = 3600  # seconds
+
+# Most chat messages given to the model as context for a new turn
+AI_HISTORY_MAX_MESSAGES = 20
+
+# Chat sessions idle this long are compacted into ChatArchive rows by the
+# archive_chats command and restored when opened again
+CHAT_ARCHIVE_AFTER_DAYS = 30
+CHAT_ARCHIVE_INTERVAL = 3600  # seconds between runs of archive_chats --loop